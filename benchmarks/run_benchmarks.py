@@ -0,0 +1,226 @@
+#! /usr/bin/env python3
+"""Benchmark the operations.py hot paths against synthetic cakeday databases
+
+Example:
+    python benchmarks/run_benchmarks.py --sizes 1000 100000 --output bench.json
+    python benchmarks/run_benchmarks.py --sizes 1000 100000 --compare bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'src', 'cakeday'))
+
+import bulk
+import notifications
+import operations
+import upcoming
+
+
+SCHEMA = os.path.join(ROOT, 'src', 'database', 'create_cakeday_db.sql')
+DEFAULT_SIZES = [1000, 10000, 100000]
+INSERT_CHUNK = 50000
+# Operations that read the whole table get fewer repeats on large databases
+FULL_SCAN_BUDGET = 2000000
+
+
+def synthetic_rows(count, seed=0):
+    """Yield deterministic (name, birthday, notification, adv_days) rows"""
+    rng = random.Random(seed)
+    for i in range(count):
+        month = rng.randint(1, 12)
+        day = rng.randint(1, 29 if month == 2 else 30 if month in (4, 6, 9, 11) else 31)
+        notify = rng.random() < 0.5
+        adv_days = rng.randint(0, 30) if notify else 0
+        yield (f"Person {i:08d}", f"{month:02d}-{day:02d}", 'y' if notify else 'n', adv_days)
+
+
+def build_database(path, size, seed=0):
+    """Create a cakeday database at path holding size synthetic rows"""
+    conn = sqlite3.connect(path)
+    with open(SCHEMA) as f:
+        conn.executescript(f.read())
+    rows = synthetic_rows(size, seed)
+    while True:
+        chunk = [row for _, row in zip(range(INSERT_CHUNK), rows)]
+        if not chunk:
+            break
+        conn.executemany(operations.INSERT_SQL, chunk)
+        conn.commit()
+    conn.close()
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def measure(func, args_list):
+    """Run func(*args_list[0]) under tracemalloc for peak memory, then time func(*args) for the rest
+
+    Every call gets its own args, so write benchmarks trace the same path they time instead of
+    repeating the first write.
+    """
+    tracemalloc.start()
+    try:
+        func(*args_list[0])
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    timings = []
+    for args in args_list[1:]:
+        started = time.perf_counter_ns()
+        func(*args)
+        timings.append((time.perf_counter_ns() - started) / 1e6)
+
+    timings.sort()
+    return {
+        'calls': len(timings),
+        'mean_ms': statistics.fmean(timings),
+        'p50_ms': percentile(timings, 0.50),
+        'p90_ms': percentile(timings, 0.90),
+        'p99_ms': percentile(timings, 0.99),
+        'max_ms': timings[-1],
+        'peak_kib': peak / 1024,
+    }
+
+
+def benchmark_size(size, repeat, workdir, seed=0):
+    """Run every benchmark against a fresh database of size rows; return result dicts"""
+    db_path = os.path.join(workdir, f'cakeday_{size}.db')
+    started = time.perf_counter()
+    build_database(db_path, size, seed)
+    print(f"Built {size:,} rows in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+    operations.configure_pool(db_path)
+    # One call more than is timed: measure() spends the first on tracemalloc
+    calls = repeat + 1
+    scan_calls = max(1, min(repeat, FULL_SCAN_BUDGET // max(size, 1))) + 1
+    batch_calls = max(1, repeat // 10) + 1
+    rng = random.Random(seed)
+    names = [f"Person {rng.randrange(size):08d}" for _ in range(calls)]
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    new_rows = [(f"New {i:08d}", '07-15', 'y', 7) for i in range(calls)]
+    batch = [(f"Batch {i:08d}", '03-03', 'n', 0) for i in range(1000)]
+
+    # A file per call with its own names, so every import inserts rather than matching the last one
+    import_paths = [os.path.join(workdir, f'import_{size}_{i}.csv') for i in range(batch_calls)]
+    for i, import_path in enumerate(import_paths):
+        with open(import_path, 'w') as f:
+            f.write('name,birthday,notification,adv_days\n')
+            for name, birthday, notification, adv_days in synthetic_rows(min(size, 10000), seed + 1):
+                f.write(f"Import {i} {name},{birthday},{notification},{adv_days}\n")
+    export_path = os.path.join(workdir, f'export_{size}.jsonl')
+    engine = upcoming.UpcomingEngine.load()
+
+    cases = [
+        ('get_all', operations.get_all, [()] * scan_calls),
+        ('iter_all', lambda: sum(1 for _ in operations.iter_all()), [()] * scan_calls),
+        ('get_page', operations.get_page, [(name,) for name in names]),
+        ('get_by_name', operations.get_by_name, [(name,) for name in names]),
+        ('search_names', operations.search_names, [(name[:-2],) for name in names]),
+        ('get_upcoming_birthdays_30', operations.get_upcoming_birthdays, [(30,)] * calls),
+        ('get_upcoming_birthdays_365', operations.get_upcoming_birthdays, [(365,)] * scan_calls),
+        ('upcoming_engine_load', upcoming.UpcomingEngine.load, [()] * scan_calls),
+        ('upcoming_engine_30', engine.upcoming, [(30, today)] * calls),
+        ('upcoming_engine_365_top10', engine.upcoming, [(365, today, 10)] * calls),
+        ('get_due_notifications', notifications.get_due_notifications, [(today,)] * calls),
+        ('add_birthdays_single', operations.add_birthdays, [(row,) for row in new_rows]),
+        ('update_birthdays_single', operations.update_birthdays,
+         [({'name': name, 'birthday': '08-08'},) for name in names]),
+        ('delete_birthdays_single', operations.delete_birthdays, [(row[0],) for row in new_rows]),
+        ('add_birthdays_batch_1000', lambda: (operations.add_birthdays(batch),
+                                              operations.delete_birthdays([row[0] for row in batch])),
+         [()] * batch_calls),
+        ('bulk_import', bulk.import_records, [(import_path,) for import_path in import_paths]),
+        ('bulk_export', bulk.export_records, [(export_path,)] * scan_calls),
+    ]
+
+    results = []
+    for operation, func, args_list in cases:
+        result = {'size': size, 'operation': operation, **measure(func, args_list)}
+        print(f"{size:>10,} {operation:<28} p50 {result['p50_ms']:9.3f} ms  "
+              f"p99 {result['p99_ms']:9.3f} ms  peak {result['peak_kib']:10.1f} KiB", file=sys.stderr)
+        results.append(result)
+
+    operations.close_pool()
+    for path in (db_path, *import_paths, export_path):
+        if os.path.exists(path):
+            os.unlink(path)
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, threshold):
+    """Return (size, operation, old p50, new p50) for every p50 that slowed by more than threshold"""
+    previous = {(r['size'], r['operation']): r for r in baseline['results']}
+    regressions = []
+    for result in results:
+        old = previous.get((result['size'], result['operation']))
+        if old and old['p50_ms'] > 0 and result['p50_ms'] > old['p50_ms'] * (1 + threshold):
+            regressions.append((result['size'], result['operation'], old['p50_ms'], result['p50_ms']))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help='table sizes to benchmark (e.g. 1000 10000000)')
+    parser.add_argument('--repeat', type=int, default=200, help='calls per point-lookup/write benchmark')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workdir', help='directory for the generated databases (default: a temp dir)')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--compare', help='JSON results from an earlier run to check for regressions')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='fractional p50 slowdown reported as a regression (default 0.2)')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(dir=args.workdir) as workdir:
+        results = [result for size in args.sizes for result in benchmark_size(size, args.repeat, workdir, args.seed)]
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'repeat': args.repeat,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for size, operation, old, new in regressions:
+            print(f"REGRESSION {operation} at {size:,} rows: p50 {old:.3f} ms -> {new:.3f} ms", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,192 @@
+import asyncio
+import concurrent.futures
+import smtplib
+import threading
+from collections import defaultdict
+
+from notifications import (
+    ADVANCE,
+    DispatchResult,
+    SMTPConnectionPool,
+    claim_notifications,
+    dispatch_window,
+    finish_dispatch,
+    iter_due_batches,
+    mark_sent,
+    release_claims,
+    render_message,
+    settings_from_env,
+)
+
+
+_DONE = object()
+# Seconds between checks for a stop request while the producer waits on a full queue
+STOP_POLL = 0.1
+
+
+class TokenBucket:
+    """Async token-bucket rate limiter allowing `rate` acquisitions per second, bursting to `capacity`"""
+
+    def __init__(self, rate, capacity=None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = None
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Wait until a token is available and take it"""
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            while True:
+                now = loop.time()
+                if self._updated is not None:
+                    self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class HostLimiter:
+    """Per-host concurrency limit: at most `limit` sends in flight to any one SMTP host"""
+
+    def __init__(self, limit):
+        self._semaphores = defaultdict(lambda: asyncio.Semaphore(limit))
+
+    def __call__(self, host):
+        return self._semaphores[host]
+
+
+def _put(loop, queue, item, stop):
+    """Put item on queue from the producer thread, giving up once stop is set"""
+    future = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+    while True:
+        try:
+            return future.result(timeout=STOP_POLL)
+        except concurrent.futures.TimeoutError:
+            if stop.is_set():
+                future.cancel()
+                return
+
+
+def _produce(loop, queue, start, end, kind, batch_size, claimed, stop):
+    """Read due notices a page at a time, claim them and feed the queue (runs in its own thread)
+
+    iter_due_batches closes its read before each page is handed over, so
+    claiming a page never runs inside a read snapshot that another run's
+    commit would invalidate. Blocking on the queue's put applies
+    back-pressure to the scan when senders fall behind. Every claimed
+    notice is appended to claimed; once stop is set the scan ends without
+    claiming more.
+    """
+    pages = iter_due_batches(start, end, batch_size)
+    scanned = 0
+    try:
+        for batch in pages:
+            if stop.is_set():
+                break
+            scanned += len(batch)
+            notices = claim_notifications(batch, kind)
+            claimed.extend(notices)
+            for notice in notices:
+                if stop.is_set():
+                    break
+                _put(loop, queue, notice, stop)
+    finally:
+        pages.close()
+    return scanned
+
+
+def _settle_aborted(claimed, taken, sent, failed, kind=ADVANCE):
+    """Settle the ledger for a run that stopped early, leaving the watermark alone
+
+    Delivered notices are marked sent, and failed ones and those no sender
+    reached are released. A notice whose send was cut short may have gone
+    out, so it keeps its claim until CLAIM_LEASE expires.
+    """
+    mark_sent(sent, kind)
+    taken_ids = {id(notice) for notice in taken}
+    release_claims([notice for notice in claimed if id(notice) not in taken_ids] +
+                   [notice for notice, _ in failed], kind)
+
+
+async def async_dispatch(on_date=None, settings=None, concurrency=32, per_host=8, rate=50.0,
+                         burst=None, queue_size=1000, batch_size=1000, kind=ADVANCE,
+                         smtp_factory=smtplib.SMTP):
+    """Send due reminders from an asyncio pipeline with back-pressure and rate limiting
+
+    A producer thread streams and claims due notices into a bounded queue.
+    `concurrency` sender tasks drain it, each send waiting for a token from a
+    `rate`-per-second bucket and a per-host slot before going out over a
+    shared SMTPConnectionPool. The ledger and watermark behave as in
+    notifications.dispatch().
+    """
+    settings = settings or settings_from_env()
+    watermark, start, end = dispatch_window(on_date, kind)
+
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=queue_size)
+    bucket = TokenBucket(rate, burst)
+    host_limit = HostLimiter(per_host)
+    pool = SMTPConnectionPool(settings, size=per_host, smtp_factory=smtp_factory)
+    claimed, taken, sent, failed = [], [], [], []
+    stop = threading.Event()
+
+    async def sender():
+        while True:
+            notice = await queue.get()
+            try:
+                if notice is _DONE:
+                    return
+                taken.append(notice)
+                try:
+                    message = render_message(notice, settings)
+                    await bucket.acquire()
+                    async with host_limit(settings.host):
+                        await asyncio.to_thread(pool.send, message)
+                except Exception as e:
+                    failed.append((notice, e))
+                else:
+                    sent.append(notice)
+            finally:
+                queue.task_done()
+
+    senders = [asyncio.create_task(sender()) for _ in range(concurrency)]
+    producer = asyncio.ensure_future(
+        asyncio.to_thread(_produce, loop, queue, start, end, kind, batch_size, claimed, stop))
+    completed = False
+    try:
+        # Senders only return on _DONE, so one finishing before the scan ends has raised
+        await asyncio.wait([producer, *senders], return_when=asyncio.FIRST_COMPLETED)
+        for task in senders:
+            if task.done():
+                task.result()
+        scanned = producer.result()
+        for _ in senders:
+            await queue.put(_DONE)
+        await asyncio.gather(*senders)
+        completed = True
+    finally:
+        if not completed:
+            stop.set()
+            for task in senders:
+                task.cancel()
+            await asyncio.wait([producer, *senders])
+        await asyncio.to_thread(pool.close)
+        if not completed:
+            # The producer or a sender raised, or the run was cancelled: keep what was delivered
+            await asyncio.to_thread(_settle_aborted, claimed, taken, sent, failed, kind)
+
+    failed_notices = [notice for notice, _ in failed]
+    await asyncio.to_thread(finish_dispatch, claimed, failed_notices, watermark, end, kind)
+    return DispatchResult(len(sent), [(notice.name, error) for notice, error in failed],
+                          scanned - len(claimed))
+
+
+def run_async_dispatch(**options):
+    """Run async_dispatch to completion from synchronous code"""
+    return asyncio.run(async_dispatch(**options))
@@ -0,0 +1,157 @@
+import csv
+import json
+import time
+from collections import namedtuple
+from itertools import islice
+
+from instrumentation import instrumented
+from operations import RECORD_COLUMNS, RECORD_FIELDS, get_db_connection, invalidate_cache, normalize_record
+from pool import retry_on_busy
+
+
+FORMATS = ('csv', 'jsonl')
+# Columns a CSV header must have; notification and adv_days default when left out
+REQUIRED_COLUMNS = ('name', 'birthday')
+MAX_REPORTED_ERRORS = 100
+
+UPSERT_SQL = '''
+    INSERT INTO cakeday (name, birthday, notification, adv_days)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT(name) DO UPDATE SET
+        birthday = excluded.birthday,
+        notification = excluded.notification,
+        adv_days = excluded.adv_days
+    WHERE cakeday.birthday IS NOT excluded.birthday
+        OR cakeday.notification IS NOT excluded.notification
+        OR cakeday.adv_days IS NOT excluded.adv_days
+'''
+
+
+class ImportResult(namedtuple('ImportResult', ['imported', 'rejected', 'errors', 'seconds'])):
+    """Outcome of a bulk import; errors holds up to MAX_REPORTED_ERRORS (line, message) pairs"""
+
+    @property
+    def rows_per_second(self):
+        return self.imported / self.seconds if self.seconds else float(self.imported)
+
+
+def detect_format(path):
+    """Guess csv/jsonl from a file name"""
+    lowered = str(path).lower()
+    if lowered.endswith('.csv'):
+        return 'csv'
+    if lowered.endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    raise ValueError(f"Cannot tell the format of {path}; expected one of {', '.join(FORMATS)}")
+
+
+def read_records(source, fmt, on_error=None):
+    """Yield (line number, dict) pairs from an open CSV or JSONL file
+
+    A CSV header without REQUIRED_COLUMNS raises ValueError before any row
+    is read. A JSONL line that is not valid JSON raises ValueError, or is
+    skipped after calling on_error(line number, message) when on_error is
+    given.
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(source)
+        missing = [column for column in REQUIRED_COLUMNS if column not in (reader.fieldnames or ())]
+        if missing:
+            raise ValueError(f"CSV header must name the {', '.join(missing)} column(s); "
+                             f"found {', '.join(reader.fieldnames or ()) or 'no header'}")
+        for record in reader:
+            yield reader.line_num, record
+    elif fmt == 'jsonl':
+        for line_num, line in enumerate(source, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                if on_error is None:
+                    raise
+                on_error(line_num, f"Invalid JSON: {e}")
+                continue
+            yield line_num, record
+    else:
+        raise ValueError(f"Unsupported format {fmt!r}; expected one of {', '.join(FORMATS)}")
+
+
+@retry_on_busy()
+def _write_batch(conn, batch):
+    """Upsert one batch in its own transaction"""
+    try:
+        conn.executemany(UPSERT_SQL, batch)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+@instrumented(rows=lambda result: result.imported)
+def import_records(path, fmt=None, batch_size=50000):
+    """Stream records from a CSV/JSONL file into cakeday, upserting on name
+
+    Each batch of batch_size valid rows is written with executemany inside
+    one transaction. Invalid rows are skipped and reported in the result.
+    """
+    fmt = fmt or detect_format(path)
+    imported = rejected = 0
+    errors = []
+    started = time.perf_counter()
+
+    def reject(line_num, message):
+        nonlocal rejected
+        rejected += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append((line_num, message))
+
+    def valid_rows(records):
+        for line_num, record in records:
+            try:
+                yield normalize_record(record)
+            except (ValueError, TypeError) as e:
+                reject(line_num, str(e))
+
+    # utf-8-sig drops the byte-order mark Excel writes, which would otherwise stick to the first column's name
+    with open(path, newline='', encoding='utf-8-sig') as source, get_db_connection() as conn:
+        rows = valid_rows(read_records(source, fmt, on_error=reject))
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            try:
+                _write_batch(conn, batch)
+            finally:
+                invalidate_cache()
+            imported += len(batch)
+
+    return ImportResult(imported, rejected, errors, time.perf_counter() - started)
+
+
+@instrumented(rows=lambda exported: exported)
+def export_records(path, fmt=None, batch_size=5000):
+    """Stream every record to a CSV/JSONL file ordered by name; return the row count"""
+    fmt = fmt or detect_format(path)
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported format {fmt!r}; expected one of {', '.join(FORMATS)}")
+
+    exported = 0
+    with open(path, 'w', newline='', encoding='utf-8') as target, get_db_connection() as conn:
+        if fmt == 'csv':
+            writer = csv.writer(target)
+            writer.writerow(RECORD_FIELDS)
+
+        c = conn.cursor()
+        c.execute(f'SELECT {RECORD_COLUMNS} FROM cakeday ORDER BY name')
+        while True:
+            rows = c.fetchmany(batch_size)
+            if not rows:
+                break
+            if fmt == 'csv':
+                writer.writerows(rows)
+            else:
+                target.writelines(json.dumps(dict(zip(RECORD_FIELDS, row))) + '\n' for row in rows)
+            exported += len(rows)
+
+    return exported
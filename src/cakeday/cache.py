@@ -0,0 +1,90 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+MISSING = object()
+
+
+class RecordCache:
+    """A bounded LRU cache of query results with a per-entry TTL
+
+    Writes made through operations.py invalidate entries explicitly and
+    report the range of the database's write counter they covered. Writes
+    from other processes are caught by check_version(), which compares the
+    counter with the value the entries were filled at and clears the cache
+    when it moved some other way.
+    """
+
+    def __init__(self, maxsize=1024, ttl=60.0, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.generation = 0
+        self._entries = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached value for key, or MISSING"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, value = entry
+                if expires > self.clock():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return MISSING
+
+    def put(self, key, value, generation):
+        """Cache value unless the cache was invalidated since generation was read"""
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._entries[key] = (self.clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, keys=None, versions=None):
+        """Drop the given keys, or everything when keys is None
+
+        versions is the (before, after) write counter of the transaction
+        that wrote keys; if the cache was current at before, it moves to
+        after instead of being cleared by the next check_version().
+        """
+        with self._lock:
+            self.generation += 1
+            if keys is None:
+                self._entries.clear()
+            else:
+                for key in keys:
+                    self._entries.pop(key, None)
+                if versions is not None and versions[0] == self._version:
+                    self._version = versions[1]
+
+    def check_version(self, version):
+        """Clear the cache unless its entries were filled at write counter version"""
+        with self._lock:
+            if version == self._version:
+                return
+            self._version = version
+            self.generation += 1
+            self._entries.clear()
+
+    def stats(self):
+        """Return hit/miss counters and current size"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+            }
@@ -1,5 +1,17 @@
 #! /usr/bin/env python3
-from operations import create, delete, update, get_all, get_by_name, get_upcoming_birthdays
+import argparse
+import sys
+
+from instrumentation import profile_session
+from operations import (RECORD_FIELDS, UPCOMING_FIELDS, create, delete, update, add_birthdays, apply_settings,
+                        close_pool, current_tenant, enable_cache, enable_upcoming_cache, get_by_name,
+                        get_db_connection, get_page, get_upcoming_birthdays, get_upcoming_birthdays_for_tenants,
+                        get_zone, invalidate_cache, iter_all, search_names, set_timezones, shard_path, use_tenant)
+from settings import load_settings
+
+
+PAGE_SIZE = 20
+DUE_FIELDS = ('name', 'birthday', 'adv_days', 'date', 'notice_date')
 
 
 def display_menu():
@@ -14,26 +26,47 @@ def display_menu():
     print("========================")
 
 
-def view_all_birthdays():
-    """Display all birthday records"""
-    records = get_all()
-    if not records:
+def view_all_birthdays(page_size=PAGE_SIZE):
+    """Display all birthday records one page at a time"""
+    # Fetch one extra row to know whether there is a next page
+    rows = get_page(page_size=page_size + 1)
+    if not rows:
         print("No birthday records found.")
         return
     
-    print("\nAll Birthday Records:")
-    print("-" * 60)
-    print(f"{'Name':<20} {'Birthday':<10} {'Notifications':<15} {'Advance Days':<12}")
-    print("-" * 60)
-    
-    for record in records:
-        name, birthday, notification, adv_days = record
-        print(f"{name:<20} {birthday:<10} {notification:<15} {adv_days:<12}")
-    print("-" * 60)
+    page, has_next = rows[:page_size], len(rows) > page_size
+    page_number = 1
+    while True:
+        print("\nAll Birthday Records:")
+        print("-" * 60)
+        print(f"{'Name':<20} {'Birthday':<10} {'Notifications':<15} {'Advance Days':<12}")
+        print("-" * 60)
+        
+        for record in page:
+            name, birthday, notification, adv_days = record
+            print(f"{name:<20} {birthday:<10} {notification:<15} {adv_days:<12}")
+        print("-" * 60)
+        
+        if not has_next and page_number == 1:
+            return
+        print(f"Page {page_number}")
+        
+        choice = input("[n]ext page, [p]revious page, [q]uit: ").strip().lower()
+        if choice == 'n' and has_next:
+            rows = get_page(after=page[-1][0], page_size=page_size + 1)
+            page, has_next = rows[:page_size], len(rows) > page_size
+            page_number += 1
+        elif choice == 'p' and page_number > 1:
+            page, has_next = get_page(before=page[0][0], page_size=page_size), True
+            page_number -= 1
+        elif choice == 'q':
+            return
+        else:
+            print("No such page.")
 
 
 def search_birthday():
-    """Search for a specific birthday record"""
+    """Search for a specific birthday record, suggesting close matches"""
     name = input("Enter name to search for: ").strip()
     if not name:
         print("Name cannot be empty")
@@ -47,8 +80,20 @@ def search_birthday():
         print(f"Birthday: {birthday}")
         print(f"Notifications: {notification}")
         print(f"Advance Days: {adv_days}")
-    else:
+        return
+    
+    matches = search_names(name)
+    if not matches:
         print(f"No record found for {name}")
+        return
+    
+    print(f"\nNo exact match for {name}. Closest matches:")
+    print("-" * 60)
+    print(f"{'Name':<20} {'Birthday':<10} {'Notifications':<15} {'Advance Days':<12}")
+    print("-" * 60)
+    for match_name, birthday, notification, adv_days in matches:
+        print(f"{match_name:<20} {birthday:<10} {notification:<15} {adv_days:<12}")
+    print("-" * 60)
 
 
 def show_upcoming_birthdays():
@@ -107,8 +152,326 @@ def main():
             print(f"An error occurred: {e}")
 
 
+def record_writer(fields, as_json):
+    """Return a function printing one row as a JSON object or tab-separated fields"""
+    if as_json:
+        import json
+        return lambda row: print(json.dumps(dict(zip(fields, row))))
+    return lambda row: print('\t'.join(map(str, row)))
+
+
+def parse_date(value):
+    """argparse type for YYYY-MM-DD dates"""
+    from datetime import datetime
+    try:
+        return datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid date {value!r}; expected YYYY-MM-DD") from None
+
+
+def upcoming_command(args):
+    """Print birthdays in the next args.days days, soonest first"""
+    enable_upcoming_cache()
+    if args.all_tenants:
+        write = record_writer(('tenant', *UPCOMING_FIELDS), args.json)
+        for tenant, name, birthday, days_until, birthday_date in get_upcoming_birthdays_for_tenants(args.days):
+            write((tenant, name, birthday, days_until, f"{birthday_date:%Y-%m-%d}"))
+        return 0
+
+    write = record_writer(UPCOMING_FIELDS, args.json)
+    for name, birthday, days_until, birthday_date in get_upcoming_birthdays(args.days):
+        write((name, birthday, days_until, f"{birthday_date:%Y-%m-%d}"))
+    return 0
+
+
+def get_command(args):
+    """Print one record; exit status 1 if it does not exist"""
+    record = get_by_name(args.name)
+    if record is None:
+        print(f"No record found for {args.name}", file=sys.stderr)
+        return 1
+    record_writer(RECORD_FIELDS, args.json)(record)
+    return 0
+
+
+def list_command(args):
+    """Print every record ordered by name"""
+    write = record_writer(RECORD_FIELDS, args.json)
+    for record in iter_all():
+        write(record)
+    return 0
+
+
+def add_command(args):
+    """Add one record; exit status 1 if it was rejected"""
+    if args.adv_days and not args.notify:
+        print("Error: --adv-days only applies with --notify", file=sys.stderr)
+        return 1
+    result = add_birthdays((args.name, args.birthday, 'y' if args.notify else 'n', args.adv_days))
+    for name, error in result.failed:
+        print(f"Error: {error}", file=sys.stderr)
+    return 1 if result.failed else 0
+
+
+def import_command(args):
+    """Bulk import a CSV/JSONL file and print a summary; exit status 1 if any row was rejected"""
+    from bulk import import_records
+    try:
+        result = import_records(args.path, args.format, args.batch_size)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    for line_num, error in result.errors:
+        print(f"line {line_num}: {error}", file=sys.stderr)
+    record_writer(('imported', 'rejected', 'seconds'), args.json)(
+        (result.imported, result.rejected, round(result.seconds, 3)))
+    return 1 if result.rejected else 0
+
+
+def notify_command(args):
+    """Send due email reminders (or list them with --dry-run); exit status 1 if any send failed"""
+    if args.dry_run:
+        from notifications import get_due_notifications
+        write = record_writer(DUE_FIELDS, args.json)
+        for notice in get_due_notifications(args.date):
+            write((notice.name, notice.birthday, notice.adv_days, f"{notice.birthday_date:%Y-%m-%d}",
+                   f"{notice.notice_date:%Y-%m-%d}"))
+        return 0
+
+    if args.use_async:
+        from async_notifications import run_async_dispatch
+        result = run_async_dispatch(on_date=args.date)
+    else:
+        from notifications import dispatch
+        result = dispatch(on_date=args.date)
+    for name, error in result.failed:
+        print(f"Error sending reminder for {name}: {error}", file=sys.stderr)
+    record_writer(('sent', 'failed', 'skipped'), args.json)((result.sent, len(result.failed), result.skipped))
+    return 1 if result.failed else 0
+
+
+def migrate_command(args):
+    """Upgrade the database schema in place (or print its version with --status); exit status 1 on failure"""
+    from migrations import MIGRATIONS, SCHEMA_VERSION, MigrationError, migrate, pending_migrations, schema_version
+    with get_db_connection() as conn:
+        if args.status:
+            record_writer(('version', 'latest', 'pending'), args.json)(
+                (schema_version(conn), SCHEMA_VERSION, len(pending_migrations(conn))))
+            return 0
+
+        def progress(version, copied):
+            print(f"migration {version}: {copied} records copied", file=sys.stderr)
+
+        try:
+            applied = migrate(conn, args.batch_size, progress)
+        except MigrationError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
+    invalidate_cache()
+    write = record_writer(('version', 'description'), args.json)
+    for migration in MIGRATIONS:
+        if migration.version in applied:
+            write((migration.version, migration.description))
+    return 0
+
+
+def parse_time(value):
+    """argparse type for HH:MM times of day"""
+    from datetime import datetime
+    try:
+        return datetime.strptime(value, '%H:%M').time()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid time {value!r}; expected HH:MM") from None
+
+
+def schedule_command(args):
+    """Print the next scheduled notices, or with --run send them as they fall due until interrupted"""
+    from datetime import datetime, timezone
+    import scheduler
+    try:
+        default_zone = get_zone(args.default_timezone)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    if args.run:
+        engine = scheduler.NotificationScheduler(send_time=args.send_time, default_zone=default_zone)
+        try:
+            engine.run()
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    scheduler.refresh_schedule(send_time=args.send_time, default_zone=default_zone)
+    write = record_writer(('notice_at', 'name', 'birthday_date', 'adv_days', 'timezone'), args.json)
+    for entry in scheduler.get_schedule(args.limit):
+        notice_at = datetime.fromtimestamp(entry.notice_at, timezone.utc)
+        write((f"{notice_at:%Y-%m-%dT%H:%M:%SZ}", entry.name, entry.birthday_date, entry.adv_days, entry.timezone))
+    return 0
+
+
+def timezone_command(args):
+    """Set (or with no zone, clear) the time zone a record's notices are sent in; exit status 1 if rejected"""
+    result = set_timezones((args.name, args.zone))
+    for name, error in result.failed:
+        print(f"Error: {error}", file=sys.stderr)
+    return 1 if result.failed else 0
+
+
+def changes_command(args):
+    """Print changes after --since as they are logged (--follow keeps polling); exit status 1 if the cursor expired"""
+    from changes import CHANGE_FIELDS, ChangeFeedError, iter_changes, latest_sequence, prune_changes
+    try:
+        if args.latest:
+            record_writer(('seq',), args.json)((latest_sequence(),))
+            return 0
+        if args.prune is not None:
+            record_writer(('pruned',), args.json)((prune_changes(args.prune),))
+            return 0
+        write = record_writer(CHANGE_FIELDS, args.json)
+        for change in iter_changes(args.since, args.batch_size, args.follow, args.interval):
+            write(change)
+            if args.follow:
+                sys.stdout.flush()
+    except ChangeFeedError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def serve_command(args):
+    """Run the HTTP/JSON service until interrupted"""
+    from server import make_server
+    server = make_server(args.host, args.port, tenant=current_tenant(), cache=not args.no_cache)
+    host, port = server.server_address[:2]
+    print(f"Serving on http://{host}:{port}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        close_pool()
+    return 0
+
+
+def tenant_name(value):
+    """argparse type for tenant names"""
+    try:
+        shard_path(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e)) from None
+    return value
+
+
+def build_parser():
+    """Build the command line parser; with no command the interactive menu runs"""
+    parser = argparse.ArgumentParser(description="Birthday Manager. Run without a command for the interactive menu.")
+    parser.add_argument('--profile', action='store_true',
+                        help="print cProfile, tracemalloc and per-call timing summaries on exit")
+    parser.add_argument('--tenant', type=tenant_name,
+                        help="work on this tenant's shard instead of the default database")
+    parser.add_argument('--database', metavar='PATH',
+                        help="database file to use (default: $CAKEDAY_DB, the config file, or the bundled database)")
+    parser.add_argument('--in-memory', action='store_true',
+                        help="load the database into memory and write it back periodically and on exit")
+    output = argparse.ArgumentParser(add_help=False)
+    output.add_argument('--json', action='store_true',
+                        help="print one JSON object per line instead of tab-separated fields")
+    commands = parser.add_subparsers(dest='command', metavar='command')
+
+    upcoming = commands.add_parser('upcoming', parents=[output], help="list birthdays in the next N days")
+    upcoming.add_argument('--days', type=int, default=30)
+    upcoming.add_argument('--all-tenants', action='store_true', help="merge upcoming birthdays from every tenant")
+    upcoming.set_defaults(handler=upcoming_command)
+
+    get = commands.add_parser('get', parents=[output], help="print one record")
+    get.add_argument('name')
+    get.set_defaults(handler=get_command)
+
+    listing = commands.add_parser('list', parents=[output], help="print every record")
+    listing.set_defaults(handler=list_command)
+
+    add = commands.add_parser('add', parents=[output], help="add a record")
+    add.add_argument('name')
+    add.add_argument('birthday', help="mm-dd")
+    add.add_argument('--notify', action='store_true', help="send email reminders for this birthday")
+    add.add_argument('--adv-days', type=int, default=0, help="days of advance notice (needs --notify)")
+    add.set_defaults(handler=add_command)
+
+    bulk_import = commands.add_parser('import', parents=[output], help="bulk import a CSV or JSONL file")
+    bulk_import.add_argument('path')
+    bulk_import.add_argument('--format', choices=('csv', 'jsonl'), help="default: from the file extension")
+    bulk_import.add_argument('--batch-size', type=int, default=50000)
+    bulk_import.set_defaults(handler=import_command)
+
+    notify = commands.add_parser('notify', parents=[output], help="send due email reminders")
+    notify.add_argument('--date', type=parse_date, help="run as of YYYY-MM-DD (default today)")
+    notify.add_argument('--dry-run', action='store_true', help="list due reminders without sending or recording them")
+    notify.add_argument('--async', dest='use_async', action='store_true', help="use the rate-limited asyncio sender")
+    notify.set_defaults(handler=notify_command)
+
+    migrate = commands.add_parser('migrate', parents=[output], help="upgrade the database schema in place")
+    migrate.add_argument('--status', action='store_true', help="print the schema version without migrating")
+    migrate.add_argument('--batch-size', type=int, default=5000, help="records copied per write transaction")
+    migrate.set_defaults(handler=migrate_command)
+
+    schedule = commands.add_parser('schedule', parents=[output], help="list or send advance notices on time")
+    schedule.add_argument('--run', action='store_true', help="send notices as they fall due until interrupted")
+    schedule.add_argument('--limit', type=int, default=20, help="notices to list (default 20)")
+    schedule.add_argument('--send-time', type=parse_time, default='09:00',
+                          help="local time of day notices are sent (default 09:00)")
+    schedule.add_argument('--default-timezone', metavar='ZONE',
+                          help="zone for records without one (default: this machine's local time)")
+    schedule.set_defaults(handler=schedule_command)
+
+    zone = commands.add_parser('timezone', help="set the time zone a record's notices are sent in")
+    zone.add_argument('name')
+    zone.add_argument('zone', nargs='?', help="IANA name such as Europe/Berlin; omit to use the default")
+    zone.set_defaults(handler=timezone_command)
+
+    changes = commands.add_parser('changes', parents=[output], help="print inserts, updates and deletes after a cursor")
+    changes.add_argument('--since', type=int, default=0, help="seq of the last change already applied (default 0)")
+    changes.add_argument('--follow', action='store_true', help="keep polling for new changes until interrupted")
+    changes.add_argument('--interval', type=float, default=1.0, help="seconds between polls with --follow")
+    changes.add_argument('--batch-size', type=int, default=1000, help="changes read per query")
+    changes.add_argument('--latest', action='store_true', help="print the newest seq instead of the changes")
+    changes.add_argument('--prune', type=int, metavar='SEQ', help="delete changes up to and including SEQ")
+    changes.set_defaults(handler=changes_command)
+
+    serve = commands.add_parser('serve', help="run the HTTP/JSON service")
+    serve.add_argument('--host', default='127.0.0.1', help="address to listen on (default 127.0.0.1)")
+    serve.add_argument('--port', type=int, default=8625, help="port to listen on (default 8625)")
+    serve.add_argument('--no-cache', action='store_true', help="read through to the database on every request")
+    serve.set_defaults(handler=serve_command)
+    return parser
+
+
+def cli(argv=None):
+    """Run the command given in argv, or the interactive menu; return the exit status"""
+    args = build_parser().parse_args(argv)
+    if args.command is None:
+        enable_cache()
+        enable_upcoming_cache()
+        run = main
+    else:
+        def run():
+            return args.handler(args)
+
+    if args.database or args.in_memory:
+        apply_settings(load_settings(database=args.database, in_memory=args.in_memory or None))
+    try:
+        with use_tenant(args.tenant):
+            status = profile_session(run) if args.profile else run()
+    finally:
+        if args.in_memory:
+            close_pool()
+    return status or 0
+
+
 if __name__ == '__main__':
-    main()
+    sys.exit(cli())
 
 
 
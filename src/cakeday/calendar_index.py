@@ -0,0 +1,169 @@
+import threading
+from calendar import isleap
+from collections import Counter
+from datetime import timedelta
+
+from memo import write_count
+
+
+INDEX_SQL = 'SELECT name, birthday, notify, adv_days, month_day FROM cakeday'
+# Names per refresh query, below SQLite's default variable limit
+REFRESH_CHUNK = 500
+
+
+def month_days_on(day):
+    """Return the mmdd values celebrated on day: Feb 29 birthdays fall on Feb 28 in non-leap years"""
+    month_day = day.month * 100 + day.day
+    if month_day == 228 and not isleap(day.year):
+        return (228, 229)
+    return (month_day,)
+
+
+class CalendarIndex:
+    """In-memory day-of-year buckets answering "whose birthday or notice falls on day D"
+
+    Birthdays are bucketed by mmdd and opted-in records also by
+    (mmdd, adv_days), so a notice opening on D is found in the bucket for
+    D + adv_days of each distinct adv_days. The index remembers the
+    cakeday_meta write counter it is current with. Writes made through
+    operations.py mark names for a refresh, applied with one query on the
+    next lookup, and account for the counter's movement; any other movement
+    (a write from another process or connection) triggers a full rebuild.
+    """
+
+    def __init__(self):
+        self.birthdays = {}
+        self.notices = {}
+        self.records = {}
+        self.adv_days = Counter()
+        self._stale = True
+        self._pending = set()
+        self._version = None
+        self._lock = threading.RLock()
+
+    def _add(self, name, birthday, notify, adv_days, month_day):
+        self.birthdays.setdefault(month_day, {})[name] = birthday
+        notify = notify and adv_days is not None and adv_days >= 0
+        if notify:
+            self.notices.setdefault((month_day, adv_days), set()).add(name)
+            self.adv_days[adv_days] += 1
+        self.records[name] = (month_day, adv_days if notify else None)
+
+    def _remove(self, name):
+        record = self.records.pop(name, None)
+        if record is None:
+            return
+        month_day, adv_days = record
+        bucket = self.birthdays[month_day]
+        del bucket[name]
+        if not bucket:
+            del self.birthdays[month_day]
+        if adv_days is not None:
+            bucket = self.notices[(month_day, adv_days)]
+            bucket.discard(name)
+            if not bucket:
+                del self.notices[(month_day, adv_days)]
+            self.adv_days[adv_days] -= 1
+            if not self.adv_days[adv_days]:
+                del self.adv_days[adv_days]
+
+    def put(self, name, birthday, notify, adv_days, month_day):
+        """Index one record, replacing any earlier entry for name"""
+        with self._lock:
+            self._remove(name)
+            if month_day:
+                self._add(name, birthday, notify, adv_days, month_day)
+
+    def remove(self, name):
+        """Drop name from the index"""
+        with self._lock:
+            self._remove(name)
+
+    def invalidate(self, names=None, versions=None):
+        """Mark names (or everything, when names is None) to be re-read before the next lookup
+
+        versions is the (before, after) write counter of the transaction
+        that wrote names. If the index was current at before, it moves to
+        after; otherwise the next sync rebuilds.
+        """
+        with self._lock:
+            if names is None:
+                self._stale = True
+                self._pending.clear()
+            elif not self._stale:
+                self._pending.update(names)
+                if versions is not None and versions[0] == self._version:
+                    self._version = versions[1]
+
+    def sync(self, conn):
+        """Bring the index up to date through conn
+
+        Returns False, leaving the index untouched, when the database
+        predates the write counter and other writers cannot be detected.
+        """
+        version = write_count(conn)
+        if version is None:
+            return False
+        with self._lock:
+            if version != self._version:
+                self._stale = True
+
+            if self._stale:
+                self.birthdays, self.notices, self.records = {}, {}, {}
+                self.adv_days = Counter()
+                for row in conn.execute(INDEX_SQL):
+                    if row[4]:
+                        self._add(*row)
+                self._version = version
+                self._stale = False
+                self._pending.clear()
+            elif self._pending:
+                names = list(self._pending)
+                self._pending.clear()
+                for i in range(0, len(names), REFRESH_CHUNK):
+                    chunk = names[i:i + REFRESH_CHUNK]
+                    placeholders = ', '.join('?' * len(chunk))
+                    found = conn.execute(f'{INDEX_SQL} WHERE name IN ({placeholders})', chunk).fetchall()
+                    for name in chunk:
+                        self._remove(name)
+                    for row in found:
+                        if row[4]:
+                            self._add(*row)
+        return True
+
+    def birthdays_on(self, day):
+        """Return sorted (name, birthday) pairs celebrated on day"""
+        with self._lock:
+            found = []
+            for month_day in month_days_on(day):
+                found.extend(self.birthdays.get(month_day, {}).items())
+        return sorted(found)
+
+    def notices_on(self, day):
+        """Return sorted (name, birthday, adv_days) for opted-in records whose notice opens on day"""
+        with self._lock:
+            found = []
+            for adv_days in self.adv_days:
+                for month_day in month_days_on(day + timedelta(days=adv_days)):
+                    bucket = self.birthdays.get(month_day, {})
+                    found.extend((name, bucket[name], adv_days)
+                                 for name in self.notices.get((month_day, adv_days), ()))
+        return sorted(found)
+
+    def upcoming(self, start, days_ahead):
+        """Return (name, birthday, days_until, birthday_date) for birthdays in start..start + days_ahead
+
+        Walks at most one year of day buckets, sorted by days_until then name.
+        """
+        upcoming = []
+        seen = set()
+        with self._lock:
+            for offset in range(min(days_ahead, 365) + 1):
+                day = start + timedelta(days=offset)
+                found = []
+                for month_day in month_days_on(day):
+                    if month_day not in seen:
+                        seen.add(month_day)
+                        found.extend(self.birthdays.get(month_day, {}).items())
+                upcoming.extend((name, birthday, offset, day) for name, birthday in sorted(found))
+        return upcoming
@@ -0,0 +1,106 @@
+import sqlite3
+import time
+from collections import namedtuple
+
+from instrumentation import instrumented
+from operations import get_db_connection
+from pool import retry_on_busy
+
+
+CHANGE_FIELDS = ('seq', 'op', 'name', 'birthday', 'notification', 'adv_days', 'changed_at')
+CHANGE_COLUMNS = ', '.join(CHANGE_FIELDS)
+DEFAULT_LIMIT = 1000
+DEFAULT_POLL_INTERVAL = 1.0
+
+# birthday, notification and adv_days are None for deletes
+Change = namedtuple('Change', CHANGE_FIELDS)
+
+
+class ChangeFeedError(Exception):
+    """Raised when changes cannot be read from a cursor, e.g. because they were pruned"""
+
+
+def _missing_feed(error):
+    if 'no such table' in str(error):
+        return ChangeFeedError("This database has no change feed; run `cakeday.py migrate` first")
+    return None
+
+
+def _pruned_through(conn):
+    row = conn.execute("SELECT value FROM cakeday_meta WHERE key = 'changes_pruned'").fetchone()
+    return row[0] if row else 0
+
+
+@instrumented()
+def get_changes(since=0, limit=DEFAULT_LIMIT):
+    """Return up to limit changes with a sequence number above since, oldest first
+
+    Pass the seq of the last change a consumer applied as since for the
+    next call; 0 reads from the start. Sequence numbers are assigned inside
+    the writing transaction and SQLite has one writer at a time, so a
+    change never becomes visible after one with a higher seq. Raises
+    ChangeFeedError if changes after since have already been pruned, in
+    which case the consumer must resynchronise from get_all().
+    """
+    with get_db_connection() as conn:
+        try:
+            rows = conn.execute(f'SELECT {CHANGE_COLUMNS} FROM cakeday_changes WHERE seq > ? ORDER BY seq LIMIT ?',
+                                (since, limit)).fetchall()
+            # Read after the rows: a prune in between can only cause a needless resync, never a silent gap
+            pruned = _pruned_through(conn)
+        except sqlite3.OperationalError as e:
+            raise _missing_feed(e) or e
+    if since < pruned:
+        raise ChangeFeedError(f"Changes after {since} were pruned (through {pruned}); resynchronise from get_all()")
+    return [Change(*row) for row in rows]
+
+
+def latest_sequence():
+    """Return the seq of the newest change, or 0 if there are none
+
+    A consumer starting from scratch reads this before copying the table
+    with get_all(), then follows get_changes from it. Changes that land in
+    between are replayed over rows that already include them, which is
+    harmless because every change carries the whole row.
+    """
+    with get_db_connection() as conn:
+        try:
+            row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'cakeday_changes'").fetchone()
+        except sqlite3.OperationalError as e:
+            raise _missing_feed(e) or e
+    return row[0] if row else 0
+
+
+def iter_changes(since=0, batch_size=DEFAULT_LIMIT, follow=False, poll_interval=DEFAULT_POLL_INTERVAL):
+    """Yield every change after since, batch_size at a time
+
+    With follow, keep polling every poll_interval seconds for new changes
+    instead of stopping at the end of the log.
+    """
+    while True:
+        changes = get_changes(since, batch_size)
+        yield from changes
+        if changes:
+            since = changes[-1].seq
+        if len(changes) < batch_size:
+            if not follow:
+                return
+            time.sleep(poll_interval)
+
+
+@retry_on_busy()
+def prune_changes(through):
+    """Delete changes with seq up to through and return how many were removed
+
+    Consumers whose cursor is below through get a ChangeFeedError on their
+    next read and must resynchronise.
+    """
+    with get_db_connection() as conn:
+        try:
+            with conn:
+                deleted = conn.execute('DELETE FROM cakeday_changes WHERE seq <= ?', (through,)).rowcount
+                conn.execute("UPDATE cakeday_meta SET value = max(value, ?) WHERE key = 'changes_pruned'",
+                             (through,))
+        except sqlite3.OperationalError as e:
+            raise _missing_feed(e) or e
+    return deleted
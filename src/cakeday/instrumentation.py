@@ -0,0 +1,234 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from records import BirthdayList
+
+# logging, tempfile and the profilers are imported where used so importing
+# this module (and with it operations.py) stays cheap for one-shot commands
+
+# Histogram bucket upper bounds in seconds (Prometheus style, +Inf implied)
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_sinks = []
+
+
+def add_sink(sink):
+    """Start sending call timings to sink (anything with record() and gauge() methods)"""
+    _sinks.append(sink)
+    return sink
+
+
+def remove_sink(sink):
+    """Stop sending call timings to sink"""
+    if sink in _sinks:
+        _sinks.remove(sink)
+
+
+def clear_sinks():
+    """Remove every sink, turning instrumentation off"""
+    _sinks.clear()
+
+
+def enabled():
+    """Return True if any sink is listening"""
+    return bool(_sinks)
+
+
+def record(name, seconds, rows=None):
+    """Report one timed call to every sink"""
+    for sink in _sinks:
+        sink.record(name, seconds, rows)
+
+
+def gauge(name, value):
+    """Report the current value of a counter-like quantity to every sink"""
+    for sink in _sinks:
+        sink.gauge(name, value)
+
+
+def _default_rows(result):
+    return len(result) if isinstance(result, (list, BirthdayList)) else None
+
+
+def instrumented(name=None, rows=_default_rows):
+    """Decorator timing each call of a function and reporting rows=rows(result)
+
+    With no sinks registered the wrapper only adds a list check per call.
+    """
+    def decorator(func):
+        label = name or func.__name__
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _sinks:
+                return func(*args, **kwargs)
+            started = time.perf_counter()
+            result = func(*args, **kwargs)
+            record(label, time.perf_counter() - started, rows(result))
+            return result
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def span(name):
+    """Time a block of code as its own entry, e.g. one phase of a query function"""
+    if not _sinks:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - started)
+
+
+class LoggingSink:
+    """Log every call at DEBUG (or the given level)"""
+
+    def __init__(self, level=None, log=None):
+        import logging
+        self.level = logging.DEBUG if level is None else level
+        self.log = log or logging.getLogger('cakeday.instrumentation')
+
+    def record(self, name, seconds, rows=None):
+        self.log.log(self.level, "%s took %.3f ms%s", name, seconds * 1000,
+                     '' if rows is None else f" ({rows} rows)")
+
+    def gauge(self, name, value):
+        self.log.log(self.level, "%s = %s", name, value)
+
+
+class HistogramSink:
+    """Keep per-name call counts, total time, rows and bucketed latencies in memory"""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.stats = {}
+        self.gauges = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds, rows=None):
+        with self._lock:
+            entry = self.stats.get(name)
+            if entry is None:
+                entry = self.stats[name] = {'count': 0, 'seconds': 0.0, 'rows': 0, 'max': 0.0,
+                                            'buckets': [0] * (len(self.buckets) + 1)}
+            entry['count'] += 1
+            entry['seconds'] += seconds
+            entry['rows'] += rows or 0
+            entry['max'] = max(entry['max'], seconds)
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    entry['buckets'][i] += 1
+                    break
+            else:
+                entry['buckets'][-1] += 1
+
+    def gauge(self, name, value):
+        with self._lock:
+            self.gauges[name] = value
+
+    def quantile(self, name, q):
+        """Approximate the q-quantile latency of name from its buckets (upper bound, seconds)"""
+        entry = self.stats[name]
+        target = max(1, math.ceil(q * entry['count']))
+        seen = 0
+        for bound, count in zip((*self.buckets, math.inf), entry['buckets']):
+            seen += count
+            if seen >= target:
+                return min(bound, entry['max'])
+        return entry['max']
+
+    def summary(self):
+        """Return a table of per-name statistics, slowest total first"""
+        lines = [f"{'call':<36} {'count':>8} {'total ms':>10} {'mean ms':>9} {'p50 ms':>8} "
+                 f"{'p99 ms':>8} {'rows':>9}"]
+        for name, entry in sorted(self.stats.items(), key=lambda item: -item[1]['seconds']):
+            lines.append(
+                f"{name:<36} {entry['count']:>8} {entry['seconds'] * 1000:>10.2f} "
+                f"{entry['seconds'] * 1000 / entry['count']:>9.3f} {self.quantile(name, 0.5) * 1000:>8.3f} "
+                f"{self.quantile(name, 0.99) * 1000:>8.3f} {entry['rows']:>9}"
+            )
+        for name, value in sorted(self.gauges.items()):
+            lines.append(f"{name} = {value}")
+        return '\n'.join(lines)
+
+
+class PrometheusTextfileSink(HistogramSink):
+    """Histogram sink that writes the Prometheus text format for node_exporter's textfile collector
+
+    Call write() (e.g. at exit or on a timer); the file is replaced atomically.
+    """
+
+    def __init__(self, path, prefix='cakeday', buckets=BUCKETS):
+        super().__init__(buckets)
+        self.path = path
+        self.prefix = prefix
+
+    def render(self):
+        with self._lock:
+            stats = {name: dict(entry, buckets=list(entry['buckets'])) for name, entry in self.stats.items()}
+            gauges = dict(self.gauges)
+
+        p = self.prefix
+        lines = [f"# HELP {p}_call_seconds Latency of instrumented cakeday calls.",
+                 f"# TYPE {p}_call_seconds histogram"]
+        for name, entry in sorted(stats.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), entry['buckets']):
+                cumulative += count
+                lines.append(f'{p}_call_seconds_bucket{{call="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'{p}_call_seconds_sum{{call="{name}"}} {entry["seconds"]}')
+            lines.append(f'{p}_call_seconds_count{{call="{name}"}} {entry["count"]}')
+        lines.append(f"# HELP {p}_call_rows_total Rows returned or written by instrumented calls.")
+        lines.append(f"# TYPE {p}_call_rows_total counter")
+        for name, entry in sorted(stats.items()):
+            lines.append(f'{p}_call_rows_total{{call="{name}"}} {entry["rows"]}')
+        for name, value in sorted(gauges.items()):
+            lines.append(f"# TYPE {p}_{name} gauge")
+            lines.append(f"{p}_{name} {value}")
+        return '\n'.join(lines) + '\n'
+
+    def write(self):
+        import os
+        import tempfile
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.cakeday-metrics-')
+        with os.fdopen(fd, 'w') as f:
+            f.write(self.render())
+        os.replace(tmp_path, self.path)
+
+
+def profile_session(func, *args, top=20, out=None, **kwargs):
+    """Run func under cProfile and tracemalloc with a HistogramSink attached, then print all three summaries"""
+    import cProfile
+    import io
+    import pstats
+    import sys
+    import tracemalloc
+
+    out = out or sys.stderr
+    sink = add_sink(HistogramSink())
+    profiler = cProfile.Profile()
+    tracemalloc.start()
+    try:
+        return profiler.runcall(func, *args, **kwargs)
+    finally:
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        remove_sink(sink)
+
+        stats = io.StringIO()
+        pstats.Stats(profiler, stream=stats).sort_stats('cumulative').print_stats(top)
+        print("\n=== cProfile (top by cumulative time) ===", file=out)
+        print(stats.getvalue().strip(), file=out)
+        print(f"\n=== tracemalloc (peak {peak / 1024:.1f} KiB, top allocations) ===", file=out)
+        for stat in snapshot.statistics('lineno')[:top]:
+            print(stat, file=out)
+        print("\n=== Instrumented calls ===", file=out)
+        print(sink.summary(), file=out)
@@ -0,0 +1,138 @@
+import os
+import sqlite3
+import threading
+from datetime import timedelta
+
+from cache import MISSING
+
+
+WRITE_COUNT_SQL = "SELECT value FROM cakeday_meta WHERE key = 'write_count'"
+SUFFIX = '-upcoming.json'
+# Results kept per database; each is one (date, days_ahead) pair
+MAX_ENTRIES = 64
+
+
+def write_count(conn):
+    """Return the database's trigger-maintained write counter, or None if its schema predates it"""
+    try:
+        row = conn.execute(WRITE_COUNT_SQL).fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return row[0] if row else None
+
+
+class UpcomingMemo:
+    """get_upcoming_birthdays results keyed by (date, days_ahead, write counter), shared through a file per database
+
+    Triggers bump cakeday_meta's write_count on every insert, update and
+    delete of cakeday, whichever process makes it, so an entry stays valid
+    exactly as long as the counter is unchanged. Unlike PRAGMA data_version,
+    the counter means the same thing on every connection. Entries for older
+    counter values are dropped. Hits are served from memory; results are
+    also written next to the database (or into directory) so that separate
+    CLI processes can reuse them.
+    """
+
+    def __init__(self, directory=None, max_entries=MAX_ENTRIES):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._databases = {}
+        self._lock = threading.Lock()
+
+    def path(self, database):
+        """Return the file results for database are shared through, or None for in-memory databases"""
+        if database == ':memory:' or database.startswith('file:'):
+            return None
+        if self.directory is None:
+            return database + SUFFIX
+        import hashlib
+        digest = hashlib.sha1(os.path.abspath(database).encode()).hexdigest()[:16]
+        return os.path.join(self.directory, digest + SUFFIX)
+
+    def get(self, database, version, start, days_ahead):
+        """Return the memoized rows for start and days_ahead at write counter version, or MISSING"""
+        key = f"{start:%Y-%m-%d}/{days_ahead}"
+        with self._lock:
+            known = self._databases.get(database)
+            if known is None or known[0] != version or key not in known[1]:
+                known = self._load(database, version, known)
+            rows = known[1].get(key, MISSING)
+            if rows is MISSING:
+                self.misses += 1
+                return MISSING
+            if rows and not isinstance(rows[0], tuple):
+                # Loaded from disk: rebuild birthday_date from days_until
+                rows = known[1][key] = [(name, birthday, days, start + timedelta(days=days))
+                                        for name, birthday, days in rows]
+            self.hits += 1
+            return rows
+
+    def put(self, database, version, start, days_ahead, rows):
+        """Remember rows for start and days_ahead at write counter version and share them on disk"""
+        key = f"{start:%Y-%m-%d}/{days_ahead}"
+        with self._lock:
+            known = self._databases.get(database)
+            if known is None or known[0] != version:
+                known = self._databases[database] = (version, {})
+            entries = known[1]
+            entries[key] = rows
+            while len(entries) > self.max_entries:
+                del entries[next(iter(entries))]
+            self._save(database, version, key, rows)
+
+    def _load(self, database, version, known):
+        """Merge entries another process saved for version into memory"""
+        entries = known[1] if known is not None and known[0] == version else {}
+        stored = self._read(database)
+        if stored is not None and stored.get('version') == version:
+            for key, rows in stored.get('entries', {}).items():
+                entries.setdefault(key, rows)
+        known = self._databases[database] = (version, entries)
+        return known
+
+    def _read(self, database):
+        path = self.path(database)
+        if path is None:
+            return None
+        import json
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save(self, database, version, key, rows):
+        path = self.path(database)
+        if path is None:
+            return
+        stored = self._read(database)
+        entries = stored['entries'] if stored is not None and stored.get('version') == version else {}
+        entries[key] = [[name, birthday, days] for name, birthday, days, _ in rows]
+        while len(entries) > self.max_entries:
+            del entries[next(iter(entries))]
+        import json
+        import tempfile
+        directory = os.path.dirname(os.path.abspath(path))
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.cakeday-upcoming-')
+        except OSError:
+            # Sharing is best effort: without a writable directory results stay in this process
+            return
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'version': version, 'entries': entries}, f)
+            os.replace(tmp_path, path)
+        except OSError:
+            os.unlink(tmp_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def stats(self):
+        """Return hit/miss counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / lookups if lookups else 0.0}
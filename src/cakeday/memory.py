@@ -0,0 +1,83 @@
+import itertools
+import os
+import sqlite3
+import threading
+
+
+_names = itertools.count()
+
+
+class MemoryDatabase:
+    """A shared-cache in-memory copy of an on-disk database, checkpointed back periodically
+
+    The file is copied into RAM with SQLite's backup API when the object is
+    created. Every connection opened on `uri` (e.g. by a ConnectionPool)
+    shares that copy. A background thread writes it back every
+    checkpoint_interval seconds if anything changed, and close() writes it
+    back one last time. Changes made since the last checkpoint are lost if
+    the process dies.
+    """
+
+    def __init__(self, path, checkpoint_interval=300.0):
+        self.path = path
+        self.checkpoint_interval = checkpoint_interval
+        self.uri = f"file:cakeday-memory-{os.getpid()}-{next(_names)}?mode=memory&cache=shared"
+        self.checkpoints = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        # The shared in-memory database lives as long as one connection to it is open
+        self._keeper = sqlite3.connect(self.uri, uri=True, check_same_thread=False)
+        if os.path.exists(path):
+            disk = sqlite3.connect(path)
+            try:
+                disk.backup(self._keeper)
+            finally:
+                disk.close()
+        self._version = self._data_version()
+        self._thread = None
+        if checkpoint_interval:
+            self._thread = threading.Thread(target=self._run, name='cakeday-checkpoint', daemon=True)
+            self._thread.start()
+
+    def _data_version(self):
+        return self._keeper.execute('PRAGMA data_version').fetchone()[0]
+
+    def checkpoint(self, force=False):
+        """Copy the in-memory database back to path if it changed (or force); return True if written"""
+        with self._lock:
+            if self._keeper is None:
+                return False
+            version = self._data_version()
+            if not force and version == self._version:
+                return False
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            disk = sqlite3.connect(self.path)
+            try:
+                self._keeper.backup(disk)
+            finally:
+                disk.close()
+            self._version = version
+            self.checkpoints += 1
+            return True
+
+    def _run(self):
+        while not self._stop.wait(self.checkpoint_interval):
+            try:
+                self.checkpoint()
+            except sqlite3.Error:
+                # Try again next interval; close() reports a final failure
+                pass
+
+    def close(self):
+        """Stop checkpointing, write the database back a final time and free it"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        try:
+            self.checkpoint()
+        finally:
+            with self._lock:
+                if self._keeper is not None:
+                    self._keeper.close()
+                    self._keeper = None
@@ -0,0 +1,352 @@
+import os
+import re
+import sqlite3
+from collections import namedtuple
+
+from pool import retry_on_busy
+
+
+DATABASE_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'database'))
+SCHEMA_VERSION = 5
+# Rows copied per write transaction while rebuilding a table
+DEFAULT_BATCH_SIZE = 5000
+
+Migration = namedtuple('Migration', ['version', 'description', 'apply'])
+
+
+class MigrationError(Exception):
+    """Raised when a migration cannot continue until the database is fixed"""
+
+
+SECTION_MARKER = '-- @section '
+
+
+def _read_sections(path):
+    """Split a schema file into {name: DDL} at its `-- @section name` lines"""
+    sections, name = {}, None
+    with open(path) as f:
+        for line in f:
+            if line.startswith(SECTION_MARKER):
+                name = line[len(SECTION_MARKER):].strip()
+                sections[name] = ''
+            elif name is not None:
+                sections[name] += line
+    return sections
+
+
+# create_cakeday_db.sql is the one copy of the current schema; migrations apply its sections
+SCHEMA_SECTIONS = _read_sections(os.path.join(DATABASE_DIR, 'create_cakeday_db.sql'))
+
+NOTIFICATION_TABLES_SQL = SCHEMA_SECTIONS['notification_tables']
+NAME_SEARCH_SQL = SCHEMA_SECTIONS['name_search']
+WRITE_COUNT_SQL = SCHEMA_SECTIONS['write_count']
+CHANGE_FEED_SQL = SCHEMA_SECTIONS['change_feed']
+SCHEDULE_SQL = SCHEMA_SECTIONS['schedule']
+# Version 2's cakeday table, built alongside the old one
+TYPED_TABLE_SQL = SCHEMA_SECTIONS['cakeday'].replace('CREATE TABLE IF NOT EXISTS cakeday (',
+                                                     'CREATE TABLE IF NOT EXISTS cakeday_v2 (')
+
+PROGRESS_TABLE_SQL = ('CREATE TABLE IF NOT EXISTS schema_migration_progress '
+                      '(version INTEGER PRIMARY KEY, last_rowid INTEGER NOT NULL)')
+
+# While version 1 fills a new name index batch by batch, its triggers only
+# touch rows the fill has reached: deleting a name the index never held
+# would corrupt it
+FILL_MARK = '(SELECT last_rowid FROM schema_migration_progress WHERE version = 1)'
+NAME_FILL_TRIGGERS_SQL = re.sub(
+    r'AFTER (INSERT|DELETE|UPDATE OF name) ON cakeday BEGIN',
+    lambda match: f"{match[0][:-len(' BEGIN')]} WHEN {'new' if match[1] == 'INSERT' else 'old'}.rowid <= {FILL_MARK} BEGIN",
+    NAME_SEARCH_SQL)
+NAME_SEARCH_TRIGGERS = ('cakeday_fts_insert', 'cakeday_fts_delete', 'cakeday_fts_update')
+FILL_NAMES_SQL = 'INSERT INTO cakeday_fts (rowid, name) SELECT rowid, name FROM cakeday WHERE rowid > ? AND rowid <= ?'
+
+COPY_COLUMNS = 'rowid, name, birthday, notification, adv_days'
+
+
+def _normalized(prefix=''):
+    """Return the SELECT list turning a legacy row (columns prefixed by prefix) into a version 2 row"""
+    return f'''{prefix}rowid, {prefix}name, trim({prefix}birthday),
+        lower(trim(coalesce({prefix}notification, 'n'))),
+        CASE WHEN lower(trim({prefix}notification)) IN ('y', 'yes') THEN coalesce({prefix}adv_days, 0) ELSE 0 END'''
+
+
+COPY_SQL = f'''
+INSERT INTO cakeday_v2 ({COPY_COLUMNS})
+SELECT {_normalized()} FROM cakeday WHERE rowid > ? AND rowid <= ?
+ON CONFLICT DO NOTHING
+'''
+
+# Keep rows already copied in step with writes made while the copy runs
+SYNC_TRIGGERS_SQL = f'''
+CREATE TRIGGER IF NOT EXISTS cakeday_v2_insert AFTER INSERT ON cakeday BEGIN
+    INSERT INTO cakeday_v2 ({COPY_COLUMNS}) SELECT {_normalized('new.')};
+END;
+
+CREATE TRIGGER IF NOT EXISTS cakeday_v2_delete AFTER DELETE ON cakeday BEGIN
+    DELETE FROM cakeday_v2 WHERE rowid = old.rowid;
+END;
+
+CREATE TRIGGER IF NOT EXISTS cakeday_v2_update AFTER UPDATE ON cakeday BEGIN
+    DELETE FROM cakeday_v2 WHERE rowid = old.rowid;
+    INSERT INTO cakeday_v2 ({COPY_COLUMNS}) SELECT {_normalized('new.')};
+END;
+'''
+
+SWAP_SQL = '''
+DROP TRIGGER cakeday_v2_insert;
+DROP TRIGGER cakeday_v2_delete;
+DROP TRIGGER cakeday_v2_update;
+DROP TABLE cakeday;
+ALTER TABLE cakeday_v2 RENAME TO cakeday;
+''' + SCHEMA_SECTIONS['cakeday_indexes'] + NAME_SEARCH_SQL
+
+
+def schema_version(conn):
+    """Return the database's PRAGMA user_version"""
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def has_table(conn, name):
+    """Return True if the database has a table (or virtual table) called name"""
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)).fetchone() is not None
+
+
+def _columns(conn, table):
+    return {row[1] for row in conn.execute(f'PRAGMA table_xinfo({table})')}
+
+
+def _run_script(conn, filename):
+    with open(os.path.join(DATABASE_DIR, filename)) as f:
+        conn.executescript(f.read())
+
+
+def _execute_statements(conn, script):
+    """Run the ;-separated statements of script inside the caller's transaction (executescript would commit)"""
+    statement = ''
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            conn.execute(statement)
+            statement = ''
+
+
+def _baseline(conn, batch_size, progress):
+    """Version 1: bring a pre-versioned database up to the last unversioned schema
+
+    month_day is added empty, as migration 2 rebuilds it as a column
+    SQLite computes from the birthday. A missing name index is filled batch_size rows per transaction
+    rather than rebuilt under one long write lock; progress is kept in
+    schema_migration_progress like the version 2 copy.
+    """
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        if 'month_day' not in _columns(conn, 'cakeday'):
+            conn.execute('ALTER TABLE cakeday ADD COLUMN month_day INTEGER')
+        conn.execute(PROGRESS_TABLE_SQL)
+        if not has_table(conn, 'cakeday_fts'):
+            conn.execute('INSERT INTO schema_migration_progress (version, last_rowid) VALUES (1, 0)')
+            _execute_statements(conn, NAME_FILL_TRIGGERS_SQL)
+        _execute_statements(conn, NOTIFICATION_TABLES_SQL)
+        conn.execute('COMMIT')
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+
+    row = conn.execute('SELECT last_rowid FROM schema_migration_progress WHERE version = 1').fetchone()
+    filling = row is not None
+    if filling:
+        last_rowid, filled = row[0], 0
+        while True:
+            last_rowid, count = _copy_batch(conn, 1, FILL_NAMES_SQL, last_rowid, batch_size)
+            if not count:
+                break
+            filled += count
+            if progress:
+                progress(1, filled)
+
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        if filling:
+            # Rows added after the last batch were skipped by the guarded triggers
+            conn.execute('INSERT INTO cakeday_fts (rowid, name) SELECT rowid, name FROM cakeday WHERE rowid > ?',
+                         (last_rowid,))
+            for trigger in NAME_SEARCH_TRIGGERS:
+                conn.execute(f'DROP TRIGGER {trigger}')
+        _execute_statements(conn, NAME_SEARCH_SQL)
+        conn.execute('DROP TABLE schema_migration_progress')
+        conn.execute('PRAGMA user_version = 1')
+        conn.execute('COMMIT')
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+
+
+@retry_on_busy()
+def _copy_batch(conn, version, copy_sql, last_rowid, batch_size):
+    """Run copy_sql over the next batch_size rows after last_rowid in one transaction
+
+    copy_sql takes the (exclusive, inclusive) rowid bounds of the batch.
+    Returns (new last rowid, rows in the batch) and records the new last
+    rowid as version's progress.
+    """
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        high, count = conn.execute(
+            'SELECT MAX(rowid), COUNT(*) FROM (SELECT rowid FROM cakeday WHERE rowid > ? ORDER BY rowid LIMIT ?)',
+            (last_rowid, batch_size)).fetchone()
+        if count:
+            conn.execute(copy_sql, (last_rowid, high))
+            conn.execute('UPDATE schema_migration_progress SET last_rowid = ? WHERE version = ?', (high, version))
+        conn.execute('COMMIT')
+    except sqlite3.Error:
+        conn.execute('ROLLBACK')
+        raise
+    return (high if count else last_rowid), count
+
+
+def _invalid_row(conn, last_rowid, batch_size):
+    """Return (name, error) for the first row of the batch after last_rowid that the version 2 table rejects"""
+    conn.execute('BEGIN')
+    try:
+        rows = conn.execute('SELECT rowid, name FROM cakeday WHERE rowid > ? ORDER BY rowid LIMIT ?',
+                            (last_rowid, batch_size)).fetchall()
+        for rowid, name in rows:
+            try:
+                conn.execute(COPY_SQL, (rowid - 1, rowid))
+            except sqlite3.IntegrityError as error:
+                return name, str(error)
+        return None, None
+    finally:
+        conn.execute('ROLLBACK')
+
+
+def _typed_columns(conn, batch_size, progress):
+    """Version 2: rebuild cakeday with integer month/day, a boolean notify and CHECK constraints
+
+    The new table is filled batch_size rows per transaction while triggers
+    mirror concurrent writes into the rows already copied, so writers are
+    only blocked for one batch at a time and for the final swap. Progress
+    is kept in schema_migration_progress; an interrupted run resumes where
+    it stopped.
+    """
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.execute(PROGRESS_TABLE_SQL)
+        conn.execute(TYPED_TABLE_SQL)
+        _execute_statements(conn, SYNC_TRIGGERS_SQL)
+        conn.execute('INSERT OR IGNORE INTO schema_migration_progress (version, last_rowid) VALUES (2, 0)')
+        conn.execute('COMMIT')
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+
+    last_rowid = conn.execute('SELECT last_rowid FROM schema_migration_progress WHERE version = 2').fetchone()[0]
+    copied = 0
+    while True:
+        try:
+            high, count = _copy_batch(conn, 2, COPY_SQL, last_rowid, batch_size)
+        except sqlite3.IntegrityError as error:
+            name, reason = _invalid_row(conn, last_rowid, batch_size)
+            raise MigrationError(f"Record {name!r} cannot be migrated ({reason or error}); "
+                                 "fix it and run the migration again") from error
+        if not count:
+            break
+        last_rowid = high
+        copied += count
+        if progress:
+            progress(2, copied)
+
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        # Rows added after the last batch were copied by the triggers
+        old, new = conn.execute('SELECT (SELECT COUNT(*) FROM cakeday), (SELECT COUNT(*) FROM cakeday_v2)').fetchone()
+        if old != new:
+            raise MigrationError(f"Copied {new} of {old} records; run the migration again")
+        _execute_statements(conn, SWAP_SQL)
+        conn.execute('DROP TABLE schema_migration_progress')
+        conn.execute('PRAGMA user_version = 2')
+        conn.execute('COMMIT')
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+
+
+def _write_count(conn, batch_size, progress):
+    """Version 3: a write counter bumped by triggers, shared by every connection and process"""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        _execute_statements(conn, WRITE_COUNT_SQL)
+        conn.execute('PRAGMA user_version = 3')
+        conn.execute('COMMIT')
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+
+
+def _change_feed(conn, batch_size, progress):
+    """Version 4: a trigger-filled log of every change to cakeday for incremental consumers"""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        _execute_statements(conn, CHANGE_FEED_SQL)
+        conn.execute('PRAGMA user_version = 4')
+        conn.execute('COMMIT')
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+
+
+def _notification_schedule(conn, batch_size, progress):
+    """Version 5: per-recipient time zones and an indexed table of each record's next notice instant"""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        _execute_statements(conn, SCHEDULE_SQL)
+        # Left NULL for the scheduler to compute
+        conn.execute('INSERT OR IGNORE INTO notification_schedule (name) SELECT name FROM cakeday WHERE notify')
+        conn.execute('PRAGMA user_version = 5')
+        conn.execute('COMMIT')
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+
+
+MIGRATIONS = (
+    Migration(1, "month_day column, name search index and notification tables", _baseline),
+    Migration(2, "integer month/day, boolean notify and CHECK constraints", _typed_columns),
+    Migration(3, "write counter for cross-process result caches", _write_count),
+    Migration(4, "change feed of inserts, updates and deletes", _change_feed),
+    Migration(5, "recipient time zones and notification schedule", _notification_schedule),
+)
+
+
+def pending_migrations(conn):
+    """Return the migrations not yet applied to conn's database"""
+    version = schema_version(conn)
+    return [migration for migration in MIGRATIONS if migration.version > version]
+
+
+def migrate(conn, batch_size=DEFAULT_BATCH_SIZE, progress=None):
+    """Apply every pending migration in order and return the versions applied
+
+    A database without a cakeday table gets the current schema directly.
+    progress, if given, is called as progress(version, rows_copied) after
+    each batch of a table rebuild. Raises MigrationError if the database
+    is newer than this code or holds a record the new schema rejects.
+    """
+    version = schema_version(conn)
+    if version > SCHEMA_VERSION:
+        raise MigrationError(f"Database schema version {version} is newer than this code ({SCHEMA_VERSION})")
+
+    conn.commit()
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None
+    try:
+        if not has_table(conn, 'cakeday'):
+            _run_script(conn, 'create_cakeday_db.sql')
+            return [migration.version for migration in MIGRATIONS if migration.version > version]
+        applied = []
+        for migration in pending_migrations(conn):
+            migration.apply(conn, batch_size, progress)
+            applied.append(migration.version)
+        return applied
+    finally:
+        conn.isolation_level = isolation_level
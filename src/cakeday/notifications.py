@@ -1,8 +1,413 @@
+import os
+import queue
 import smtplib
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 from email.message import EmailMessage
+from itertools import islice
 
+from instrumentation import instrumented
+from operations import get_calendar_index, get_db_connection, month_day_filter, next_occurrence
+from pool import retry_on_busy
 
 
+NOTIFY_VALUES = ('y', 'yes')
+ADVANCE = 'advance'
+CLAIM_LEASE = timedelta(hours=1)
 
+CLAIM_SQL = '''
+    INSERT INTO sent_notifications (name, year, kind, claimed_at) VALUES (?, ?, ?, ?)
+    ON CONFLICT (name, year, kind) DO UPDATE SET claimed_at = excluded.claimed_at
+    WHERE sent_notifications.sent_at IS NULL AND sent_notifications.claimed_at < ?
+'''
 
+DueNotification = namedtuple('DueNotification', ['name', 'birthday', 'adv_days', 'birthday_date', 'notice_date'])
 
+SmtpSettings = namedtuple('SmtpSettings', ['host', 'port', 'username', 'password', 'starttls', 'sender', 'recipient'])
+
+# skipped counts due notices already sent or claimed by another run
+DispatchResult = namedtuple('DispatchResult', ['sent', 'failed', 'skipped'])
+
+
+def settings_from_env(environ=os.environ):
+    """Build SmtpSettings from CAKEDAY_SMTP_* environment variables
+
+    Point CAKEDAY_SMTP_HOST/PORT at a local stand-in such as
+    `python -m aiosmtpd -n -l localhost:8025` to try delivery safely.
+    """
+    return SmtpSettings(
+        host=environ.get('CAKEDAY_SMTP_HOST', 'localhost'),
+        port=int(environ.get('CAKEDAY_SMTP_PORT', '25')),
+        username=environ.get('CAKEDAY_SMTP_USER'),
+        password=environ.get('CAKEDAY_SMTP_PASSWORD'),
+        starttls=environ.get('CAKEDAY_SMTP_STARTTLS', 'n').lower() in NOTIFY_VALUES,
+        sender=environ.get('CAKEDAY_MAIL_FROM', 'cakeday@localhost'),
+        recipient=environ.get('CAKEDAY_MAIL_TO', 'cakeday@localhost'),
+    )
+
+
+def _today():
+    return datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _adv_days_values(c):
+    """Yield each distinct adv_days value through index seeks (a loose index scan)"""
+    c.execute('SELECT MIN(adv_days) FROM cakeday WHERE adv_days >= 0')
+    value = c.fetchone()[0]
+    while value is not None:
+        yield value
+        c.execute('SELECT MIN(adv_days) FROM cakeday WHERE adv_days > ?', (value,))
+        value = c.fetchone()[0]
+
+
+def iter_due_notifications(start=None, end=None, batch_size=1000):
+    """Stream opted-in records whose advance-notice window opens between start and end (inclusive)
+
+    A notice opens adv_days before the birthday, so for every distinct
+    adv_days the birthdays between start + adv_days and end + adv_days are
+    read through the (adv_days, month_day) index, batch_size rows at a time.
+    Dates default to today. Results are grouped by adv_days, not sorted.
+    With operations.enable_calendar_index() on, notices are read from its
+    day buckets instead, one day at a time.
+    """
+    start = start or _today()
+    end = end or start
+    span = (end - start).days
+    if span < 0:
+        return
+
+    calendar = get_calendar_index()
+    if calendar is not None:
+        for offset in range(span + 1):
+            notice_date = start + timedelta(days=offset)
+            for name, birthday, adv_days in calendar.notices_on(notice_date):
+                yield DueNotification(name, birthday, adv_days, notice_date + timedelta(days=adv_days), notice_date)
+        return
+
+    with get_db_connection() as conn:
+        yield from due_from_connection(conn, start, end, batch_size)
+
+
+def due_from_connection(conn, start, end, batch_size=1000, rowid_range=None):
+    """Yield the DueNotification rows iter_due_notifications would, read through conn
+
+    rowid_range limits the scan to rows with low <= rowid <= high, so
+    parallel workers can split one table between them.
+    """
+    span = (end - start).days
+    rowid_filter, rowid_params = '', []
+    if rowid_range is not None:
+        rowid_filter, rowid_params = ' AND rowid BETWEEN ? AND ?', list(rowid_range)
+
+    adv_days_values = list(_adv_days_values(conn.cursor()))
+    c = conn.cursor()
+    for adv_days in adv_days_values:
+        window_start = start + timedelta(days=adv_days)
+        where, params = month_day_filter(window_start, span)
+        c.execute(
+            f'SELECT name, birthday, month, day FROM cakeday '
+            f'WHERE adv_days = ? AND notify AND ({where}){rowid_filter}',
+            [adv_days, *params, *rowid_params]
+        )
+        while True:
+            rows = c.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from _notices(rows, adv_days, window_start, start, end)
+
+
+def _notices(rows, adv_days, window_start, start, end):
+    """Build the DueNotification for each (name, birthday, month, day) row whose notice opens in range"""
+    for name, birthday, month, day in rows:
+        birthday_date = next_occurrence(month, day, window_start)
+        if birthday_date is None:
+            continue
+        notice_date = birthday_date - timedelta(days=adv_days)
+        if start <= notice_date <= end:
+            yield DueNotification(name, birthday, adv_days, birthday_date, notice_date)
+
+
+def iter_due_batches(start=None, end=None, batch_size=1000):
+    """Yield the notices iter_due_notifications would, as lists of at most batch_size
+
+    Each page is read by rowid keyset in its own short checkout, so no read
+    transaction stays open between pages and the caller can write (e.g.
+    claim the batch) before asking for the next one. A read held open
+    across that write would pin its snapshot and fail with SQLITE_BUSY once
+    any other connection commits.
+    """
+    start = start or _today()
+    end = end or start
+    span = (end - start).days
+    if span < 0:
+        return
+
+    if get_calendar_index() is not None:
+        due = iter_due_notifications(start, end, batch_size)
+        while batch := list(islice(due, batch_size)):
+            yield batch
+        return
+
+    with get_db_connection() as conn:
+        adv_days_values = list(_adv_days_values(conn.cursor()))
+    for adv_days in adv_days_values:
+        window_start = start + timedelta(days=adv_days)
+        where, params = month_day_filter(window_start, span)
+        last_rowid = 0
+        while True:
+            with get_db_connection() as conn:
+                rows = conn.execute(
+                    f'SELECT rowid, name, birthday, month, day FROM cakeday '
+                    f'WHERE adv_days = ? AND notify AND ({where}) AND rowid > ? ORDER BY rowid LIMIT ?',
+                    [adv_days, *params, last_rowid, batch_size]
+                ).fetchall()
+            if not rows:
+                break
+            last_rowid = rows[-1][0]
+            batch = list(_notices([row[1:] for row in rows], adv_days, window_start, start, end))
+            if batch:
+                yield batch
+            if len(rows) < batch_size:
+                break
+
+
+@instrumented()
+def get_due_notifications(start=None, end=None):
+    """Get opted-in records whose advance-notice window opens between start and end, by date then name"""
+    due = list(iter_due_notifications(start, end))
+    due.sort(key=lambda notice: (notice.notice_date, notice.name))
+    return due
+
+
+def render_message(notice, settings):
+    """Build the reminder email for a due notification"""
+    message = EmailMessage()
+    when = 'today' if notice.adv_days == 0 else f"in {notice.adv_days} day{'s' if notice.adv_days != 1 else ''}"
+    message['Subject'] = f"Birthday reminder: {notice.name} {when}"
+    message['From'] = settings.sender
+    message['To'] = settings.recipient
+    message.set_content(
+        f"{notice.name}'s birthday is {when}, on {notice.birthday_date:%A %B %d, %Y}.\n"
+    )
+    return message
+
+
+def is_transient(error):
+    """Return True if an SMTP error is worth retrying on a fresh connection"""
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return False
+    return isinstance(error, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, OSError))
+
+
+class SMTPConnectionPool:
+    """A small pool of long-lived SMTP connections shared by sender threads
+
+    Connections are opened lazily, reused across messages, and replaced
+    after a transient failure. Sends are retried with exponential backoff.
+    """
+
+    def __init__(self, settings, size=4, retries=3, backoff=0.5, timeout=30,
+                 smtp_factory=smtplib.SMTP):
+        self.settings = settings
+        self.size = size
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.smtp_factory = smtp_factory
+        self._idle = queue.LifoQueue()
+        self._slots = queue.Queue()
+        for _ in range(size):
+            self._slots.put(None)
+
+    def _connect(self):
+        smtp = self.smtp_factory(self.settings.host, self.settings.port, timeout=self.timeout)
+        if self.settings.starttls:
+            smtp.starttls()
+        if self.settings.username:
+            smtp.login(self.settings.username, self.settings.password or '')
+        return smtp
+
+    @staticmethod
+    def _close(smtp):
+        try:
+            smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            try:
+                smtp.close()
+            except OSError:
+                pass
+
+    def send(self, message):
+        """Send one message, retrying transient failures; raises the last error"""
+        self._slots.get()
+        try:
+            try:
+                smtp = self._idle.get_nowait()
+            except queue.Empty:
+                smtp = None
+
+            for attempt in range(self.retries + 1):
+                try:
+                    if smtp is None:
+                        smtp = self._connect()
+                    smtp.send_message(message)
+                    return
+                except Exception as e:
+                    if smtp is not None:
+                        self._close(smtp)
+                        smtp = None
+                    if attempt == self.retries or not is_transient(e):
+                        raise
+                    time.sleep(self.backoff * 2 ** attempt)
+        finally:
+            if smtp is not None:
+                self._idle.put(smtp)
+            self._slots.put(None)
+
+    def send_all(self, messages):
+        """Send messages with at most `size` in flight; return (sent count, [(message, error)])"""
+        sent = 0
+        failed = []
+        with ThreadPoolExecutor(max_workers=self.size) as executor:
+            futures = [(message, executor.submit(self.send, message)) for message in messages]
+            for message, future in futures:
+                error = future.exception()
+                if error is None:
+                    sent += 1
+                else:
+                    failed.append((message, error))
+        return sent, failed
+
+    def close(self):
+        """Quit every idle connection"""
+        while True:
+            try:
+                smtp = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._close(smtp)
+
+
+def get_watermark(kind=ADVANCE):
+    """Return the last date a dispatch run fully covered for kind, or None"""
+    with get_db_connection() as conn:
+        row = conn.execute('SELECT last_date FROM notification_watermark WHERE kind = ?', (kind,)).fetchone()
+    return datetime.strptime(row[0], '%Y-%m-%d') if row else None
+
+
+@retry_on_busy()
+def set_watermark(last_date, kind=ADVANCE):
+    """Record that every notice opening up to last_date has been handled"""
+    with get_db_connection() as conn:
+        conn.execute(
+            'INSERT INTO notification_watermark (kind, last_date) VALUES (?, ?) '
+            'ON CONFLICT (kind) DO UPDATE SET last_date = excluded.last_date',
+            (kind, last_date.strftime('%Y-%m-%d'))
+        )
+        conn.commit()
+
+
+@retry_on_busy()
+def claim_notifications(due, kind=ADVANCE, now=None):
+    """Reserve due notices in the ledger and return the ones this run now owns
+
+    A notice already sent, or claimed by another run within CLAIM_LEASE, is
+    left alone. Claims older than the lease (a run that crashed mid-send)
+    are taken over. due must be a list (not an iterator) so a claim that
+    lost a lock race can be retried.
+    """
+    now = now or datetime.now()
+    claimed_at = now.isoformat(timespec='seconds')
+    stale_before = (now - CLAIM_LEASE).isoformat(timespec='seconds')
+    claimed = []
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        try:
+            for notice in due:
+                c.execute(CLAIM_SQL, (notice.name, notice.birthday_date.year, kind, claimed_at, stale_before))
+                if c.rowcount == 1:
+                    claimed.append(notice)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return claimed
+
+
+@retry_on_busy()
+def _finish_claims(sql, notices, kind, *extra):
+    if not notices:
+        return
+    with get_db_connection() as conn:
+        conn.executemany(sql, [(*extra, notice.name, notice.birthday_date.year, kind) for notice in notices])
+        conn.commit()
+
+
+def mark_sent(notices, kind=ADVANCE):
+    """Record claimed notices as delivered"""
+    sent_at = datetime.now().isoformat(timespec='seconds')
+    _finish_claims('UPDATE sent_notifications SET sent_at = ? WHERE name = ? AND year = ? AND kind = ?',
+                   notices, kind, sent_at)
+
+
+def release_claims(notices, kind=ADVANCE):
+    """Drop claims for notices that could not be delivered so a later run retries them"""
+    _finish_claims('DELETE FROM sent_notifications WHERE name = ? AND year = ? AND kind = ? AND sent_at IS NULL',
+                   notices, kind)
+
+
+def dispatch_window(on_date=None, kind=ADVANCE):
+    """Return (watermark, start, end) for a run: the notice dates it still has to cover"""
+    end = on_date or _today()
+    watermark = get_watermark(kind)
+    start = watermark + timedelta(days=1) if watermark else end
+    return watermark, start, end
+
+
+def finish_dispatch(claimed, failed_notices, watermark, end, kind=ADVANCE):
+    """Settle a run's claims in the ledger and move the watermark
+
+    Delivered notices are marked sent and failed ones released. The
+    watermark is held just before the earliest failure so the next run
+    retries it.
+    """
+    failed_ids = {id(notice) for notice in failed_notices}
+    mark_sent([notice for notice in claimed if id(notice) not in failed_ids], kind)
+    release_claims(failed_notices, kind)
+
+    if failed_notices:
+        set_watermark(min(notice.notice_date for notice in failed_notices) - timedelta(days=1), kind)
+    elif watermark is None or end > watermark:
+        set_watermark(end, kind)
+
+
+def dispatch(on_date=None, settings=None, pool_size=4, smtp_factory=smtplib.SMTP, kind=ADVANCE):
+    """Send every reminder whose notice window opened since the last run, at most once each
+
+    Scans from the day after the stored watermark through on_date (default
+    today), so a daily run only reads that day's notices and a run after
+    downtime catches up. Each reminder is claimed in sent_notifications
+    before it is sent, so repeated or overlapping runs never send it twice.
+    """
+    settings = settings or settings_from_env()
+    watermark, start, end = dispatch_window(on_date, kind)
+    due = get_due_notifications(start, end)
+    claimed = claim_notifications(due, kind)
+
+    messages = [render_message(notice, settings) for notice in claimed]
+    notices = {id(message): notice for message, notice in zip(messages, claimed)}
+
+    pool = SMTPConnectionPool(settings, size=pool_size, smtp_factory=smtp_factory)
+    try:
+        sent, failed = pool.send_all(messages)
+    finally:
+        pool.close()
+
+    failed_notices = [notices[id(message)] for message, _ in failed]
+    finish_dispatch(claimed, failed_notices, watermark, end, kind)
+    return DispatchResult(sent, [(notices[id(message)].name, error) for message, error in failed],
+                          len(due) - len(claimed))
@@ -1,23 +1,272 @@
+import atexit
+import heapq
+import os
 import sqlite3
 import re
+import threading
+import time
+from collections import namedtuple
 from contextlib import contextmanager
+from contextvars import ContextVar
 from datetime import datetime, timedelta
+from operator import itemgetter
+
+import instrumentation
+from cache import MISSING, RecordCache
+from calendar_index import CalendarIndex
+from instrumentation import instrumented
+from memo import UpcomingMemo, write_count
+from memory import MemoryDatabase
+from pool import ConnectionPool, retry_on_busy
+from records import BirthdayList, birthday_factory
+from settings import DEFAULT_CHECKPOINT_INTERVAL, DEFAULT_DATABASE, DEFAULT_SHARD_DIR, load_settings
+
+
+DB_PATH = DEFAULT_DATABASE
+SHARD_DIR = DEFAULT_SHARD_DIR
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'database', 'create_cakeday_db.sql')
+TENANT_PATTERN = re.compile(r'^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$')
+# Longest day of each month, counting Feb 29
+MONTH_LENGTHS = (31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+RECORD_FIELDS = ('name', 'birthday', 'notification', 'adv_days')
+RECORD_COLUMNS = ', '.join(RECORD_FIELDS)
+UPCOMING_FIELDS = ('name', 'birthday', 'days_until', 'date')
+
+INSERT_SQL = 'INSERT INTO cakeday (name, birthday, notification, adv_days) VALUES (?, ?, ?, ?)'
+UPDATE_SQL = 'UPDATE cakeday SET birthday = ?, notification = ?, adv_days = ? WHERE name = ?'
+DELETE_SQL = 'DELETE FROM cakeday WHERE name = ?'
+
+# failed holds (name, message) pairs for records that were not written
+BatchResult = namedtuple('BatchResult', ['succeeded', 'failed'])
+
+ALL_RECORDS_KEY = ('all',)
+
+# Fuzzy matches must be at least this similar to the query (0-1)
+FUZZY_MIN_SIMILARITY = 0.6
+FUZZY_CANDIDATES = 50
+# Trigram index matches read and ranked per lookup
+FTS_CANDIDATES = 200
+# Reads also take the stored month and day so Birthday records need no parsing
+READ_COLUMNS = RECORD_COLUMNS + ', month, day'
+SEARCH_COLUMNS = ', '.join('c.' + field for field in (*RECORD_FIELDS, 'month', 'day'))
+
+_pool = None
+_pool_lock = threading.RLock()
+_memory = None
+_settings = None
+_cache = None
+_upcoming_memo = None
+_calendars = None
+
+# The tenant whose shard the current thread/task reads and writes; None is the default database
+_tenant = ContextVar('cakeday_tenant', default=None)
+_shard_dir = None
+_shard_options = {}
+_shard_pools = {}
+
+
+def get_settings():
+    """Return the database settings in effect, resolving them from the environment and config file on first use"""
+    global _settings
+    if _settings is None:
+        _settings = load_settings()
+    return _settings
+
+
+def apply_settings(settings):
+    """Point the shared pool (on disk or in memory) and the tenant shards at settings' locations
+
+    A shard directory chosen with configure_shards() is kept; otherwise
+    shard pools are reopened only if settings move the shard directory.
+    """
+    global _settings
+    with _pool_lock:
+        previous, _settings = _settings, settings
+        if settings.in_memory:
+            configure_memory_database(settings.database, settings.checkpoint_interval)
+        else:
+            configure_pool(settings.database)
+        if _shard_dir is None and previous is not None and previous.shard_dir != settings.shard_dir:
+            configure_shards(**_shard_options)
+
+
+def _close_default():
+    """Close the shared pool, then write back and free the in-memory database if there is one"""
+    global _pool, _memory
+    if _pool is not None:
+        _pool.close()
+        _pool = None
+    if _memory is not None:
+        memory, _memory = _memory, None
+        memory.close()
+
+
+def configure_pool(database=DB_PATH, **options):
+    """Replace the shared connection pool, e.g. to change its size or database
+
+    Options are passed to ConnectionPool (size, timeout, cached_statements,
+    health_check_interval, profile).
+    """
+    global _pool
+    with _pool_lock:
+        _close_default()
+        _pool = ConnectionPool(database, **options)
+        return _pool
+
+
+def configure_memory_database(path=None, checkpoint_interval=DEFAULT_CHECKPOINT_INTERVAL, **options):
+    """Serve the shared pool from an in-memory copy of path, checkpointed back every checkpoint_interval seconds
+
+    path defaults to the configured database. The copy is written back a
+    final time by close_pool() or at interpreter exit. Returns the
+    MemoryDatabase.
+    """
+    global _pool, _memory
+    with _pool_lock:
+        _close_default()
+        memory = MemoryDatabase(path or get_settings().database, checkpoint_interval)
+        atexit.register(memory.close)
+        _memory = memory
+        _pool = ConnectionPool(memory.uri, **options)
+        return memory
+
+
+def checkpoint_memory_database():
+    """Write the in-memory database back to disk now; return False if it was unchanged or not in use"""
+    memory = _memory
+    return memory.checkpoint() if memory is not None else False
+
+
+def get_pool():
+    """Return the connection pool for the current tenant's shard, or the shared pool outside any tenant"""
+    tenant = _tenant.get()
+    if tenant is not None:
+        return _shard_pool(tenant)
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                apply_settings(get_settings())
+    return _pool
+
+
+def close_pool():
+    """Close the shared connection pool (checkpointing an in-memory database) and every tenant shard pool"""
+    with _pool_lock:
+        _close_default()
+        for pool in _shard_pools.values():
+            pool.close()
+        _shard_pools.clear()
+
+
+def configure_shards(directory=None, **options):
+    """Keep tenant shards in directory (default: the configured shard_dir), opening their pools with options"""
+    global _shard_dir, _shard_options
+    with _pool_lock:
+        for pool in _shard_pools.values():
+            pool.close()
+        _shard_pools.clear()
+        _shard_dir = directory
+        _shard_options = options
+
+
+def shard_dir():
+    """Return the directory holding tenant shards"""
+    return _shard_dir or get_settings().shard_dir
+
+
+def shard_path(tenant):
+    """Return the database file holding tenant's records"""
+    if not isinstance(tenant, str) or not TENANT_PATTERN.match(tenant):
+        raise ValueError(f"Invalid tenant name {tenant!r}")
+    return os.path.join(shard_dir(), f"{tenant}.db")
+
+
+def _shard_pool(tenant):
+    """Return tenant's pool, creating the shard from the schema on first use"""
+    pool = _shard_pools.get(tenant)
+    if pool is None:
+        with _pool_lock:
+            pool = _shard_pools.get(tenant)
+            if pool is None:
+                path = shard_path(tenant)
+                if not os.path.exists(path):
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    conn = sqlite3.connect(path)
+                    with open(SCHEMA_PATH) as f:
+                        conn.executescript(f.read())
+                    conn.close()
+                pool = _shard_pools[tenant] = ConnectionPool(path, **_shard_options)
+    return pool
 
 
 @contextmanager
-def get_db_connection():
-    """Context manager for database connections"""
-    conn = sqlite3.connect("../database/cakeday.db")
+def use_tenant(tenant):
+    """Route every operation inside the block to tenant's shard (None for the default database)"""
+    if tenant is not None:
+        shard_path(tenant)
+    token = _tenant.set(tenant)
     try:
-        yield conn
+        yield
     finally:
-        conn.close()
+        _tenant.reset(token)
+
+
+def current_tenant():
+    """Return the tenant operations are currently routed to, or None"""
+    return _tenant.get()
+
+
+def list_tenants():
+    """Return every tenant that has a shard, sorted"""
+    directory = shard_dir()
+    if not os.path.isdir(directory):
+        return []
+    tenants = (filename[:-3] for filename in os.listdir(directory) if filename.endswith('.db'))
+    return sorted(tenant for tenant in tenants if TENANT_PATTERN.match(tenant))
+
+
+def for_each_tenant(func, *args, tenants=None, max_workers=8, **kwargs):
+    """Call func(*args, **kwargs) inside each tenant's shard on worker threads; return {tenant: result}"""
+    tenants = list_tenants() if tenants is None else list(tenants)
+
+    def run(tenant):
+        with use_tenant(tenant):
+            return func(*args, **kwargs)
+
+    if len(tenants) <= 1:
+        return {tenant: run(tenant) for tenant in tenants}
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(tenants))) as executor:
+        return dict(zip(tenants, executor.map(run, tenants)))
+
+
+@contextmanager
+def get_db_connection():
+    """Context manager for pooled database connections
+
+    With instrumentation enabled, reports the checkout wait as
+    get_db_connection and the pool's open connection count as a gauge.
+    """
+    if not instrumentation.enabled():
+        with get_pool().connection() as conn:
+            yield conn
+        return
+
+    pool = get_pool()
+    started = time.perf_counter()
+    with pool.connection() as conn:
+        instrumentation.record('get_db_connection', time.perf_counter() - started)
+        instrumentation.gauge('connections_open', pool.open)
+        yield conn
 
 
 def validate_birthday_format(birthday):
-    """Validate birthday format (mm-dd)"""
+    """Validate birthday format (mm-dd) and that it is a calendar day (02-29 included)"""
     regex = r"^\d{2}-\d{2}$"
-    return re.match(regex, birthday) is not None
+    if re.match(regex, birthday) is None:
+        return False
+    month, day = int(birthday[:2]), int(birthday[3:])
+    return 1 <= month <= 12 and 1 <= day <= MONTH_LENGTHS[month - 1]
 
 
 def validate_notification_input(notification):
@@ -25,20 +274,479 @@ def validate_notification_input(notification):
     return notification.lower() in ['y', 'yes', 'n', 'no']
 
 
+def birthday_to_month_day(birthday):
+    """Convert a mm-dd birthday to its indexed month_day key (e.g. '07-15' -> 715)"""
+    month, day = birthday.split('-')
+    return int(month) * 100 + int(day)
+
+
+def is_leap_year(year):
+    """Return True if year has a Feb 29"""
+    return year % 4 == 0 and (year % 100 != 0 or year % 400 == 0)
+
+
+def month_day_ranges(start, days_ahead):
+    """Build inclusive month_day ranges covering the dates start..start + days_ahead
+
+    A window that crosses New Year is split in two, and a range ending on
+    Feb 28 of a non-leap year is widened to 229 so Feb 29 birthdays are
+    celebrated on the 28th.
+    """
+    if days_ahead >= 365:
+        return [(101, 1231)]
+
+    end = start + timedelta(days=days_ahead)
+    low = start.month * 100 + start.day
+    high = end.month * 100 + end.day
+    if end.year == start.year:
+        ranges = [(low, high)]
+    else:
+        ranges = [(low, 1231), (101, high)]
+
+    if high == 228 and not is_leap_year(end.year):
+        ranges[-1] = (ranges[-1][0], 229)
+    return ranges
+
+
+def enable_cache(maxsize=1024, ttl=60.0):
+    """Serve get_by_name and get_all from an in-process LRU cache"""
+    global _cache
+    _cache = RecordCache(maxsize=maxsize, ttl=ttl)
+    return _cache
+
+
+def disable_cache():
+    """Turn the read cache off"""
+    global _cache
+    _cache = None
+
+
+def cache_stats():
+    """Return the read cache's hit/miss counters, or None when it is off"""
+    return _cache.stats() if _cache is not None else None
+
+
+def enable_upcoming_cache(directory=None):
+    """Memoize get_upcoming_birthdays per (date, days_ahead, write counter), shared with other processes on disk
+
+    Results are saved next to each database file, or in directory.
+    """
+    global _upcoming_memo
+    _upcoming_memo = UpcomingMemo(directory)
+    return _upcoming_memo
+
+
+def disable_upcoming_cache():
+    """Turn the upcoming-birthday result cache off"""
+    global _upcoming_memo
+    _upcoming_memo = None
+
+
+def enable_calendar_index():
+    """Answer get_upcoming_birthdays from in-memory day buckets (one index per tenant) kept current on writes"""
+    global _calendars
+    _calendars = {}
+
+
+def disable_calendar_index():
+    """Turn the calendar index off"""
+    global _calendars
+    _calendars = None
+
+
+def get_calendar_index():
+    """Return the current tenant's calendar index synced with its database
+
+    Returns None when the index is off or the database predates the write
+    counter it relies on (run `cakeday.py migrate`).
+    """
+    calendars = _calendars
+    if calendars is None:
+        return None
+    calendar = calendars.get(_tenant.get())
+    if calendar is None:
+        calendar = calendars.setdefault(_tenant.get(), CalendarIndex())
+    with get_db_connection() as conn:
+        if not calendar.sync(conn):
+            return None
+    return calendar
+
+
+def _tracks_writes():
+    """Whether writes must report the write counter range they covered to the cache or calendar index"""
+    calendars = _calendars
+    return _cache is not None or (calendars is not None and _tenant.get() in calendars)
+
+
+def _cache_key(*parts):
+    """Cache key for parts within the current tenant"""
+    return (_tenant.get(), *parts)
+
+
+def invalidate_cache(names=None, versions=None):
+    """Drop cached reads and calendar entries for the given names (and get_all), or everything when names is None
+
+    versions is the (before, after) write counter of the transaction that
+    wrote names, letting the cache and calendar index tell their own
+    writes from others.
+    """
+    calendars = _calendars
+    if calendars is not None and _tenant.get() in calendars:
+        calendars[_tenant.get()].invalidate(names, versions)
+    if _cache is None:
+        return
+    if names is None:
+        _cache.invalidate()
+    else:
+        _cache.invalidate([_cache_key(*ALL_RECORDS_KEY), *(_cache_key('name', name) for name in names)], versions)
+
+
+def _cached_read(conn, key, query):
+    """Run query(cursor) through the read cache when it is enabled
+
+    Databases without the write counter are read directly, since writes
+    from other processes could not be detected.
+    """
+    version = write_count(conn) if _cache is not None else None
+    if version is None:
+        return query(conn.cursor())
+    _cache.check_version(version)
+    value = _cache.get(key)
+    if value is MISSING:
+        generation = _cache.generation
+        value = query(conn.cursor())
+        _cache.put(key, value, generation)
+    return value
+
+
+@instrumented()
 def get_all():
     """Get all birthday records"""
+    def query(c):
+        c.execute(f'SELECT {READ_COLUMNS} FROM cakeday ORDER BY name')
+        return BirthdayList(c.fetchall())
+
     with get_db_connection() as conn:
-        c = conn.cursor()
-        c.execute('SELECT * FROM cakeday ORDER BY name')
-        return c.fetchall()
+        records = _cached_read(conn, _cache_key(*ALL_RECORDS_KEY), query)
+    # Never hand callers the cached list itself
+    return records.copy() if _cache is not None else records
 
 
+@instrumented(rows=lambda record: 0 if record is None else 1)
 def get_by_name(name):
     """Get birthday record by name"""
+    def query(c):
+        c.row_factory = birthday_factory
+        c.execute(f'SELECT {READ_COLUMNS} FROM cakeday WHERE name = ?', (name,))
+        return c.fetchone()
+
+    with get_db_connection() as conn:
+        return _cached_read(conn, _cache_key('name', name), query)
+
+
+@instrumented()
+def get_page(after=None, before=None, page_size=20):
+    """Get one page of records ordered by name using keyset pagination
+
+    Pass the last name of the current page as after for the next page, or
+    its first name as before for the previous one. Each page is an index
+    seek on the name primary key, however deep into the table it is.
+    """
     with get_db_connection() as conn:
         c = conn.cursor()
-        c.execute('SELECT * FROM cakeday WHERE name = ?', (name,))
-        return c.fetchone()
+        c.row_factory = birthday_factory
+        if before is not None:
+            c.execute(f'SELECT {READ_COLUMNS} FROM cakeday WHERE name < ? ORDER BY name DESC LIMIT ?',
+                      (before, page_size))
+            return c.fetchall()[::-1]
+        if after is not None:
+            c.execute(f'SELECT {READ_COLUMNS} FROM cakeday WHERE name > ? ORDER BY name LIMIT ?',
+                      (after, page_size))
+        else:
+            c.execute(f'SELECT {READ_COLUMNS} FROM cakeday ORDER BY name LIMIT ?', (page_size,))
+        return c.fetchall()
+
+
+def iter_all(page_size=1000):
+    """Yield every record ordered by name, holding at most one page in memory"""
+    after = None
+    while True:
+        page = get_page(after=after, page_size=page_size)
+        yield from page
+        if len(page) < page_size:
+            return
+        after = page[-1][0]
+
+
+def _fts_phrase(text):
+    """Quote text as an FTS5 string so operators and punctuation are matched literally"""
+    return '"' + text.replace('"', '""') + '"'
+
+
+@instrumented()
+def search_names(query, limit=10):
+    """Find records whose name best matches a partial or misspelled query
+
+    Exact matches rank first, then names starting with the query (both read
+    by a range seek on the case-insensitive name index), then other names
+    containing it, found through the cakeday_fts trigram index. If that
+    leaves room, names sharing trigrams with the query are re-ranked by
+    similarity to tolerate typos. Each trigram lookup reads at most
+    FTS_CANDIDATES index matches and ranks them here, so common fragments
+    stay cheap on large tables. Queries shorter than a trigram only get the
+    prefix seek.
+    """
+    from difflib import SequenceMatcher
+
+    query = query.strip()
+    if not query:
+        return []
+
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        c.row_factory = birthday_factory
+        # Under NOCASE an exact match sorts before the longer names it prefixes
+        c.execute(f'SELECT {READ_COLUMNS} FROM cakeday WHERE name >= ? COLLATE NOCASE AND name < ? COLLATE NOCASE '
+                  'ORDER BY name COLLATE NOCASE LIMIT ?', (query, query + '\U0010ffff', limit))
+        results = c.fetchall()
+        if len(results) >= limit or len(query) < 3:
+            return results
+
+        def candidates(match):
+            # No ORDER BY rank: bm25 reads every match of each trigram before scoring any
+            c.execute(f'SELECT {SEARCH_COLUMNS} FROM cakeday_fts f JOIN cakeday c ON c.rowid = f.rowid '
+                      'WHERE cakeday_fts MATCH ? LIMIT ?', (match, FTS_CANDIDATES))
+            found = {record[0] for record in results}
+            return [record for record in c.fetchall() if record[0] not in found]
+
+        lowered = query.lower()
+        # Earlier and shorter occurrences first
+        contained = sorted(candidates(_fts_phrase(query)),
+                           key=lambda record: (record[0].lower().find(lowered), len(record[0]), record[0]))
+        results += contained[:limit - len(results)]
+        if len(results) >= limit:
+            return results
+
+        trigrams = {lowered[i:i + 3] for i in range(len(lowered) - 2)}
+        shared = sorted(candidates(' OR '.join(_fts_phrase(trigram) for trigram in sorted(trigrams))),
+                        key=lambda record: -sum(trigram in record[0].lower() for trigram in trigrams))
+        def similarity(part):
+            matcher = SequenceMatcher(None, lowered, part)
+            # The quick ratios are upper bounds, so most candidates skip the full comparison
+            if matcher.real_quick_ratio() < FUZZY_MIN_SIMILARITY or matcher.quick_ratio() < FUZZY_MIN_SIMILARITY:
+                return 0.0
+            return matcher.ratio()
+
+        scored = []
+        for record in shared[:FUZZY_CANDIDATES]:
+            # Score against the whole name and each part so "smiht" can find "Jonathan Smith"
+            name = record[0].lower()
+            best = max(similarity(part) for part in [name, *name.split()])
+            if best >= FUZZY_MIN_SIMILARITY:
+                scored.append((-best, record))
+        scored.sort()
+        return results + [record for _, record in scored[:limit - len(results)]]
+
+
+def normalize_record(record):
+    """Validate a record and return the (name, birthday, notification, adv_days) row to store
+
+    record may be a dict keyed by RECORD_FIELDS or a tuple in that order.
+    Raises ValueError describing the first invalid field.
+    """
+    if not isinstance(record, dict):
+        record = dict(zip(RECORD_FIELDS, record))
+
+    name = str(record.get('name') or '').strip()
+    if not name:
+        raise ValueError("Name cannot be empty")
+
+    birthday = str(record.get('birthday') or '').strip()
+    if not validate_birthday_format(birthday):
+        raise ValueError(f"Invalid birthday {birthday!r}; expected mm-dd")
+
+    notification = str(record.get('notification') or 'n').strip().lower()
+    if not validate_notification_input(notification):
+        raise ValueError(f"Invalid notification {notification!r}; expected y/n")
+
+    if notification in ('y', 'yes'):
+        try:
+            adv_days = int(record.get('adv_days') or 0)
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid adv_days {record.get('adv_days')!r}; expected an integer") from None
+        if adv_days < 0:
+            raise ValueError("adv_days must be a non-negative integer")
+    else:
+        adv_days = 0
+
+    return (name, birthday, notification, adv_days)
+
+
+def _as_batch(items, single_types, tuple_item=False):
+    """Wrap a single record/name in a list so the batch API accepts either
+
+    With tuple_item, a tuple starting with a string is one item (a record
+    or pair) rather than a batch; otherwise tuples are batches like lists.
+    """
+    if isinstance(items, single_types):
+        return [items]
+    if tuple_item and isinstance(items, tuple) and items and isinstance(items[0], str):
+        return [items]
+    return list(items)
+
+
+@retry_on_busy()
+def _run_batch(items, write_one):
+    """Apply write_one(cursor, item) to every item inside one transaction
+
+    write_one returns (name, error message or None). Any unexpected error
+    rolls the whole batch back and is re-raised; a batch that lost a lock
+    race with another writer is retried from the start.
+    """
+    succeeded, failed = [], []
+    versions = None
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        try:
+            before = None
+            if _tracks_writes():
+                # Hold the write lock from the start so every counter bump in between is ours
+                c.execute('BEGIN IMMEDIATE')
+                before = write_count(conn)
+            for item in items:
+                name, error = write_one(c, item)
+                if error:
+                    failed.append((name, error))
+                else:
+                    succeeded.append(name)
+            if before is not None:
+                versions = (before, write_count(conn))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    invalidate_cache(succeeded, versions)
+    return BatchResult(succeeded, failed)
+
+
+@instrumented(rows=lambda result: len(result.succeeded))
+def add_birthdays(records):
+    """Add one record or a list of new records in a single transaction
+
+    Records are dicts keyed by RECORD_FIELDS or tuples in that order.
+    Invalid records and names that already exist are reported in
+    BatchResult.failed rather than raised.
+    """
+    def add_one(c, record):
+        try:
+            row = normalize_record(record)
+        except ValueError as e:
+            return _record_name(record), str(e)
+        try:
+            c.execute(INSERT_SQL, row)
+        except sqlite3.IntegrityError:
+            return row[0], f"Record for {row[0]} already exists"
+        return row[0], None
+
+    return _run_batch(_as_batch(records, dict, tuple_item=True), add_one)
+
+
+@instrumented(rows=lambda result: len(result.succeeded))
+def update_birthdays(changes):
+    """Update one or a list of existing records in a single transaction
+
+    Each change is a dict with a name plus any of birthday, notification and
+    adv_days; fields left out (or None) keep their stored value.
+    """
+    def update_one(c, change):
+        name = _record_name(change)
+        if not isinstance(name, str) or not name:
+            return name, "Each change needs a name"
+        fields = {field: change.get(field) for field in RECORD_FIELDS}
+        if any(value is None for value in fields.values()):
+            c.execute(f'SELECT {RECORD_COLUMNS} FROM cakeday WHERE name = ?', (name,))
+            existing = c.fetchone()
+            if not existing:
+                return name, f"No record found for {name}"
+            fields = {field: stored if fields[field] is None else fields[field]
+                      for field, stored in zip(RECORD_FIELDS, existing)}
+        try:
+            name, birthday, notification, adv_days = normalize_record(fields)
+        except ValueError as e:
+            return name, str(e)
+        c.execute(UPDATE_SQL, (birthday, notification, adv_days, name))
+        if c.rowcount == 0:
+            return name, f"No record found for {name}"
+        return name, None
+
+    return _run_batch(_as_batch(changes, dict), update_one)
+
+
+@instrumented(rows=lambda result: len(result.succeeded))
+def delete_birthdays(names):
+    """Delete one name or a list of names in a single transaction"""
+    def delete_one(c, name):
+        c.execute(DELETE_SQL, (name,))
+        if c.rowcount == 0:
+            return name, f"No record found for {name}"
+        return name, None
+
+    return _run_batch(_as_batch(names, str), delete_one)
+
+
+def get_zone(name):
+    """Return the ZoneInfo for an IANA time zone name, or None (system local time) if name is empty
+
+    Raises ValueError for unknown zones.
+    """
+    if not name:
+        return None
+    # Imported here so commands that never touch time zones start faster
+    from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"Unknown time zone {name!r}") from None
+
+
+@instrumented(rows=lambda result: len(result.succeeded))
+def set_timezones(assignments):
+    """Set the time zone notices are sent in for one (name, zone) pair, a list of them or a {name: zone} dict
+
+    zone is an IANA name such as 'Europe/Berlin'; None returns the record to
+    the scheduler's default zone. Runs in a single transaction.
+    """
+    if isinstance(assignments, dict):
+        assignments = list(assignments.items())
+
+    def set_one(c, assignment):
+        name, zone = assignment
+        try:
+            get_zone(zone)
+        except ValueError as e:
+            return name, str(e)
+        if c.execute('SELECT 1 FROM cakeday WHERE name = ?', (name,)).fetchone() is None:
+            return name, f"No record found for {name}"
+        if zone:
+            c.execute('INSERT INTO cakeday_timezones (name, timezone) VALUES (?, ?) '
+                      'ON CONFLICT (name) DO UPDATE SET timezone = excluded.timezone', (name, zone))
+        else:
+            c.execute('DELETE FROM cakeday_timezones WHERE name = ?', (name,))
+        return name, None
+
+    return _run_batch(_as_batch(assignments, (), tuple_item=True), set_one)
+
+
+def _record_name(record):
+    """Best-effort name of a record for error reporting"""
+    if isinstance(record, dict):
+        return record.get('name')
+    return record[0] if record else None
+
+
+def _print_batch_errors(result, prefix):
+    for _, message in result.failed:
+        print(f"{prefix}: {message}")
 
 
 def create():
@@ -84,15 +792,12 @@ def create():
         days_adv = 0
 
     try:
-        with get_db_connection() as conn:
-            c = conn.cursor()
-            c.execute('INSERT INTO cakeday VALUES (?, ?, ?, ?)', (name, bday, notification, days_adv))
-            conn.commit()
+        result = add_birthdays((name, bday, notification, days_adv))
+        if result.succeeded:
             print(f"Successfully added birthday for {name}")
-    except sqlite3.IntegrityError:
-        print(f"Error: Record for {name} already exists")
+        _print_batch_errors(result, "Error")
     except Exception as e:
-        print(f"Error creating record: {e}")  
+        print(f"Error creating record: {e}")
 
   
 def delete():
@@ -114,11 +819,10 @@ def delete():
         return
     
     try:
-        with get_db_connection() as conn:
-            c = conn.cursor()
-            c.execute('DELETE FROM cakeday WHERE name = ?', (name,))
-            conn.commit()
+        result = delete_birthdays(name)
+        if result.succeeded:
             print(f"Successfully deleted birthday for {name}")
+        _print_batch_errors(result, "Error deleting record")
     except Exception as e:
         print(f"Error deleting record: {e}")
 
@@ -183,64 +887,121 @@ def update():
         days_adv = 0
     
     try:
-        with get_db_connection() as conn:
-            c = conn.cursor()
-            c.execute('UPDATE cakeday SET birthday = ?, notification = ?, adv_days = ? WHERE name = ?', 
-                     (bday, notification, days_adv, name))
-            conn.commit()
+        result = update_birthdays({'name': name, 'birthday': bday,
+                                   'notification': notification, 'adv_days': days_adv})
+        if result.succeeded:
             print(f"Successfully updated birthday for {name}")
+        _print_batch_errors(result, "Error updating record")
     except Exception as e:
         print(f"Error updating record: {e}")
 
 
+def next_occurrence(month, day, start):
+    """Return the first midnight on or after start when a birthday on month/day is celebrated
+
+    Feb 29 birthdays fall on Feb 28 in non-leap years. Returns None for
+    dates that never occur (e.g. 02-30).
+    """
+    for year in (start.year, start.year + 1):
+        try:
+            occurrence = datetime(year, month, day)
+        except ValueError:
+            # Handle leap year case (Feb 29)
+            if month == 2 and day == 29:
+                occurrence = datetime(year, 2, 28)
+            else:
+                return None
+        if occurrence >= start:
+            return occurrence
+    return None
+
+
+def month_day_filter(start, days_ahead):
+    """Return a (where clause, params) pair selecting month_day values in start..start + days_ahead"""
+    ranges = month_day_ranges(start, days_ahead)
+    where = ' OR '.join('month_day BETWEEN ? AND ?' for _ in ranges)
+    params = [bound for month_day_range in ranges for bound in month_day_range]
+    return where, params
+
+
+@instrumented()
 def get_upcoming_birthdays(days_ahead=30):
     """Get upcoming birthdays within the specified number of days"""
-    today = datetime.now()
-    current_year = today.year
-    
-    upcoming = []
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
     
+    memo = _upcoming_memo
+    if memo is None:
+        return _find_upcoming(today, days_ahead)
+    # Read the counter before the rows: a write in between makes the entry
+    # newer than its key, never older
     with get_db_connection() as conn:
+        version = write_count(conn)
+    if version is None:
+        return _find_upcoming(today, days_ahead)
+    database = get_pool().database
+    upcoming = memo.get(database, version, today, days_ahead)
+    if upcoming is MISSING:
+        upcoming = _find_upcoming(today, days_ahead)
+        memo.put(database, version, today, days_ahead, upcoming)
+    # The memo keeps this list, so callers get their own copy
+    return list(upcoming)
+
+
+def _find_upcoming(today, days_ahead):
+    """Compute get_upcoming_birthdays from the calendar index or the month_day index"""
+    calendar = get_calendar_index()
+    if calendar is not None:
+        return calendar.upcoming(today, days_ahead)
+    
+    # Only rows whose month_day falls inside the window leave SQLite; the
+    # ranges already account for the year-end wraparound and Feb 29
+    where, params = month_day_filter(today, days_ahead)
+    
+    with get_db_connection() as conn, instrumentation.span('get_upcoming_birthdays.sql'):
         c = conn.cursor()
-        c.execute('SELECT * FROM cakeday ORDER BY name')
+        c.execute(f'SELECT name, birthday, month, day FROM cakeday WHERE {where}', params)
         records = c.fetchall()
     
-    for record in records:
-        name, birthday, notification, adv_days = record
-        month, day = map(int, birthday.split('-'))
-        
-        # Calculate this year's birthday
-        try:
-            this_year_birthday = datetime(current_year, month, day)
-        except ValueError:
-            # Handle leap year case (Feb 29)
-            if month == 2 and day == 29:
-                this_year_birthday = datetime(current_year, 2, 28)
-            else:
-                continue
-        
-        # If this year's birthday has passed, use next year's
-        if this_year_birthday < today:
-            try:
-                next_year_birthday = datetime(current_year + 1, month, day)
-            except ValueError:
-                # Handle leap year case (Feb 29)
-                if month == 2 and day == 29:
-                    next_year_birthday = datetime(current_year + 1, 2, 28)
-                else:
-                    continue
-            birthday_date = next_year_birthday
-        else:
-            birthday_date = this_year_birthday
-        
-        # Calculate days until birthday
-        days_until = (birthday_date - today).days
-        
-        # Include if within the specified days ahead
-        if 0 <= days_until <= days_ahead:
-            upcoming.append((name, birthday, days_until, birthday_date))
+    with instrumentation.span('get_upcoming_birthdays.dates'):
+        upcoming = upcoming_from_records(records, today, days_ahead)
     
-    # Sort by days until birthday
-    upcoming.sort(key=lambda x: x[2])
+    return upcoming
+
+
+def upcoming_from_records(records, today, days_ahead):
+    """Return (name, birthday, days_until, birthday_date) for records due within days_ahead, by date then name
+
+    records are (name, birthday, month, day) rows.
+    """
+    upcoming = []
+    # Rows share a few hundred distinct birthdays: date each one once and
+    # reuse its days_until and datetime for every row with it
+    occurrences = {}
+    for name, birthday, month, day in records:
+        occurrence = occurrences.get(birthday, MISSING)
+        if occurrence is MISSING:
+            birthday_date = next_occurrence(month, day, today)
+            # Include if within the specified days ahead
+            if birthday_date is not None and 0 <= (birthday_date - today).days <= days_ahead:
+                occurrence = ((birthday_date - today).days, birthday_date)
+            else:
+                occurrence = None
+            occurrences[birthday] = occurrence
+        if occurrence is not None:
+            upcoming.append((name, birthday, occurrence[0], occurrence[1]))
     
+    # Sort by days until birthday, then by name (two stable sorts need no key tuples)
+    upcoming.sort(key=itemgetter(0))
+    upcoming.sort(key=itemgetter(2))
     return upcoming
+
+
+def get_upcoming_birthdays_for_tenants(days_ahead=30, tenants=None):
+    """Fan get_upcoming_birthdays out to every tenant's shard and merge the results
+
+    Returns (tenant, name, birthday, days_until, birthday_date) sorted by
+    days until, then name, then tenant. tenants defaults to list_tenants().
+    """
+    results = for_each_tenant(get_upcoming_birthdays, days_ahead, tenants=tenants)
+    tagged = ([(tenant, *row) for row in rows] for tenant, rows in results.items())
+    return list(heapq.merge(*tagged, key=lambda row: (row[3], row[1], row[0])))
@@ -0,0 +1,120 @@
+import heapq
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
+from datetime import datetime
+from urllib.request import pathname2url
+
+from notifications import due_from_connection
+from operations import get_pool, month_day_filter, shard_path, upcoming_from_records
+
+
+# Below this many rows per task the scan runs in the calling process
+MIN_ROWS_PER_TASK = 10000
+TASKS_PER_WORKER = 4
+
+
+def connect_read_only(path):
+    """Open path read-only with a busy timeout and a memory map, as a scan worker does"""
+    conn = sqlite3.connect(f"file:{pathname2url(os.path.abspath(path))}?mode=ro", uri=True)
+    conn.execute('PRAGMA busy_timeout = 5000')
+    conn.execute('PRAGMA mmap_size = 268435456')
+    return conn
+
+
+def row_ranges(path, parts):
+    """Split path's cakeday rowids into at most parts contiguous (low, high) ranges"""
+    with closing(connect_read_only(path)) as conn:
+        low, high = conn.execute('SELECT MIN(rowid), MAX(rowid) FROM cakeday').fetchone()
+    if low is None:
+        return []
+    step = -(-(high - low + 1) // max(1, parts))
+    return [(start, min(start + step - 1, high)) for start in range(low, high + 1, step)]
+
+
+def _upcoming_task(tenant, path, rowid_range, today, days_ahead):
+    """Worker: upcoming birthdays among one rowid range, tagged with tenant and sorted"""
+    where, params = month_day_filter(today, days_ahead)
+    with closing(connect_read_only(path)) as conn:
+        records = conn.execute(f'SELECT name, birthday, month, day FROM cakeday WHERE ({where}) AND rowid BETWEEN ? AND ?',
+                               [*params, *rowid_range]).fetchall()
+    return [(tenant, *row) for row in upcoming_from_records(records, today, days_ahead)]
+
+
+def _due_task(tenant, path, rowid_range, start, end):
+    """Worker: due notices among one rowid range, tagged with tenant and sorted"""
+    with closing(connect_read_only(path)) as conn:
+        due = list(due_from_connection(conn, start, end, rowid_range=rowid_range))
+    due.sort(key=lambda notice: (notice.notice_date, notice.name))
+    return [(tenant, notice) for notice in due]
+
+
+def _plan(tenants, workers, min_rows_per_task):
+    """Return (tenant, path, rowid range) tasks covering the default database or each tenant's shard"""
+    sources = [(None, get_pool().database)] if tenants is None else [(tenant, shard_path(tenant)) for tenant in tenants]
+    if any(path == ':memory:' or 'mode=memory' in path for _, path in sources):
+        raise ValueError("An in-memory database cannot be scanned from other processes")
+    tasks = []
+    for tenant, path in sources:
+        if not os.path.exists(path):
+            continue
+        with closing(connect_read_only(path)) as conn:
+            rows = conn.execute('SELECT MAX(rowid) - MIN(rowid) + 1 FROM cakeday').fetchone()[0] or 0
+        parts = min(workers * TASKS_PER_WORKER, max(1, rows // max(1, min_rows_per_task)))
+        tasks.extend((tenant, path, rowid_range) for rowid_range in row_ranges(path, parts))
+    return tasks
+
+
+def _run(task, tasks, args, workers, key):
+    """Run task over every (tenant, path, range) on a process pool and k-way merge the sorted parts"""
+    if len(tasks) <= 1:
+        parts = [task(*spec, *args) for spec in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as executor:
+            futures = [executor.submit(task, *spec, *args) for spec in tasks]
+            parts = [future.result() for future in futures]
+    return list(heapq.merge(*parts, key=key))
+
+
+def _today():
+    return datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def parallel_upcoming(days_ahead=30, today=None, tenants=None, workers=None, min_rows_per_task=MIN_ROWS_PER_TASK):
+    """get_upcoming_birthdays split by rowid range (and shard) across a process pool
+
+    Each worker opens its own read-only connection and sorts its part; the
+    parts are heap-merged. Without tenants the default database is scanned
+    and rows match get_upcoming_birthdays. With a list of tenants rows are
+    (tenant, name, birthday, days_until, birthday_date), as from
+    get_upcoming_birthdays_for_tenants.
+    """
+    workers = workers or os.cpu_count() or 1
+    today = (today or _today()).replace(hour=0, minute=0, second=0, microsecond=0)
+    tasks = _plan(tenants, workers, min_rows_per_task)
+    merged = _run(_upcoming_task, tasks, (today, days_ahead), workers, key=lambda row: (row[3], row[1], row[0] or ''))
+    if tenants is None:
+        return [row[1:] for row in merged]
+    return merged
+
+
+def parallel_due_notifications(start=None, end=None, tenants=None, workers=None,
+                               min_rows_per_task=MIN_ROWS_PER_TASK):
+    """get_due_notifications split by rowid range (and shard) across a process pool
+
+    Without tenants returns DueNotification rows sorted by notice date then
+    name, matching get_due_notifications; with a list of tenants returns
+    (tenant, DueNotification) pairs.
+    """
+    workers = workers or os.cpu_count() or 1
+    start = start or _today()
+    end = end or start
+    if end < start:
+        return []
+    tasks = _plan(tenants, workers, min_rows_per_task)
+    merged = _run(_due_task, tasks, (start, end), workers,
+                  key=lambda item: (item[1].notice_date, item[1].name, item[0] or ''))
+    if tenants is None:
+        return [notice for _, notice in merged]
+    return merged
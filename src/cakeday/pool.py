@@ -0,0 +1,215 @@
+import queue
+import random
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from functools import wraps
+
+
+# PRAGMA settings applied to every new connection. busy_timeout is in
+# milliseconds, mmap_size in bytes, and a negative cache_size is in KiB.
+ConnectionProfile = namedtuple('ConnectionProfile',
+                               ['journal_mode', 'synchronous', 'busy_timeout', 'mmap_size', 'cache_size'])
+
+# WAL lets readers run alongside a writer; synchronous=NORMAL is durable
+# across application crashes in WAL mode and only fsyncs at checkpoints
+DEFAULT_PROFILE = ConnectionProfile(journal_mode='wal', synchronous='normal', busy_timeout=5000,
+                                    mmap_size=256 * 1024 * 1024, cache_size=-16000)
+
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection becomes free in time"""
+
+
+def is_busy(error):
+    """Return True if a sqlite3 error means another connection held a conflicting lock"""
+    code = getattr(error, 'sqlite_errorcode', None)
+    if code is not None:
+        return code & 0xff in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+    message = str(error)
+    return 'locked' in message or 'busy' in message
+
+
+def retry_on_busy(attempts=5, base_delay=0.05, max_delay=2.0, sleep=time.sleep):
+    """Decorator re-running a write transaction that failed with "database is locked"
+
+    busy_timeout already waits for locks, but a WAL reader that tries to
+    upgrade to a writer after another commit fails at once (SQLITE_BUSY
+    snapshot). The wrapped function must roll back before raising so it can
+    simply be run again. Waits use full jitter so colliding writers spread
+    out instead of retrying in lockstep.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            for attempt in range(attempts):
+                try:
+                    return func(*args, **kwargs)
+                except sqlite3.OperationalError as e:
+                    if attempt == attempts - 1 or not is_busy(e):
+                        raise
+                    sleep(random.uniform(0, min(max_delay, base_delay * 2 ** attempt)))
+        return wrapper
+    return decorator
+
+
+class ConnectionPool:
+    """A bounded pool of long-lived SQLite connections
+
+    Each thread holds on to the connection it checked out until its
+    outermost checkout ends, so nested helpers (e.g. create calling
+    get_by_name) share one connection instead of opening a second one.
+    Connections keep sqlite3's prepared statement cache warm between calls
+    and are set up with the given ConnectionProfile (None keeps SQLite's
+    defaults).
+    """
+
+    def __init__(self, database, size=5, timeout=5.0, cached_statements=256,
+                 health_check_interval=30.0, profile=DEFAULT_PROFILE):
+        self.database = database
+        self.size = size
+        self.timeout = timeout
+        self.cached_statements = cached_statements
+        self.health_check_interval = health_check_interval
+        self.profile = profile
+        # opened counts every connection ever made; open is how many are not yet closed
+        self.opened = 0
+        self.open = 0
+        self._count_lock = threading.Lock()
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._local = threading.local()
+        self._closed = False
+
+    def _connect(self):
+        """Open a new connection that may be handed between threads"""
+        conn = sqlite3.connect(self.database, check_same_thread=False,
+                               cached_statements=self.cached_statements, uri=self.database.startswith('file:'))
+        if self.profile is not None:
+            self.apply_profile(conn, self.profile)
+        with self._count_lock:
+            self.opened += 1
+            self.open += 1
+        return conn
+
+    @staticmethod
+    def apply_profile(conn, profile):
+        """Apply a ConnectionProfile's PRAGMAs to conn"""
+        # busy_timeout goes first so switching to WAL waits out other connections
+        conn.execute(f'PRAGMA busy_timeout = {int(profile.busy_timeout)}')
+        conn.execute(f'PRAGMA journal_mode = {profile.journal_mode}')
+        conn.execute(f'PRAGMA synchronous = {profile.synchronous}')
+        conn.execute(f'PRAGMA mmap_size = {int(profile.mmap_size)}')
+        conn.execute(f'PRAGMA cache_size = {int(profile.cache_size)}')
+
+    @staticmethod
+    def is_healthy(conn):
+        """Return True if conn can still run a trivial query"""
+        try:
+            conn.execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _checkout(self):
+        """Take an idle connection (checking it if it sat idle too long) or open one"""
+        try:
+            conn, idle_since = self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+
+        if time.monotonic() - idle_since >= self.health_check_interval and not self.is_healthy(conn):
+            self._discard(conn)
+            return self._connect()
+        return conn
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._count_lock:
+            self.open -= 1
+
+    def acquire(self):
+        """Check out this thread's connection, waiting up to timeout for a free slot"""
+        if self._closed:
+            raise PoolTimeout("Connection pool is closed")
+
+        depth = getattr(self._local, 'depth', 0)
+        if depth:
+            self._local.depth = depth + 1
+            return self._local.conn
+
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolTimeout(f"No database connection free after {self.timeout}s (pool size {self.size})")
+        try:
+            conn = self._checkout()
+        except Exception:
+            self._slots.release()
+            raise
+
+        self._local.conn = conn
+        self._local.depth = 1
+        return conn
+
+    def release(self):
+        """Return this thread's connection to the pool once its outermost checkout ends"""
+        self._local.depth -= 1
+        if self._local.depth:
+            return
+
+        conn = self._local.conn
+        self._local.conn = None
+        try:
+            # Never hand the next caller someone else's half-finished transaction
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+        else:
+            if self._closed:
+                self._discard(conn)
+            else:
+                self._idle.put((conn, time.monotonic()))
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        """Context manager that checks a connection out and back in"""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release()
+
+    def health_check(self):
+        """Check every idle connection, replacing broken ones; return how many were replaced"""
+        replaced = 0
+        checked = []
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            if not self.is_healthy(conn):
+                self._discard(conn)
+                conn = self._connect()
+                replaced += 1
+            checked.append((conn, time.monotonic()))
+        for item in checked:
+            self._idle.put(item)
+        return replaced
+
+    def close(self):
+        """Close all idle connections; checked-out ones are closed when released"""
+        self._closed = True
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
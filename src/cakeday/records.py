@@ -0,0 +1,208 @@
+from array import array
+from operator import attrgetter
+
+
+def parse_month_day(birthday):
+    """Return (month, day) integers for a mm-dd birthday, or (None, None) if it is malformed"""
+    try:
+        return int(birthday[:2]), int(birthday[3:5])
+    except (TypeError, ValueError):
+        return None, None
+
+
+# The fields a Birthday holds as tuple items, in order
+ITEM_FIELDS = ('name', 'birthday', 'notification', 'adv_days')
+
+
+class Birthday:
+    """One read-only record with its birthday's month and day
+
+    Behaves as the (name, birthday, notification, adv_days) tuple it replaces:
+    it unpacks, indexes, hashes and compares equal to that tuple, and like a
+    tuple it cannot be changed, so the read cache can hand out the same
+    instance. month and day are extra attributes, not items; reads pass the
+    table's stored columns, and the birthday is parsed only when they are
+    left out. __slots__ keeps it smaller than the tuple plus a per-instance
+    dict.
+    """
+
+    __slots__ = (*ITEM_FIELDS, 'month', 'day')
+
+    def __init__(self, name, birthday, notification, adv_days, month=None, day=None):
+        if month is None:
+            month, day = parse_month_day(birthday)
+        for field, value in zip(self.__slots__, (name, birthday, notification, adv_days, month, day)):
+            object.__setattr__(self, field, value)
+
+    def __setattr__(self, field, value):
+        raise AttributeError(f"Birthday records are read-only (cannot set {field!r})")
+
+    def __delattr__(self, field):
+        raise AttributeError(f"Birthday records are read-only (cannot delete {field!r})")
+
+    @property
+    def notify(self):
+        """True when the record opted in to advance notifications"""
+        return self.notification in ('y', 'yes')
+
+    @property
+    def month_day(self):
+        """Birthday as its mmdd integer key, or None if malformed"""
+        return None if self.month is None else self.month * 100 + self.day
+
+    def _astuple(self):
+        return (self.name, self.birthday, self.notification, self.adv_days)
+
+    def __len__(self):
+        return 4
+
+    def __iter__(self):
+        yield self.name
+        yield self.birthday
+        yield self.notification
+        yield self.adv_days
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self._astuple()[index]
+        return ITEM_GETTERS[index](self)
+
+    def __eq__(self, other):
+        if isinstance(other, Birthday):
+            return self._astuple() == other._astuple()
+        if isinstance(other, tuple):
+            return self._astuple() == other
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self._astuple())
+
+    def __lt__(self, other):
+        if isinstance(other, (Birthday, tuple)):
+            return self._astuple() < tuple(other)
+        return NotImplemented
+
+    def __reduce__(self):
+        return (Birthday, (self.name, self.birthday, self.notification, self.adv_days, self.month, self.day))
+
+    def __repr__(self):
+        return (f"Birthday(name={self.name!r}, birthday={self.birthday!r}, "
+                f"notification={self.notification!r}, adv_days={self.adv_days!r})")
+
+
+# Read one item's slot without building the whole tuple
+ITEM_GETTERS = tuple(attrgetter(field) for field in ITEM_FIELDS)
+
+
+def birthday_factory(cursor, row):
+    """sqlite3 row factory building a Birthday from a (name, birthday, notification, adv_days[, month, day]) row"""
+    return Birthday(*row)
+
+
+class _Column:
+    """Dictionary-encoded column: one small integer code per row into a list of distinct values"""
+
+    __slots__ = ('values', 'codes', '_index')
+
+    def __init__(self, values=None, codes=None):
+        self.values = values if values is not None else []
+        self.codes = codes if codes is not None else array('I')
+        self._index = {value: code for code, value in enumerate(self.values)}
+
+    def append(self, value):
+        code = self._index.get(value)
+        if code is None:
+            code = self._index[value] = len(self.values)
+            self.values.append(value)
+        self.codes.append(code)
+
+    def __getitem__(self, i):
+        return self.values[self.codes[i]]
+
+
+class BirthdayList:
+    """A memory-efficient, read-mostly sequence of Birthday records stored column by column
+
+    Names are kept in a list. Birthday, notification and adv_days are
+    dictionary-encoded as 4-byte codes, because a table only holds a few
+    hundred distinct values for each. Month and day are kept once per
+    distinct birthday, taken from the row when it carries them. Items are
+    built as Birthday objects on access.
+    The list compares equal to any sequence of equal records, including a
+    list of tuples.
+    """
+
+    __slots__ = ('names', '_birthdays', '_notifications', '_adv_days', '_parsed')
+
+    def __init__(self, rows=()):
+        self.names = []
+        self._birthdays = _Column()
+        self._notifications = _Column()
+        self._adv_days = _Column()
+        self._parsed = []
+        self.extend(rows)
+
+    def append(self, row):
+        """Add one (name, birthday, notification, adv_days[, month, day]) row or Birthday"""
+        if isinstance(row, Birthday):
+            name, birthday, notification, adv_days = row
+            month_day = (row.month, row.day)
+        elif len(row) > 4:
+            name, birthday, notification, adv_days, *month_day = row
+        else:
+            name, birthday, notification, adv_days = row
+            month_day = None
+        self.names.append(name)
+        distinct = len(self._birthdays.values)
+        self._birthdays.append(birthday)
+        if len(self._birthdays.values) > distinct:
+            self._parsed.append(tuple(month_day) if month_day is not None else parse_month_day(birthday))
+        self._notifications.append(notification)
+        self._adv_days.append(adv_days)
+
+    def extend(self, rows):
+        """Add every row of an iterable"""
+        for row in rows:
+            self.append(row)
+
+    def copy(self):
+        """Return an independent copy sharing the (immutable) distinct values"""
+        records = BirthdayList()
+        records.names = list(self.names)
+        for attr in ('_birthdays', '_notifications', '_adv_days'):
+            column = getattr(self, attr)
+            setattr(records, attr, _Column(list(column.values), array('I', column.codes)))
+        records._parsed = list(self._parsed)
+        return records
+
+    def _record(self, i):
+        code = self._birthdays.codes[i]
+        month, day = self._parsed[code]
+        return Birthday(self.names[i], self._birthdays.values[code], self._notifications[i], self._adv_days[i],
+                        month, day)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return BirthdayList(self._record(i) for i in range(*index.indices(len(self))))
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('BirthdayList index out of range')
+        return self._record(index)
+
+    def __iter__(self):
+        for i in range(len(self.names)):
+            yield self._record(i)
+
+    def __eq__(self, other):
+        if not isinstance(other, (BirthdayList, list, tuple)):
+            return NotImplemented
+        return len(self) == len(other) and all(mine == theirs for mine, theirs in zip(self, other))
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"BirthdayList({list(self)!r})"
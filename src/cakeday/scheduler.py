@@ -0,0 +1,311 @@
+import heapq
+import logging
+import smtplib
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, time as time_of_day, timedelta
+
+from instrumentation import instrumented
+from notifications import (ADVANCE, DispatchResult, DueNotification, SMTPConnectionPool, claim_notifications,
+                           mark_sent, release_claims, render_message, settings_from_env)
+from operations import get_db_connection, get_zone, next_occurrence
+from pool import retry_on_busy
+
+
+DEFAULT_SEND_TIME = time_of_day(9, 0)
+# Notices kept in memory; the rest stay in the notice_at index until the heap drains
+DEFAULT_HORIZON = 1000
+# Longest sleep between checks for records added or changed by other processes
+DEFAULT_MAX_SLEEP = 60.0
+DEFAULT_RETRY_DELAY = 300
+DATE_FORMAT = '%Y-%m-%d'
+
+UNSCHEDULED_SQL = '''
+    SELECT s.name, c.month, c.day, c.adv_days, z.timezone
+    FROM notification_schedule s
+    JOIN cakeday c ON c.name = s.name
+    LEFT JOIN cakeday_timezones z ON z.name = s.name
+    WHERE s.notice_at IS NULL
+    LIMIT ?
+'''
+
+SCHEDULED_COLUMNS = 's.notice_at, s.name, c.birthday, c.adv_days, z.timezone, s.birthday_date, c.month, c.day'
+SCHEDULED_FROM = '''
+    FROM notification_schedule s
+    JOIN cakeday c ON c.name = s.name
+    LEFT JOIN cakeday_timezones z ON z.name = s.name
+'''
+
+log = logging.getLogger('cakeday.scheduler')
+
+# notice_at is a UTC epoch second; birthday_date is the recipient's local date as YYYY-MM-DD;
+# month and day are the record's stored birthday columns
+ScheduledNotice = namedtuple('ScheduledNotice', ['notice_at', 'name', 'birthday', 'adv_days', 'timezone',
+                                                 'birthday_date', 'month', 'day'])
+
+
+def local_today(now, zone):
+    """Return midnight of the date it is at epoch second now in zone (None: system local time), as a naive datetime"""
+    return datetime.fromtimestamp(now, zone).replace(tzinfo=None, hour=0, minute=0, second=0, microsecond=0)
+
+
+def notice_instant(notice_date, zone, send_time=DEFAULT_SEND_TIME):
+    """Return the epoch second of send_time on notice_date in zone
+
+    A send time skipped by a DST change falls an hour later; a repeated one
+    is taken at its first occurrence.
+    """
+    moment = datetime.combine(notice_date.date(), send_time)
+    if zone is not None:
+        moment = moment.replace(tzinfo=zone)
+    return int(moment.timestamp())
+
+
+def next_notice(month, day, adv_days, zone, on_or_after, send_time=DEFAULT_SEND_TIME):
+    """Return (notice_at, birthday_date) for the first notice dated on or after on_or_after, or None
+
+    Dates are the recipient's local dates in zone. Feb 29 birthdays fall on
+    Feb 28 in non-leap years, as in get_upcoming_birthdays.
+    """
+    birthday_date = next_occurrence(month, day, on_or_after + timedelta(days=adv_days))
+    if birthday_date is None:
+        return None
+    return notice_instant(birthday_date - timedelta(days=adv_days), zone, send_time), birthday_date
+
+
+def _zone(name, default_zone):
+    """Return the zone a record's notices use, falling back to default_zone for unknown names"""
+    if not name:
+        return default_zone
+    try:
+        return get_zone(name)
+    except ValueError:
+        log.warning("Unknown time zone %r; using the default", name)
+        return default_zone
+
+
+@retry_on_busy()
+def _schedule_batch(now, send_time, default_zone, batch_size):
+    """Compute notice_at for up to batch_size unscheduled records in one transaction; return how many"""
+    with get_db_connection() as conn:
+        if conn.execute('SELECT 1 FROM notification_schedule WHERE notice_at IS NULL LIMIT 1').fetchone() is None:
+            return 0
+        # Take the write lock first so a concurrent write cannot reset a row between the read and the update
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            rows = conn.execute(UNSCHEDULED_SQL, (batch_size,)).fetchall()
+            updates, invalid = [], []
+            for name, month, day, adv_days, zone_name in rows:
+                zone = _zone(zone_name, default_zone)
+                notice = next_notice(month, day, adv_days, zone, local_today(now, zone), send_time)
+                if notice is None:
+                    invalid.append((name,))
+                else:
+                    notice_at, birthday_date = notice
+                    updates.append((notice_at, birthday_date.strftime(DATE_FORMAT), name))
+            conn.executemany('UPDATE notification_schedule SET notice_at = ?, birthday_date = ? WHERE name = ?',
+                             updates)
+            conn.executemany('DELETE FROM notification_schedule WHERE name = ?', invalid)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+    return len(rows)
+
+
+@instrumented(rows=lambda count: count)
+def refresh_schedule(now=None, send_time=DEFAULT_SEND_TIME, default_zone=None, batch_size=1000):
+    """Compute the next notice of every record added or changed since the last refresh; return how many
+
+    Triggers leave notice_at NULL after a write, and NULLs sort first in
+    the notice_at index, so with nothing to do this is one index probe and
+    takes no write lock.
+    """
+    now = time.time() if now is None else now
+    scheduled = 0
+    while True:
+        count = _schedule_batch(now, send_time, default_zone, batch_size)
+        scheduled += count
+        if count < batch_size:
+            return scheduled
+
+
+def get_schedule(limit=DEFAULT_HORIZON, until=None):
+    """Return the soonest limit scheduled notices (up to epoch second until), by notice_at then name"""
+    where, params = 's.notice_at IS NOT NULL', []
+    if until is not None:
+        where, params = 's.notice_at <= ?', [until]
+    with get_db_connection() as conn:
+        rows = conn.execute(f'SELECT {SCHEDULED_COLUMNS} {SCHEDULED_FROM} WHERE {where} '
+                            'ORDER BY s.notice_at, s.name LIMIT ?', [*params, limit]).fetchall()
+    return [ScheduledNotice(*row) for row in rows]
+
+
+def _still_scheduled(entries, chunk_size=500):
+    """Return the entries whose schedule row is unchanged since they were read"""
+    current = set()
+    with get_db_connection() as conn:
+        for i in range(0, len(entries), chunk_size):
+            names = [entry.name for entry in entries[i:i + chunk_size]]
+            current.update(conn.execute(
+                'SELECT name, notice_at, birthday_date FROM notification_schedule '
+                f'WHERE name IN ({", ".join("?" * len(names))})', names).fetchall())
+    return [entry for entry in entries if (entry.name, entry.notice_at, entry.birthday_date) in current]
+
+
+@retry_on_busy()
+def _reschedule(moves):
+    """Move each (entry, new entry) pair's row to the new notice, skipping rows changed meanwhile"""
+    if not moves:
+        return
+    with get_db_connection() as conn:
+        conn.executemany('UPDATE notification_schedule SET notice_at = ?, birthday_date = ? '
+                         'WHERE name = ? AND notice_at = ?',
+                         [(new.notice_at, new.birthday_date, old.name, old.notice_at) for old, new in moves])
+        conn.commit()
+
+
+class NotificationScheduler:
+    """Send each advance notice at send_time on its notice date, in the recipient's time zone
+
+    Every opted-in record has a row in notification_schedule holding the
+    UTC instant of its next notice. The scheduler keeps the soonest horizon
+    of them in a min-heap and sleeps until the head is due, waking at least
+    every max_sleep seconds to schedule records written by other
+    processes. Due entries are re-read from the table before sending, so
+    records deleted or changed since they were loaded are not sent.
+    Deliveries are claimed in the sent_notifications ledger like
+    notifications.dispatch(), so the two never send the same reminder
+    twice. Failed sends are retried after retry_delay seconds. Notices for
+    birthdays that already passed (e.g. after downtime) are skipped.
+    Records without a time zone use default_zone (an IANA name or a
+    ZoneInfo; None is the system's local time).
+    """
+
+    def __init__(self, settings=None, send_time=DEFAULT_SEND_TIME, default_zone=None, horizon=DEFAULT_HORIZON,
+                 max_sleep=DEFAULT_MAX_SLEEP, retry_delay=DEFAULT_RETRY_DELAY, pool_size=4,
+                 smtp_factory=smtplib.SMTP, kind=ADVANCE, clock=time.time):
+        self.settings = settings or settings_from_env()
+        self.send_time = send_time
+        self.default_zone = get_zone(default_zone) if isinstance(default_zone, str) else default_zone
+        self.horizon = horizon
+        self.max_sleep = max_sleep
+        self.retry_delay = retry_delay
+        self.kind = kind
+        self.clock = clock
+        self._pool = SMTPConnectionPool(self.settings, size=pool_size, smtp_factory=smtp_factory)
+        self._heap = []
+        # notice_at of the last loaded entry when the heap was cut off at horizon, else None
+        self._horizon_end = None
+        self._loaded = False
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+
+    def reload(self):
+        """Read the soonest horizon notices from the notice_at index into the heap"""
+        rows = get_schedule(self.horizon)
+        # Rows arrive sorted, which is already a valid heap
+        self._heap = rows
+        self._horizon_end = rows[-1].notice_at if len(rows) == self.horizon else None
+        self._loaded = True
+
+    def next_wakeup(self):
+        """Return the epoch second the soonest loaded notice is due, or None"""
+        return self._heap[0].notice_at if self._heap else None
+
+    def _push(self, entry):
+        if self._horizon_end is None or entry.notice_at <= self._horizon_end:
+            heapq.heappush(self._heap, entry)
+
+    def _pop_due(self, now):
+        due = []
+        while self._heap and self._heap[0].notice_at <= now:
+            due.append(heapq.heappop(self._heap))
+        # Records deleted or changed since the heap was loaded are left out
+        return _still_scheduled(due) if due else []
+
+    def run_once(self):
+        """Schedule new or changed records, then send every notice that is due; return a DispatchResult"""
+        now = self.clock()
+        scheduled = refresh_schedule(now, self.send_time, self.default_zone)
+        if scheduled or not self._loaded or (not self._heap and self._horizon_end is not None):
+            self.reload()
+        due = self._pop_due(now)
+        if not due:
+            return DispatchResult(0, [], 0)
+
+        pending, moves = [], []
+        for entry in due:
+            zone = _zone(entry.timezone, self.default_zone)
+            birthday_date = datetime.strptime(entry.birthday_date, DATE_FORMAT)
+            if birthday_date < local_today(now, zone):
+                moves.append((entry, self._advance(entry, zone)))
+            else:
+                notice = DueNotification(entry.name, entry.birthday, entry.adv_days, birthday_date,
+                                         birthday_date - timedelta(days=entry.adv_days))
+                pending.append((entry, zone, notice))
+        stale = len(moves)
+
+        claimed = claim_notifications([notice for _, _, notice in pending], self.kind)
+        messages = [render_message(notice, self.settings) for notice in claimed]
+        notices = {id(message): notice for message, notice in zip(messages, claimed)}
+        sent, failed = self._pool.send_all(messages)
+        failed_notices = [notices[id(message)] for message, _ in failed]
+        failed_names = {notice.name for notice in failed_notices}
+        mark_sent([notice for notice in claimed if notice.name not in failed_names], self.kind)
+        release_claims(failed_notices, self.kind)
+
+        for entry, zone, notice in pending:
+            if entry.name in failed_names:
+                moves.append((entry, entry._replace(notice_at=int(now + self.retry_delay))))
+            else:
+                # Sent now, or already sent or claimed by another run
+                moves.append((entry, self._advance(entry, zone)))
+        moves = [(entry, moved) for entry, moved in moves if moved is not None]
+        _reschedule(moves)
+        for _, moved in moves:
+            self._push(moved)
+
+        return DispatchResult(sent, [(notices[id(message)].name, error) for message, error in failed],
+                              len(pending) - len(claimed) + stale)
+
+    def _advance(self, entry, zone):
+        """Return entry moved to the notice for the following birthday, or None if there is none"""
+        birthday_date = datetime.strptime(entry.birthday_date, DATE_FORMAT)
+        on_or_after = birthday_date - timedelta(days=entry.adv_days - 1)
+        notice = next_notice(entry.month, entry.day, entry.adv_days, zone, on_or_after, self.send_time)
+        if notice is None:
+            return None
+        return entry._replace(notice_at=notice[0], birthday_date=notice[1].strftime(DATE_FORMAT))
+
+    def run(self):
+        """Deliver notices as they fall due until stop() is called"""
+        try:
+            while not self._stopped.is_set():
+                try:
+                    result = self.run_once()
+                except Exception:
+                    log.exception("Scheduler run failed")
+                else:
+                    for name, error in result.failed:
+                        log.warning("Error sending reminder for %s: %s", name, error)
+                wakeup = self.next_wakeup()
+                delay = self.max_sleep if wakeup is None else min(max(wakeup - self.clock(), 0), self.max_sleep)
+                self._wake.wait(delay)
+                self._wake.clear()
+        finally:
+            self.close()
+
+    def wake(self):
+        """Check for due and changed records now instead of at the next wake-up"""
+        self._wake.set()
+
+    def stop(self):
+        """Make run() return after the current pass"""
+        self._stopped.set()
+        self._wake.set()
+
+    def close(self):
+        """Quit idle SMTP connections"""
+        self._pool.close()
@@ -0,0 +1,255 @@
+import json
+import logging
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import instrumentation
+from changes import ChangeFeedError, get_changes
+from operations import (RECORD_FIELDS, UPCOMING_FIELDS, add_birthdays, delete_birthdays, enable_cache,
+                        enable_calendar_index, enable_upcoming_cache, get_all, get_by_name, get_page,
+                        get_upcoming_birthdays, search_names, shard_path, update_birthdays, use_tenant)
+
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8625
+MAX_BODY_BYTES = 16 * 1024 * 1024
+MAX_BATCH_REQUESTS = 1000
+MAX_CHANGES = 10000
+TENANT_HEADER = 'X-Cakeday-Tenant'
+
+log = logging.getLogger('cakeday.server')
+
+
+class ApiError(Exception):
+    """An error answered with an HTTP status and a JSON {"error": message} body"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _record(row):
+    return dict(zip(RECORD_FIELDS, row))
+
+
+def _upcoming(row):
+    name, birthday, days_until, birthday_date = row
+    return dict(zip(UPCOMING_FIELDS, (name, birthday, days_until, f"{birthday_date:%Y-%m-%d}")))
+
+
+def _batch_result(result):
+    return {'succeeded': result.succeeded, 'failed': [{'name': name, 'error': error} for name, error in result.failed]}
+
+
+def _int_param(query, name, default):
+    values = query.get(name)
+    if not values:
+        return default
+    try:
+        return int(values[0])
+    except ValueError:
+        raise ApiError(HTTPStatus.BAD_REQUEST, f"{name} must be an integer") from None
+
+
+def _require_body(body):
+    if body is None:
+        raise ApiError(HTTPStatus.BAD_REQUEST, "A JSON request body is required")
+    return body
+
+
+def _require_items(body, single_type, item_types, description):
+    """Return body if it is one single_type or a list of item_types, else raise a 400 naming what was expected"""
+    body = _require_body(body)
+    if isinstance(body, single_type) or (isinstance(body, list) and all(isinstance(item, item_types) for item in body)):
+        return body
+    raise ApiError(HTTPStatus.BAD_REQUEST, f"Expected {description}")
+
+
+def handle(method, target, body=None):
+    """Answer one API request in the current tenant; return (status, JSON-able payload)
+
+    GET /birthdays (?after=, ?before=, ?limit= for one page), GET
+    /birthdays/<name>, GET /upcoming?days=, GET /search?q=&limit=, GET
+    /changes?since=&limit= (answered with {"changes", "cursor"}),
+    POST /birthdays, PATCH /birthdays[/<name>], DELETE /birthdays[/<name>]
+    and POST /batch, whose body is a list of {"method", "path", "body"}
+    requests answered in order as a list of {"status", "body"}.
+    """
+    url = urlsplit(target)
+    parts = [unquote(part) for part in url.path.strip('/').split('/')] if url.path.strip('/') else []
+    query = parse_qs(url.query)
+    resource = parts[0] if parts else ''
+    name = parts[1] if len(parts) == 2 else None
+    if len(parts) > 2:
+        raise ApiError(HTTPStatus.NOT_FOUND, f"No such resource {url.path}")
+
+    if resource == 'health' and method == 'GET':
+        return HTTPStatus.OK, {'status': 'ok'}
+
+    if resource == 'birthdays':
+        if method == 'GET' and name is not None:
+            record = get_by_name(name)
+            if not record:
+                raise ApiError(HTTPStatus.NOT_FOUND, f"No record found for {name}")
+            return HTTPStatus.OK, _record(record)
+        if method == 'GET':
+            if not any(key in query for key in ('after', 'before', 'limit')):
+                return HTTPStatus.OK, [_record(row) for row in get_all()]
+            rows = get_page(after=query.get('after', [None])[0], before=query.get('before', [None])[0],
+                            page_size=_int_param(query, 'limit', 20))
+            return HTTPStatus.OK, [_record(row) for row in rows]
+        if method == 'POST' and name is None:
+            records = _require_items(body, dict, (dict, list), "a record object or a list of record objects or arrays")
+            return HTTPStatus.OK, _batch_result(add_birthdays(records))
+        if method == 'PATCH':
+            changes = _require_items(body, dict, dict, "an object of fields to change or a list of them")
+            if name is not None:
+                if not isinstance(changes, dict):
+                    raise ApiError(HTTPStatus.BAD_REQUEST, "Expected a JSON object of fields to change")
+                changes = {**changes, 'name': name}
+            return HTTPStatus.OK, _batch_result(update_birthdays(changes))
+        if method == 'DELETE':
+            names = name if name is not None else _require_items(body, str, str, "a name or a list of names")
+            return HTTPStatus.OK, _batch_result(delete_birthdays(names))
+
+    elif resource == 'upcoming' and method == 'GET' and name is None:
+        return HTTPStatus.OK, [_upcoming(row) for row in get_upcoming_birthdays(_int_param(query, 'days', 30))]
+
+    elif resource == 'search' and method == 'GET' and name is None:
+        text = query.get('q', [''])[0]
+        if not text:
+            raise ApiError(HTTPStatus.BAD_REQUEST, "q is required")
+        return HTTPStatus.OK, [_record(row) for row in search_names(text, _int_param(query, 'limit', 10))]
+
+    elif resource == 'changes' and method == 'GET' and name is None:
+        since = _int_param(query, 'since', 0)
+        try:
+            feed = get_changes(since, min(_int_param(query, 'limit', 1000), MAX_CHANGES))
+        except ChangeFeedError as e:
+            raise ApiError(HTTPStatus.GONE, str(e)) from None
+        return HTTPStatus.OK, {'changes': [change._asdict() for change in feed],
+                               'cursor': feed[-1].seq if feed else since}
+
+    elif resource == 'batch' and method == 'POST' and name is None:
+        return HTTPStatus.OK, handle_batch(_require_body(body))
+
+    raise ApiError(HTTPStatus.NOT_FOUND, f"No route for {method} {url.path}")
+
+
+def handle_batch(requests):
+    """Answer a list of {"method", "path", "body"} requests in order, each independently"""
+    if not isinstance(requests, list):
+        raise ApiError(HTTPStatus.BAD_REQUEST, "A batch is a JSON list of requests")
+    if len(requests) > MAX_BATCH_REQUESTS:
+        raise ApiError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"At most {MAX_BATCH_REQUESTS} requests per batch")
+    responses = []
+    for request in requests:
+        if not isinstance(request, dict) or not isinstance(request.get('path'), str):
+            status, payload = HTTPStatus.BAD_REQUEST, {'error': "Each request needs a path"}
+        elif urlsplit(request['path']).path.strip('/') == 'batch':
+            status, payload = HTTPStatus.BAD_REQUEST, {'error': "Batches cannot be nested"}
+        else:
+            status, payload = answer(str(request.get('method', 'GET')).upper(), request['path'], request.get('body'))
+        responses.append({'status': int(status), 'body': payload})
+    return responses
+
+
+def answer(method, target, body=None):
+    """handle() with errors turned into (status, {"error": message})"""
+    try:
+        return handle(method, target, body)
+    except ApiError as e:
+        return e.status, {'error': str(e)}
+    except ValueError as e:
+        return HTTPStatus.BAD_REQUEST, {'error': str(e)}
+    except Exception:
+        log.exception("Error answering %s %s", method, target)
+        return HTTPStatus.INTERNAL_SERVER_ERROR, {'error': "Internal server error"}
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """JSON API handler; HTTP/1.1, so clients can keep one connection open for many requests"""
+
+    protocol_version = 'HTTP/1.1'
+    server_version = 'cakeday'
+    # Headers and body are written separately; don't let Nagle hold the body back
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self._dispatch()
+
+    def do_POST(self):
+        self._dispatch()
+
+    def do_PATCH(self):
+        self._dispatch()
+
+    def do_DELETE(self):
+        self._dispatch()
+
+    def _read_body(self):
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            # Without a usable length the body's end is unknown, so the connection cannot be reused
+            self.close_connection = True
+            raise ApiError(HTTPStatus.BAD_REQUEST, "Content-Length must be a non-negative integer")
+        if length > MAX_BODY_BYTES:
+            # The unread body would be taken for the next request
+            self.close_connection = True
+            raise ApiError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"Bodies are limited to {MAX_BODY_BYTES} bytes")
+        if not length:
+            return None
+        try:
+            return json.loads(self.rfile.read(length))
+        except ValueError:
+            raise ApiError(HTTPStatus.BAD_REQUEST, "Request body is not valid JSON") from None
+
+    def _dispatch(self):
+        try:
+            body = self._read_body()
+            tenant = self.headers.get(TENANT_HEADER) or self.server.tenant
+            if tenant is not None:
+                shard_path(tenant)
+        except (ApiError, ValueError) as e:
+            status, payload = getattr(e, 'status', HTTPStatus.BAD_REQUEST), {'error': str(e)}
+        else:
+            with use_tenant(tenant), instrumentation.span(f"http {self.command}"):
+                status, payload = answer(self.command, self.path, body)
+        self._send(status, payload)
+
+    def _send(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        if self.close_connection:
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        log.debug("%s - %s", self.address_string(), format % args)
+
+
+class CakedayServer(ThreadingHTTPServer):
+    """Threaded HTTP server answering the JSON API; requests without a tenant header use tenant"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, tenant=None):
+        super().__init__(address, RequestHandler)
+        self.tenant = tenant
+
+
+def make_server(host=DEFAULT_HOST, port=DEFAULT_PORT, tenant=None, cache=True):
+    """Create a server bound to host:port, keeping the read caches and calendar index on between requests"""
+    if cache:
+        enable_cache()
+        enable_calendar_index()
+        enable_upcoming_cache()
+    return CakedayServer((host, port), tenant)
@@ -0,0 +1,78 @@
+import os
+from collections import namedtuple
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DATABASE = os.path.normpath(os.path.join(HERE, '..', 'database', 'cakeday.db'))
+DEFAULT_SHARD_DIR = os.path.normpath(os.path.join(HERE, '..', 'database', 'tenants'))
+DEFAULT_CHECKPOINT_INTERVAL = 300.0
+
+# Searched in order when CAKEDAY_CONFIG is not set
+CONFIG_PATHS = ('cakeday.ini', os.path.join('~', '.config', 'cakeday', 'cakeday.ini'))
+TRUE_VALUES = ('1', 'y', 'yes', 'true', 'on')
+
+Settings = namedtuple('Settings', ['database', 'shard_dir', 'in_memory', 'checkpoint_interval'])
+
+
+def read_config(path):
+    """Return the [database] section of an INI config file as a dict"""
+    from configparser import ConfigParser
+    parser = ConfigParser()
+    with open(path) as f:
+        parser.read_file(f)
+    return dict(parser['database']) if parser.has_section('database') else {}
+
+
+def find_config(environ=os.environ):
+    """Return the config file to use: $CAKEDAY_CONFIG, else the first of CONFIG_PATHS that exists"""
+    if environ.get('CAKEDAY_CONFIG'):
+        return environ['CAKEDAY_CONFIG']
+    for path in CONFIG_PATHS:
+        path = os.path.expanduser(path)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def load_settings(environ=os.environ, config_path=None, **overrides):
+    """Resolve database settings: overrides (CLI flags) win over environment variables, then the config file
+
+    Environment variables are CAKEDAY_DB, CAKEDAY_SHARD_DIR,
+    CAKEDAY_IN_MEMORY and CAKEDAY_CHECKPOINT_INTERVAL; the config file's
+    [database] section takes path, shard_dir, in_memory and
+    checkpoint_interval. Relative paths in the config file are relative to
+    the file. Overrides that are None are ignored.
+    """
+    values = {}
+    config_path = config_path or find_config(environ)
+    if config_path:
+        config = read_config(config_path)
+        base = os.path.dirname(os.path.abspath(config_path))
+        for key, field in (('path', 'database'), ('shard_dir', 'shard_dir')):
+            if config.get(key):
+                values[field] = os.path.join(base, os.path.expanduser(config[key]))
+        for field in ('in_memory', 'checkpoint_interval'):
+            if config.get(field):
+                values[field] = config[field]
+
+    for variable, field in (('CAKEDAY_DB', 'database'), ('CAKEDAY_SHARD_DIR', 'shard_dir'),
+                            ('CAKEDAY_IN_MEMORY', 'in_memory'), ('CAKEDAY_CHECKPOINT_INTERVAL', 'checkpoint_interval')):
+        if environ.get(variable):
+            values[field] = environ[variable]
+
+    values.update((field, value) for field, value in overrides.items() if value is not None)
+
+    in_memory = values.get('in_memory', False)
+    if isinstance(in_memory, str):
+        in_memory = in_memory.strip().lower() in TRUE_VALUES
+    try:
+        checkpoint_interval = float(values.get('checkpoint_interval', DEFAULT_CHECKPOINT_INTERVAL))
+    except ValueError:
+        raise ValueError(f"Invalid checkpoint_interval {values['checkpoint_interval']!r}") from None
+
+    return Settings(
+        database=values.get('database', DEFAULT_DATABASE),
+        shard_dir=values.get('shard_dir', DEFAULT_SHARD_DIR),
+        in_memory=in_memory,
+        checkpoint_interval=checkpoint_interval,
+    )
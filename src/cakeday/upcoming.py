@@ -0,0 +1,132 @@
+import heapq
+from array import array
+from datetime import datetime, timedelta
+
+from operations import get_db_connection, next_occurrence
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# days_until for month_day values that never occur (e.g. 02-30) or are missing
+NEVER = 32767
+MONTH_DAY_SLOTS = 1232
+
+
+def days_until_table(start):
+    """Return a MONTH_DAY_SLOTS-long list mapping an mmdd integer to days from start to its next occurrence
+
+    Feb 29 maps to Feb 28 in non-leap years and the window wraps into the
+    next year, exactly as next_occurrence does.
+    """
+    table = [NEVER] * MONTH_DAY_SLOTS
+    for month in range(1, 13):
+        for day in range(1, 32):
+            occurrence = next_occurrence(month, day, start)
+            if occurrence is not None:
+                table[month * 100 + day] = (occurrence - start).days
+    return table
+
+
+class UpcomingEngine:
+    """Upcoming-birthday queries answered from month/day held in compact integer arrays
+
+    load() reads every record once; each query then turns a 1232-entry
+    days-until lookup table for its start date into days-until for every
+    row in one pass (a NumPy gather when NumPy is installed, otherwise an
+    `array` of shorts) and partially sorts only the rows it returns.
+    Reload after writes; the engine is a snapshot.
+    """
+
+    def __init__(self, names, birthdays, month_days, use_numpy=None):
+        self.names = list(names)
+        self.birthdays = list(birthdays)
+        self.use_numpy = np is not None if use_numpy is None else use_numpy
+        if self.use_numpy and np is None:
+            raise RuntimeError("NumPy is not installed")
+        if self.use_numpy:
+            self.month_days = np.array(month_days, dtype=np.int16)
+            # Ties on days_until break by name: rows are kept in name order
+            self._order = np.argsort(np.array(self.names, dtype=object), kind='stable')
+        else:
+            self.month_days = array('h', month_days)
+            self._order = sorted(range(len(self.names)), key=self.names.__getitem__)
+        self._tables = {}
+
+    @classmethod
+    def load(cls, use_numpy=None):
+        """Read every record's name and month/day into a new engine"""
+        names, birthdays, month_days = [], [], []
+        with get_db_connection() as conn:
+            c = conn.cursor()
+            c.execute('SELECT name, birthday, month * 100 + day FROM cakeday ORDER BY name')
+            while True:
+                rows = c.fetchmany(10000)
+                if not rows:
+                    break
+                for name, birthday, month_day in rows:
+                    names.append(name)
+                    birthdays.append(birthday)
+                    month_days.append(month_day if 0 < month_day < MONTH_DAY_SLOTS else 0)
+        return cls(names, birthdays, month_days, use_numpy)
+
+    def __len__(self):
+        return len(self.names)
+
+    def _table(self, start):
+        table = self._tables.get(start)
+        if table is None:
+            table = days_until_table(start)
+            if self.use_numpy:
+                table = np.array(table, dtype=np.int16)
+            # Only the most recent start dates are worth keeping
+            if len(self._tables) >= 8:
+                self._tables.clear()
+            self._tables[start] = table
+        return table
+
+    def days_until(self, start):
+        """Return days from start to every row's next birthday, NEVER for invalid dates"""
+        table = self._table(start)
+        if self.use_numpy:
+            return table[self.month_days]
+        return array('h', [table[month_day] for month_day in self.month_days])
+
+    def upcoming(self, days_ahead=30, start=None, limit=None):
+        """Return (name, birthday, days_until, birthday_date) rows due within days_ahead of start
+
+        Rows match get_upcoming_birthdays, sorted by days_until then name. With limit only the first limit rows
+        are selected (argpartition / heapq) before sorting.
+        """
+        start = (start or datetime.now()).replace(hour=0, minute=0, second=0, microsecond=0)
+        days_ahead = min(days_ahead, NEVER - 1)
+        if not self.names or days_ahead < 0:
+            return []
+        days = self.days_until(start)
+        if self.use_numpy:
+            indexes = self._select_numpy(days, days_ahead, limit)
+        else:
+            indexes = self._select_array(days, days_ahead, limit)
+        return [(self.names[i], self.birthdays[i], int(days[i]), start + timedelta(days=int(days[i])))
+                for i in indexes]
+
+    def _select_numpy(self, days, days_ahead, limit):
+        # Compose one int64 key per row: days_until first, name order second
+        order = self._order
+        ordered = days[order]
+        keys = ordered.astype(np.int64) * len(order) + np.arange(len(order))
+        keys = keys[ordered <= days_ahead]
+        if limit is not None and limit < len(keys):
+            keys = keys[np.argpartition(keys, limit - 1)[:limit]] if limit > 0 else keys[:0]
+        keys.sort()
+        return order[keys % len(order)].tolist()
+
+    def _select_array(self, days, days_ahead, limit):
+        candidates = [(days[i], rank) for rank, i in enumerate(self._order) if days[i] <= days_ahead]
+        if limit is not None and limit < len(candidates):
+            candidates = heapq.nsmallest(limit, candidates)
+        else:
+            candidates.sort()
+        return [self._order[rank] for _, rank in candidates]
@@ -1,7 +1,174 @@
-CREATE TABLE IF NOT EXISTS cakeday ( 
-    name TEXT PRIMARY KEY,
+-- Schema version 5; cakeday/migrations.py upgrades older databases in place.
+-- It also runs the "-- @section" parts below on their own, so this file is
+-- the only copy of the schema's DDL
+PRAGMA user_version = 5;
+
+-- @section cakeday
+
+-- birthday and notification are what callers write; month, day, month_day
+-- and notify are kept from them by SQLite so reads need no string parsing
+CREATE TABLE IF NOT EXISTS cakeday (
+    name TEXT PRIMARY KEY NOT NULL CHECK (length(name) > 0),
+    birthday TEXT NOT NULL CHECK (birthday GLOB '[0-9][0-9]-[0-9][0-9]'),
+    notification TEXT NOT NULL DEFAULT 'n' CHECK (notification IN ('y', 'yes', 'n', 'no')),
+    adv_days INTEGER NOT NULL DEFAULT 0 CHECK (adv_days >= 0),
+    month INTEGER GENERATED ALWAYS AS (CAST(substr(birthday, 1, 2) AS INTEGER)) STORED
+        CHECK (month BETWEEN 1 AND 12),
+    day INTEGER GENERATED ALWAYS AS (CAST(substr(birthday, 4, 2) AS INTEGER)) STORED
+        CHECK (day BETWEEN 1 AND CASE WHEN month = 2 THEN 29 WHEN month IN (4, 6, 9, 11) THEN 30 ELSE 31 END),
+    month_day INTEGER GENERATED ALWAYS AS (month * 100 + day) STORED,
+    notify INTEGER GENERATED ALWAYS AS (notification IN ('y', 'yes')) STORED
+);
+
+-- @section cakeday_indexes
+CREATE INDEX IF NOT EXISTS idx_cakeday_month_day ON cakeday (month_day);
+CREATE INDEX IF NOT EXISTS idx_cakeday_notice ON cakeday (adv_days, month_day);
+-- Case-insensitive prefix seeks for name search
+CREATE INDEX IF NOT EXISTS idx_cakeday_name_nocase ON cakeday (name COLLATE NOCASE);
+
+-- @section notification_tables
+-- One row per reminder; sent_at stays NULL while a run has it claimed
+CREATE TABLE IF NOT EXISTS sent_notifications (
+    name TEXT NOT NULL,
+    year INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    claimed_at TEXT NOT NULL,
+    sent_at TEXT,
+    PRIMARY KEY (name, year, kind)
+);
+
+-- Last notice date each kind of dispatch has fully covered
+CREATE TABLE IF NOT EXISTS notification_watermark (
+    kind TEXT PRIMARY KEY,
+    last_date TEXT NOT NULL
+);
+
+-- @section name_search
+-- Trigram index over names for substring, prefix and fuzzy search.
+-- It points at cakeday's rowids, so rebuild it after a VACUUM:
+--   INSERT INTO cakeday_fts (cakeday_fts) VALUES ('rebuild');
+CREATE VIRTUAL TABLE IF NOT EXISTS cakeday_fts USING fts5(
+    name,
+    content = 'cakeday',
+    content_rowid = 'rowid',
+    tokenize = 'trigram'
+);
+
+CREATE TRIGGER IF NOT EXISTS cakeday_fts_insert AFTER INSERT ON cakeday BEGIN
+    INSERT INTO cakeday_fts (rowid, name) VALUES (new.rowid, new.name);
+END;
+
+CREATE TRIGGER IF NOT EXISTS cakeday_fts_delete AFTER DELETE ON cakeday BEGIN
+    INSERT INTO cakeday_fts (cakeday_fts, rowid, name) VALUES ('delete', old.rowid, old.name);
+END;
+
+CREATE TRIGGER IF NOT EXISTS cakeday_fts_update AFTER UPDATE OF name ON cakeday BEGIN
+    INSERT INTO cakeday_fts (cakeday_fts, rowid, name) VALUES ('delete', old.rowid, old.name);
+    INSERT INTO cakeday_fts (rowid, name) VALUES (new.rowid, new.name);
+END;
+
+-- @section write_count
+-- Bumped by every write to cakeday from any connection, so result caches
+-- in other processes can tell whether their entries are still current
+CREATE TABLE IF NOT EXISTS cakeday_meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+
+INSERT OR IGNORE INTO cakeday_meta (key, value) VALUES ('write_count', 0);
+
+CREATE TRIGGER IF NOT EXISTS cakeday_count_insert AFTER INSERT ON cakeday BEGIN
+    UPDATE cakeday_meta SET value = value + 1 WHERE key = 'write_count';
+END;
+
+CREATE TRIGGER IF NOT EXISTS cakeday_count_update AFTER UPDATE ON cakeday BEGIN
+    UPDATE cakeday_meta SET value = value + 1 WHERE key = 'write_count';
+END;
+
+CREATE TRIGGER IF NOT EXISTS cakeday_count_delete AFTER DELETE ON cakeday BEGIN
+    UPDATE cakeday_meta SET value = value + 1 WHERE key = 'write_count';
+END;
+
+-- @section change_feed
+-- Change feed: one row per insert, update or delete of cakeday, in commit
+-- order. A rename is logged as a delete of the old name and an update of
+-- the new one; updates carry the whole new row. Updates that leave the
+-- row as it was are not logged
+CREATE TABLE IF NOT EXISTS cakeday_changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    op TEXT NOT NULL CHECK (op IN ('insert', 'update', 'delete')),
+    name TEXT NOT NULL,
     birthday TEXT,
     notification TEXT,
-    adv_days INTEGER
+    adv_days INTEGER,
+    changed_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))
+);
+
+INSERT OR IGNORE INTO cakeday_meta (key, value) VALUES ('changes_pruned', 0);
+
+CREATE TRIGGER IF NOT EXISTS cakeday_changes_insert AFTER INSERT ON cakeday BEGIN
+    INSERT INTO cakeday_changes (op, name, birthday, notification, adv_days)
+    VALUES ('insert', new.name, new.birthday, new.notification, new.adv_days);
+END;
+
+CREATE TRIGGER IF NOT EXISTS cakeday_changes_update AFTER UPDATE ON cakeday
+WHEN old.name IS NOT new.name OR old.birthday IS NOT new.birthday
+    OR old.notification IS NOT new.notification OR old.adv_days IS NOT new.adv_days BEGIN
+    INSERT INTO cakeday_changes (op, name) SELECT 'delete', old.name WHERE old.name <> new.name;
+    INSERT INTO cakeday_changes (op, name, birthday, notification, adv_days)
+    VALUES ('update', new.name, new.birthday, new.notification, new.adv_days);
+END;
+
+CREATE TRIGGER IF NOT EXISTS cakeday_changes_delete AFTER DELETE ON cakeday BEGIN
+    INSERT INTO cakeday_changes (op, name) VALUES ('delete', old.name);
+END;
+
+-- @section schedule
+-- IANA time zone each recipient's notices are sent in; names without a row
+-- use the scheduler's default. The next advance notice of every opted-in
+-- record is kept in notification_schedule: notice_at is its UTC epoch
+-- second and birthday_date the (recipient's local) birthday it announces.
+-- Writes that change a record or its zone reset its notice_at to NULL, and
+-- scheduler.py computes it again
+CREATE TABLE IF NOT EXISTS cakeday_timezones (
+    name TEXT PRIMARY KEY,
+    timezone TEXT NOT NULL
 );
 
+CREATE TABLE IF NOT EXISTS notification_schedule (
+    name TEXT PRIMARY KEY,
+    notice_at INTEGER,
+    birthday_date TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_notification_schedule_notice_at ON notification_schedule (notice_at);
+
+CREATE TRIGGER IF NOT EXISTS cakeday_schedule_insert AFTER INSERT ON cakeday WHEN new.notify BEGIN
+    INSERT OR REPLACE INTO notification_schedule (name) VALUES (new.name);
+END;
+
+CREATE TRIGGER IF NOT EXISTS cakeday_schedule_update
+AFTER UPDATE OF name, birthday, notification, adv_days ON cakeday
+WHEN old.name IS NOT new.name OR old.birthday IS NOT new.birthday
+    OR old.notification IS NOT new.notification OR old.adv_days IS NOT new.adv_days BEGIN
+    DELETE FROM notification_schedule WHERE name = old.name;
+    UPDATE cakeday_timezones SET name = new.name WHERE name = old.name AND old.name <> new.name;
+    INSERT OR REPLACE INTO notification_schedule (name) SELECT new.name WHERE new.notify;
+END;
+
+CREATE TRIGGER IF NOT EXISTS cakeday_schedule_delete AFTER DELETE ON cakeday BEGIN
+    DELETE FROM notification_schedule WHERE name = old.name;
+    DELETE FROM cakeday_timezones WHERE name = old.name;
+END;
+
+CREATE TRIGGER IF NOT EXISTS cakeday_timezones_insert AFTER INSERT ON cakeday_timezones BEGIN
+    INSERT OR REPLACE INTO notification_schedule (name) SELECT name FROM cakeday WHERE name = new.name AND notify;
+END;
+
+CREATE TRIGGER IF NOT EXISTS cakeday_timezones_update AFTER UPDATE ON cakeday_timezones BEGIN
+    INSERT OR REPLACE INTO notification_schedule (name) SELECT name FROM cakeday WHERE name = new.name AND notify;
+END;
+
+CREATE TRIGGER IF NOT EXISTS cakeday_timezones_delete AFTER DELETE ON cakeday_timezones BEGIN
+    INSERT OR REPLACE INTO notification_schedule (name) SELECT name FROM cakeday WHERE name = old.name AND notify;
+END;
@@ -0,0 +1,37 @@
+import pytest
+import sys
+import os
+import sqlite3
+
+# Add the src directory to the path to import operations
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'cakeday'))
+
+import operations
+
+
+def create_database(path, records=()):
+    """Create a database at path from the schema file and insert records"""
+    conn = sqlite3.connect(path)
+    with open(operations.SCHEMA_PATH) as f:
+        conn.executescript(f.read())
+    conn.executemany(operations.INSERT_SQL, records)
+    conn.commit()
+    conn.close()
+    return path
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """Path of a fresh database created from the schema file"""
+    return create_database(str(tmp_path / 'cakeday.db'))
+
+
+@pytest.fixture
+def pooled_db(db_path):
+    """A fresh database with the shared pool pointed at it, reset afterwards"""
+    operations.configure_pool(db_path)
+    yield db_path
+    operations.disable_cache()
+    operations.disable_upcoming_cache()
+    operations.disable_calendar_index()
+    operations.close_pool()
@@ -0,0 +1,151 @@
+import pytest
+import sys
+import os
+import asyncio
+import smtplib
+import sqlite3
+import time
+from datetime import datetime
+from unittest.mock import patch
+
+# Add the src directory to the path to import async_notifications
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'cakeday'))
+
+import async_notifications
+import notifications
+import operations
+from tests.test_notifications import SETTINGS, FakeSMTP, NotificationDatabaseTest
+
+
+class Abort(BaseException):
+    """Stands in for KeyboardInterrupt or cancellation inside a send"""
+
+
+class AbortingSMTP(FakeSMTP):
+    """FakeSMTP whose second send aborts the run"""
+    
+    sends = 0
+    
+    def send_message(self, message):
+        AbortingSMTP.sends += 1
+        if AbortingSMTP.sends == 2:
+            raise Abort()
+        super().send_message(message)
+
+
+class TestTokenBucket:
+    """Test cases for TokenBucket"""
+    
+    def test_burst_then_rate_limited(self):
+        """Test the bucket allows a burst and then paces acquisitions"""
+        async def take(count):
+            bucket = async_notifications.TokenBucket(rate=20, capacity=2)
+            started = time.monotonic()
+            for _ in range(count):
+                await bucket.acquire()
+            return time.monotonic() - started
+        
+        assert asyncio.run(take(2)) < 0.04
+        # Two more tokens at 20/s need about 0.1s
+        assert asyncio.run(take(4)) >= 0.09
+    
+    def test_rate_must_be_positive(self):
+        """Test a non-positive rate is rejected"""
+        with pytest.raises(ValueError):
+            async_notifications.TokenBucket(rate=0)
+
+
+class TestAsyncDispatch(NotificationDatabaseTest):
+    """Test cases for async_dispatch"""
+    
+    def run(self, on_date, **options):
+        return async_notifications.run_async_dispatch(
+            on_date=on_date, settings=SETTINGS, smtp_factory=FakeSMTP, **options
+        )
+    
+    def test_async_dispatch_sends_due_reminders(self):
+        """Test every due reminder is sent once with a small queue and batches"""
+        result = self.run(datetime(2024, 7, 16), concurrency=2, per_host=1, queue_size=1, batch_size=1, rate=1000)
+        
+        assert (result.sent, result.failed, result.skipped) == (1, [], 0)
+        assert notifications.get_watermark() == datetime(2024, 7, 16)
+        assert len(FakeSMTP.connections) == 1
+    
+    def test_async_dispatch_respects_ledger(self):
+        """Test reminders already sent by a previous run are skipped"""
+        first = self.run(datetime(2024, 7, 15), rate=1000)
+        notifications.set_watermark(datetime(2024, 7, 14))
+        second = self.run(datetime(2024, 7, 15), rate=1000)
+        
+        assert first.sent == 3
+        assert (second.sent, second.skipped) == (0, 3)
+    
+    def test_async_dispatch_reports_failures(self):
+        """Test a rejected reminder is reported and released for retry"""
+        FakeSMTP.failures = [smtplib.SMTPDataError(550, b"rejected")]
+        
+        result = self.run(datetime(2024, 7, 15), concurrency=1, per_host=1, rate=1000)
+        
+        # Notices stream grouped by adv_days, so Bob (0 days) goes first
+        assert result.sent == 2
+        assert [name for name, _ in result.failed] == ['Bob']
+        assert notifications.get_watermark() == datetime(2024, 7, 14)
+    
+    def test_claims_survive_commits_during_scan(self):
+        """Test another connection committing between pages does not make the claims fail as busy"""
+        operations.add_birthdays([(f'Person {i}', '07-20', 'y', 5) for i in range(4)])
+        claim = notifications.claim_notifications
+        
+        def claim_after_commit(batch, kind):
+            other = sqlite3.connect(self.db_path)
+            other.execute("UPDATE cakeday SET adv_days = 3 WHERE name = 'Dave'")
+            other.commit()
+            other.close()
+            return claim(batch, kind)
+        
+        with patch('async_notifications.claim_notifications', side_effect=claim_after_commit):
+            result = self.run(datetime(2024, 7, 15), concurrency=1, queue_size=1, batch_size=1, rate=1000)
+        
+        assert (result.sent, result.failed) == (7, [])
+    
+    def ledger(self):
+        with operations.get_db_connection() as conn:
+            return dict(conn.execute('SELECT name, sent_at IS NOT NULL FROM sent_notifications').fetchall())
+    
+    def sent_names(self):
+        return sorted(message['Subject'].split(': ')[1].split(' ')[0]
+                      for smtp in FakeSMTP.connections for message in smtp.sent)
+    
+    def test_aborted_run_settles_ledger(self):
+        """Test an abort marks delivered notices sent, releases queued ones and keeps the interrupted claim"""
+        AbortingSMTP.sends = 0
+        with pytest.raises(Abort):
+            async_notifications.run_async_dispatch(on_date=datetime(2024, 7, 15), settings=SETTINGS,
+                                                   smtp_factory=AbortingSMTP, concurrency=1, per_host=1,
+                                                   queue_size=1, batch_size=1, rate=1000)
+        
+        ledger = self.ledger()
+        delivered = self.sent_names()
+        assert len(delivered) == 1
+        assert {name for name, sent in ledger.items() if sent} == set(delivered)
+        assert list(ledger.values()).count(False) == 1
+        assert notifications.get_watermark() is None
+    
+    def test_producer_error_settles_ledger(self):
+        """Test notices claimed before the scan failed are not left claimed"""
+        claim = notifications.claim_notifications
+        calls = []
+        
+        def flaky_claim(batch, kind):
+            calls.append(batch)
+            if len(calls) == 2:
+                raise RuntimeError("scan failed")
+            return claim(batch, kind)
+        
+        with patch('async_notifications.claim_notifications', side_effect=flaky_claim):
+            with pytest.raises(RuntimeError, match="scan failed"):
+                self.run(datetime(2024, 7, 15), concurrency=1, queue_size=1, batch_size=1, rate=1000)
+        
+        assert self.ledger() == {name: True for name in self.sent_names()}
+        self.run(datetime(2024, 7, 15), rate=1000)
+        assert self.sent_names() == ['Alice', 'Bob', 'Carol']
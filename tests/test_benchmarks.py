@@ -0,0 +1,56 @@
+import sys
+import os
+import json
+import tempfile
+
+# Add the benchmarks directory to the path to import the harness
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+
+import run_benchmarks
+
+
+class TestBenchmarkHarness:
+    """Smoke tests for the benchmark harness"""
+    
+    def test_synthetic_rows_are_valid(self):
+        """Test generated rows pass the record validation used by writes"""
+        rows = list(run_benchmarks.synthetic_rows(200))
+        
+        assert len({row[0] for row in rows}) == 200
+        for row in rows:
+            assert run_benchmarks.operations.normalize_record(row) == row
+    
+    def test_percentile(self):
+        """Test nearest-rank percentiles"""
+        values = list(range(1, 101))
+        
+        assert run_benchmarks.percentile(values, 0.5) == 50
+        assert run_benchmarks.percentile(values, 0.99) == 99
+        assert run_benchmarks.percentile([7], 0.9) == 7
+    
+    def test_measure_gives_each_call_its_own_args(self):
+        """Test the traced call uses the first args and only the rest are timed, so no call repeats"""
+        seen = []
+        
+        result = run_benchmarks.measure(seen.append, [(1,), (2,), (3,)])
+        
+        assert seen == [1, 2, 3]
+        assert result['calls'] == 2
+        assert result['peak_kib'] >= 0
+    
+    def test_run_writes_json_and_compares(self, capsys):
+        """Test a tiny run records every operation and flags regressions"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            output = os.path.join(tmpdir, 'bench.json')
+            
+            assert run_benchmarks.main(['--sizes', '50', '--repeat', '3', '--output', output]) == 0
+            with open(output) as f:
+                report = json.load(f)
+        
+        operations = {result['operation'] for result in report['results']}
+        assert {'get_all', 'get_by_name', 'get_upcoming_birthdays_30', 'add_birthdays_single',
+                'bulk_import', 'get_due_notifications'} <= operations
+        assert all(result['p50_ms'] <= result['p99_ms'] for result in report['results'])
+        
+        slower = [dict(result, p50_ms=result['p50_ms'] * 2) for result in report['results']]
+        assert len(run_benchmarks.compare(slower, report, 0.2)) == len(report['results'])
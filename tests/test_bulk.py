@@ -0,0 +1,131 @@
+import pytest
+import sys
+import os
+import json
+
+# Add the src directory to the path to import bulk
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'cakeday'))
+
+import bulk
+import operations
+from changes import get_changes, latest_sequence
+from memo import write_count
+
+
+class TestImportExport:
+    """Test cases for import_records and export_records"""
+    
+    @pytest.fixture(autouse=True)
+    def database(self, pooled_db, tmp_path):
+        """Set up test database with one record"""
+        self.db_path = pooled_db
+        self.tmp_path = tmp_path
+        operations.add_birthdays(('John Doe', '01-15', 'y', 14))
+    
+    def write(self, filename, content):
+        path = str(self.tmp_path / filename)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+    
+    def test_import_csv_upserts_and_rejects(self):
+        """Test CSV import inserts, updates on name and skips invalid rows"""
+        path = self.write('people.csv', (
+            'name,birthday,notification,adv_days\n'
+            'John Doe,02-20,n,0\n'
+            'Jane Smith,06-30,y,7\n'
+            'Bad Row,6-30,y,7\n'
+        ))
+        
+        result = bulk.import_records(path, batch_size=1)
+        
+        assert result.imported == 2
+        assert result.rejected == 1
+        assert result.errors[0][0] == 4
+        assert result.rows_per_second > 0
+        assert operations.get_all() == [("Jane Smith", "06-30", "y", 7), ("John Doe", "02-20", "n", 0)]
+    
+    def test_reimport_only_logs_changed_rows(self):
+        """Test importing the same file twice leaves unchanged rows alone and logs only real changes"""
+        path = self.write('people.csv', 'name,birthday,notification,adv_days\n'
+                                        'John Doe,01-15,y,14\n'
+                                        'Jane Smith,06-30,y,7\n')
+        bulk.import_records(path)
+        latest = latest_sequence()
+        with operations.get_db_connection() as conn:
+            writes = write_count(conn)
+        
+        assert bulk.import_records(path).imported == 2
+        with operations.get_db_connection() as conn:
+            assert write_count(conn) == writes
+        
+        self.write('people.csv', 'name,birthday,notification,adv_days\n'
+                                 'John Doe,01-15,y,14\n'
+                                 'Jane Smith,06-30,y,3\n')
+        bulk.import_records(path)
+        
+        changes = get_changes(latest)
+        assert [(change.op, change.name, change.adv_days) for change in changes] == [('update', 'Jane Smith', 3)]
+    
+    def test_import_jsonl(self):
+        """Test JSONL import stores month_day for the upcoming index"""
+        path = self.write('people.jsonl', json.dumps({'name': 'Jane Smith', 'birthday': '06-30', 'notification': 'y', 'adv_days': 7}) + '\n\n')
+        
+        result = bulk.import_records(path)
+        
+        assert result.imported == 1
+        with operations.get_db_connection() as conn:
+            assert conn.execute("SELECT month_day FROM cakeday WHERE name = 'Jane Smith'").fetchone() == (630,)
+    
+    def test_import_jsonl_rejects_malformed_line(self):
+        """Test a line that is not JSON is rejected with its line number and the rest still imported"""
+        path = self.write('people.jsonl', '{"name": "John Doe", "birthday": "02-20"}\n'
+                                          '{"name": "Bad\n'
+                                          '{"name": "Jane Smith", "birthday": "06-30"}\n')
+        
+        result = bulk.import_records(path)
+        
+        assert (result.imported, result.rejected) == (2, 1)
+        assert result.errors[0][0] == 2
+        assert result.errors[0][1].startswith("Invalid JSON")
+    
+    def test_import_csv_with_byte_order_mark(self):
+        """Test a CSV saved by Excel with a UTF-8 byte-order mark imports normally"""
+        path = str(self.tmp_path / 'excel.csv')
+        with open(path, 'w', encoding='utf-8-sig') as f:
+            f.write('name,birthday,notification,adv_days\nJane Smith,06-30,y,7\n')
+        
+        result = bulk.import_records(path)
+        
+        assert (result.imported, result.rejected) == (1, 0)
+        assert operations.get_by_name('Jane Smith') == ('Jane Smith', '06-30', 'y', 7)
+    
+    def test_import_csv_missing_columns(self):
+        """Test a CSV whose header lacks a required column fails before any row is written"""
+        path = self.write('people.csv', 'full name,birthday\nJane Smith,06-30\n')
+        
+        with pytest.raises(ValueError, match="name column"):
+            bulk.import_records(path)
+        assert operations.get_by_name('Jane Smith') is None
+    
+    def test_import_unknown_format(self):
+        """Test import rejects files it cannot identify"""
+        path = self.write('people.txt', '')
+        
+        with pytest.raises(ValueError):
+            bulk.import_records(path)
+    
+    @pytest.mark.parametrize('filename', ['out.csv', 'out.jsonl'])
+    def test_export_round_trip(self, filename):
+        """Test an export can be imported back unchanged"""
+        path = str(self.tmp_path / filename)
+        
+        assert bulk.export_records(path, batch_size=1) == 1
+        
+        with operations.get_db_connection() as conn:
+            conn.execute('DELETE FROM cakeday')
+            conn.commit()
+        result = bulk.import_records(path)
+        
+        assert result.imported == 1
+        assert operations.get_all() == [("John Doe", "01-15", "y", 14)]
@@ -0,0 +1,112 @@
+import sys
+import os
+
+# Add the src directory to the path to import cache
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'cakeday'))
+
+from cache import MISSING, RecordCache
+
+
+class FakeClock:
+    """Manually advanced clock for TTL tests"""
+    
+    def __init__(self):
+        self.now = 0.0
+    
+    def __call__(self):
+        return self.now
+
+
+class TestRecordCache:
+    """Test cases for RecordCache"""
+    
+    def test_hit_and_miss_counters(self):
+        """Test lookups are counted as hits and misses"""
+        cache = RecordCache()
+        
+        assert cache.get('a') is MISSING
+        cache.put('a', 1, cache.generation)
+        assert cache.get('a') == 1
+        
+        stats = cache.stats()
+        assert (stats['hits'], stats['misses'], stats['size']) == (1, 1, 1)
+        assert stats['hit_rate'] == 0.5
+    
+    def test_none_is_cached(self):
+        """Test a cached None (no such record) is a hit, not a miss"""
+        cache = RecordCache()
+        cache.put('missing', None, cache.generation)
+        
+        assert cache.get('missing') is None
+    
+    def test_lru_eviction(self):
+        """Test the least recently used entry is evicted first"""
+        cache = RecordCache(maxsize=2)
+        cache.put('a', 1, cache.generation)
+        cache.put('b', 2, cache.generation)
+        cache.get('a')
+        cache.put('c', 3, cache.generation)
+        
+        assert cache.get('b') is MISSING
+        assert cache.get('a') == 1
+        assert cache.get('c') == 3
+    
+    def test_ttl_expiry(self):
+        """Test entries expire after ttl seconds"""
+        clock = FakeClock()
+        cache = RecordCache(ttl=10, clock=clock)
+        cache.put('a', 1, cache.generation)
+        
+        clock.now = 9.9
+        assert cache.get('a') == 1
+        clock.now = 10.0
+        assert cache.get('a') is MISSING
+    
+    def test_invalidate_keys_and_all(self):
+        """Test invalidating specific keys or the whole cache"""
+        cache = RecordCache()
+        for key in 'abc':
+            cache.put(key, key, cache.generation)
+        
+        cache.invalidate(['a'])
+        assert cache.get('a') is MISSING
+        assert cache.get('b') == 'b'
+        
+        cache.invalidate()
+        assert cache.stats()['size'] == 0
+    
+    def test_put_after_invalidation_is_dropped(self):
+        """Test a result read before an invalidation is not cached"""
+        cache = RecordCache()
+        generation = cache.generation
+        cache.invalidate(['a'])
+        cache.put('a', 'stale', generation)
+        
+        assert cache.get('a') is MISSING
+    
+    def test_check_version_detects_other_writers(self):
+        """Test a write counter the entries were not filled at clears the cache"""
+        cache = RecordCache()
+        cache.check_version(5)
+        cache.put('a', 1, cache.generation)
+        cache.check_version(5)
+        assert cache.get('a') == 1
+        
+        cache.check_version(6)
+        assert cache.get('a') is MISSING
+    
+    def test_own_writes_move_version(self):
+        """Test a write reporting its counter range keeps the other entries"""
+        cache = RecordCache()
+        cache.check_version(5)
+        cache.put('a', 1, cache.generation)
+        cache.put('b', 2, cache.generation)
+        
+        cache.invalidate(['a'], (5, 7))
+        cache.check_version(7)
+        assert (cache.get('a'), cache.get('b')) == (MISSING, 2)
+        
+        # Another writer moved the counter from 7 to 8 first
+        cache.invalidate(['a'], (8, 9))
+        cache.check_version(9)
+        assert cache.get('b') is MISSING
@@ -1,13 +1,13 @@
 import pytest
 import sys
 import os
-from io import StringIO
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, call
 
 # Add the src directory to the path to import cakeday modules
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'cakeday'))
 
 import cakeday
+import operations
 from operations import get_all, get_by_name
 
 
@@ -37,20 +37,20 @@ class TestDisplayMenu:
 class TestViewAllBirthdays:
     """Test cases for view_all_birthdays function"""
     
-    @patch('cakeday.get_all')
-    def test_view_all_birthdays_no_records(self, mock_get_all, capsys):
+    @patch('cakeday.get_page')
+    def test_view_all_birthdays_no_records(self, mock_get_page, capsys):
         """Test view_all_birthdays when no records exist"""
-        mock_get_all.return_value = []
+        mock_get_page.return_value = []
         
         cakeday.view_all_birthdays()
         captured = capsys.readouterr()
         
         assert "No birthday records found." in captured.out
     
-    @patch('cakeday.get_all')
-    def test_view_all_birthdays_with_records(self, mock_get_all, capsys):
+    @patch('cakeday.get_page')
+    def test_view_all_birthdays_with_records(self, mock_get_page, capsys):
         """Test view_all_birthdays with sample records"""
-        mock_get_all.return_value = [
+        mock_get_page.return_value = [
             ("John Doe", "01-15", "y", 14),
             ("Jane Smith", "06-30", "n", 0)
         ]
@@ -63,6 +63,23 @@ class TestViewAllBirthdays:
         assert "01-15" in captured.out
         assert "Jane Smith" in captured.out
         assert "06-30" in captured.out
+        mock_get_page.assert_called_once_with(page_size=cakeday.PAGE_SIZE + 1)
+    
+    def test_view_all_birthdays_pages(self, capsys):
+        """Test view_all_birthdays pages forward and back with keyset lookups"""
+        records = [(f"Person {i}", "01-15", "n", 0) for i in range(5)]
+        pages = [records[0:3], records[2:5], records[0:2]]
+        
+        with patch('cakeday.get_page', side_effect=pages) as mock_get_page:
+            with patch('builtins.input', side_effect=["n", "p", "x", "q"]):
+                cakeday.view_all_birthdays(page_size=2)
+        captured = capsys.readouterr()
+        
+        assert mock_get_page.call_args_list[1] == call(after="Person 1", page_size=3)
+        assert mock_get_page.call_args_list[2] == call(before="Person 2", page_size=2)
+        assert "Page 2" in captured.out
+        assert "No such page." in captured.out
+        assert captured.out.count("Page 1") == 3
 
 
 class TestSearchBirthday:
@@ -77,8 +94,9 @@ class TestSearchBirthday:
         assert "Name cannot be empty" in captured.out
     
     @patch('builtins.input', return_value="John Doe")
+    @patch('cakeday.search_names', return_value=[])
     @patch('cakeday.get_by_name')
-    def test_search_birthday_not_found(self, mock_get_by_name, mock_input, capsys):
+    def test_search_birthday_not_found(self, mock_get_by_name, mock_search_names, mock_input, capsys):
         """Test search_birthday when record is not found"""
         mock_get_by_name.return_value = None
         
@@ -103,6 +121,22 @@ class TestSearchBirthday:
         assert "Advance Days: 14" in captured.out
 
 
+    @patch('builtins.input', return_value="jon")
+    @patch('cakeday.search_names')
+    @patch('cakeday.get_by_name', return_value=None)
+    def test_search_birthday_suggestions(self, mock_get_by_name, mock_search_names, mock_input, capsys):
+        """Test search_birthday lists close matches when there is no exact one"""
+        mock_search_names.return_value = [("Jonathan Smith", "03-04", "n", 0), ("John Doe", "01-15", "y", 14)]
+        
+        cakeday.search_birthday()
+        captured = capsys.readouterr()
+        
+        mock_search_names.assert_called_once_with("jon")
+        assert "No exact match for jon. Closest matches:" in captured.out
+        assert "Jonathan Smith" in captured.out
+        assert "John Doe" in captured.out
+
+
 class TestMainFunction:
     """Test cases for main function"""
     
@@ -179,4 +213,278 @@ class TestMainFunction:
             cakeday.main()
             captured = capsys.readouterr()
             
-            assert "An error occurred: Test error" in captured.out
\ No newline at end of file
+            assert "An error occurred: Test error" in captured.out
+
+class TestCli:
+    """Test cases for the non-interactive subcommands"""
+    
+    def teardown_method(self):
+        """Turn off the caches commands switch on"""
+        operations.disable_cache()
+        operations.disable_upcoming_cache()
+    
+    def test_profile_flag(self):
+        """Test --profile is off by default and can be switched on"""
+        parser = cakeday.build_parser()
+        assert parser.parse_args([]).profile is False
+        assert parser.parse_args(['--profile', 'list']).profile is True
+    
+    @patch('cakeday.main', return_value=None)
+    @patch('cakeday.enable_cache')
+    def test_no_command_runs_menu(self, mock_enable_cache, mock_main):
+        """Test running without a command starts the interactive menu with the cache on"""
+        assert cakeday.cli([]) == 0
+        mock_enable_cache.assert_called_once()
+        mock_main.assert_called_once()
+    
+    @patch('cakeday.get_upcoming_birthdays')
+    @patch('cakeday.show_upcoming_birthdays')
+    def test_upcoming(self, mock_show, mock_get_upcoming, capsys):
+        """Test upcoming prints tab-separated rows and skips the menu"""
+        from datetime import datetime
+        mock_get_upcoming.return_value = [('John Doe', '01-15', 3, datetime(2024, 1, 15))]
+        
+        assert cakeday.cli(['upcoming', '--days', '7']) == 0
+        
+        mock_get_upcoming.assert_called_once_with(7)
+        mock_show.assert_not_called()
+        assert capsys.readouterr().out == "John Doe\t01-15\t3\t2024-01-15\n"
+    
+    @patch('cakeday.get_upcoming_birthdays_for_tenants')
+    def test_upcoming_all_tenants(self, mock_get_upcoming, capsys):
+        """Test upcoming --all-tenants prefixes each row with its tenant"""
+        from datetime import datetime
+        mock_get_upcoming.return_value = [('acme', 'John Doe', '01-15', 3, datetime(2024, 1, 15))]
+        
+        assert cakeday.cli(['upcoming', '--all-tenants']) == 0
+        
+        assert capsys.readouterr().out == "acme\tJohn Doe\t01-15\t3\t2024-01-15\n"
+    
+    @patch('cakeday.get_by_name')
+    def test_tenant_routes_command(self, mock_get_by_name):
+        """Test --tenant runs the command inside that tenant's shard"""
+        import operations
+        seen = []
+        mock_get_by_name.side_effect = lambda name: seen.append(operations.current_tenant())
+        
+        cakeday.cli(['--tenant', 'acme', 'get', 'John Doe'])
+        
+        assert seen == ['acme']
+        assert operations.current_tenant() is None
+    
+    def test_invalid_tenant_rejected(self, capsys):
+        """Test --tenant names are validated"""
+        with pytest.raises(SystemExit):
+            cakeday.cli(['--tenant', '../x', 'list'])
+        
+        assert "Invalid tenant name" in capsys.readouterr().err
+    
+    @patch('cakeday.close_pool')
+    @patch('cakeday.apply_settings')
+    @patch('cakeday.get_by_name')
+    def test_database_flags(self, mock_get_by_name, mock_apply_settings, mock_close_pool):
+        """Test --database and --in-memory are applied before the command and memory is written back after"""
+        mock_get_by_name.return_value = ('John Doe', '01-15', 'y', 7)
+        
+        assert cakeday.cli(['--database', '/tmp/other.db', '--in-memory', 'get', 'John Doe']) == 0
+        
+        settings = mock_apply_settings.call_args[0][0]
+        assert settings.database == '/tmp/other.db'
+        assert settings.in_memory is True
+        mock_close_pool.assert_called_once()
+    
+    @patch('cakeday.apply_settings')
+    @patch('cakeday.get_by_name')
+    def test_no_database_flags(self, mock_get_by_name, mock_apply_settings):
+        """Test settings are left to lazy resolution without --database or --in-memory"""
+        mock_get_by_name.return_value = ('John Doe', '01-15', 'y', 7)
+        
+        assert cakeday.cli(['get', 'John Doe']) == 0
+        
+        mock_apply_settings.assert_not_called()
+    
+    @patch('cakeday.get_by_name')
+    def test_get_json(self, mock_get_by_name, capsys):
+        """Test get --json prints the record as a JSON object"""
+        mock_get_by_name.return_value = ('John Doe', '01-15', 'y', 7)
+        
+        assert cakeday.cli(['get', 'John Doe', '--json']) == 0
+        
+        assert capsys.readouterr().out == (
+            '{"name": "John Doe", "birthday": "01-15", "notification": "y", "adv_days": 7}\n'
+        )
+    
+    @patch('cakeday.get_by_name', return_value=None)
+    def test_get_missing(self, mock_get_by_name, capsys):
+        """Test get exits non-zero with a message on stderr for an unknown name"""
+        assert cakeday.cli(['get', 'Nobody']) == 1
+        
+        captured = capsys.readouterr()
+        assert captured.out == ""
+        assert "No record found for Nobody" in captured.err
+    
+    @patch('cakeday.iter_all')
+    def test_list(self, mock_iter_all, capsys):
+        """Test list streams every record"""
+        mock_iter_all.return_value = iter([('Jane Smith', '06-30', 'n', 0), ('John Doe', '01-15', 'y', 7)])
+        
+        assert cakeday.cli(['list']) == 0
+        
+        assert capsys.readouterr().out == "Jane Smith\t06-30\tn\t0\nJohn Doe\t01-15\ty\t7\n"
+    
+    @patch('cakeday.add_birthdays')
+    def test_add(self, mock_add_birthdays):
+        """Test add passes the record to add_birthdays"""
+        mock_add_birthdays.return_value = MagicMock(failed=[])
+        
+        assert cakeday.cli(['add', 'John Doe', '01-15', '--notify', '--adv-days', '7']) == 0
+        
+        mock_add_birthdays.assert_called_once_with(('John Doe', '01-15', 'y', 7))
+    
+    @patch('cakeday.add_birthdays')
+    def test_add_rejected(self, mock_add_birthdays, capsys):
+        """Test add exits non-zero and reports why a record was rejected"""
+        mock_add_birthdays.return_value = MagicMock(failed=[('John Doe', 'Record for John Doe already exists')])
+        
+        assert cakeday.cli(['add', 'John Doe', '01-15']) == 1
+        
+        assert "Error: Record for John Doe already exists" in capsys.readouterr().err
+    
+    @patch('cakeday.add_birthdays')
+    def test_add_adv_days_without_notify(self, mock_add_birthdays, capsys):
+        """Test add refuses advance days for a record that sends no reminders"""
+        assert cakeday.cli(['add', 'John Doe', '01-15', '--adv-days', '7']) == 1
+        
+        mock_add_birthdays.assert_not_called()
+        assert "Error: --adv-days only applies with --notify" in capsys.readouterr().err
+    
+    @patch('bulk.import_records')
+    def test_import(self, mock_import_records, capsys):
+        """Test import prints a summary and reports rejected rows"""
+        mock_import_records.return_value = MagicMock(imported=2, rejected=1, errors=[(3, 'Name cannot be empty')],
+                                                     seconds=0.5)
+        
+        assert cakeday.cli(['import', 'people.csv', '--json']) == 1
+        
+        mock_import_records.assert_called_once_with('people.csv', None, 50000)
+        captured = capsys.readouterr()
+        assert captured.out == '{"imported": 2, "rejected": 1, "seconds": 0.5}\n'
+        assert "line 3: Name cannot be empty" in captured.err
+    
+    @patch('bulk.import_records', side_effect=ValueError("CSV header must name the name column(s); found full name"))
+    def test_import_bad_header(self, mock_import_records, capsys):
+        """Test an unusable file is reported without a traceback"""
+        assert cakeday.cli(['import', 'people.csv']) == 1
+        
+        assert "Error: CSV header must name the name column(s)" in capsys.readouterr().err
+    
+    @patch('migrations.migrate')
+    def test_migrate(self, mock_migrate, capsys):
+        """Test migrate applies pending migrations and lists them"""
+        mock_migrate.return_value = [2]
+        
+        assert cakeday.cli(['migrate', '--batch-size', '100']) == 0
+        
+        assert mock_migrate.call_args[0][1] == 100
+        assert capsys.readouterr().out == "2\tinteger month/day, boolean notify and CHECK constraints\n"
+    
+    @patch('migrations.migrate')
+    def test_migrate_error(self, mock_migrate, capsys):
+        """Test migrate reports a record the new schema rejects"""
+        from migrations import MigrationError
+        mock_migrate.side_effect = MigrationError("Record 'X' cannot be migrated")
+        
+        assert cakeday.cli(['migrate']) == 1
+        
+        assert "Error: Record 'X' cannot be migrated" in capsys.readouterr().err
+    
+    @patch('scheduler.get_schedule')
+    @patch('scheduler.refresh_schedule')
+    def test_schedule(self, mock_refresh_schedule, mock_get_schedule, capsys):
+        """Test schedule lists upcoming notices with their UTC send instant"""
+        from datetime import time
+        from scheduler import ScheduledNotice
+        mock_get_schedule.return_value = [ScheduledNotice(1721034000, 'John Doe', '07-25', 10, 'Asia/Tokyo', '2024-07-25', 7, 25)]
+        
+        assert cakeday.cli(['schedule', '--limit', '5', '--send-time', '08:30']) == 0
+        
+        assert mock_refresh_schedule.call_args[1] == {'send_time': time(8, 30), 'default_zone': None}
+        mock_get_schedule.assert_called_once_with(5)
+        assert capsys.readouterr().out == "2024-07-15T09:00:00Z\tJohn Doe\t2024-07-25\t10\tAsia/Tokyo\n"
+    
+    def test_schedule_rejects_bad_zone(self, capsys):
+        """Test an unknown default zone is reported before anything runs"""
+        assert cakeday.cli(['schedule', '--default-timezone', 'Mars/Olympus']) == 1
+        
+        assert "Unknown time zone 'Mars/Olympus'" in capsys.readouterr().err
+    
+    @patch('cakeday.set_timezones')
+    def test_timezone(self, mock_set_timezones):
+        """Test timezone sets or clears one record's zone"""
+        mock_set_timezones.return_value = MagicMock(failed=[])
+        
+        assert cakeday.cli(['timezone', 'John Doe', 'Europe/Berlin']) == 0
+        assert cakeday.cli(['timezone', 'John Doe']) == 0
+        
+        assert mock_set_timezones.call_args_list == [call(('John Doe', 'Europe/Berlin')), call(('John Doe', None))]
+    
+    @patch('changes.get_changes')
+    def test_changes(self, mock_get_changes, capsys):
+        """Test changes prints every change after --since, one query per batch"""
+        from changes import Change
+        mock_get_changes.side_effect = [
+            [Change(4, 'insert', 'John Doe', '01-15', 'y', 14, '2024-01-01T00:00:00.000Z'),
+             Change(5, 'delete', 'Jane Smith', None, None, None, '2024-01-01T00:00:01.000Z')],
+            [],
+        ]
+        
+        assert cakeday.cli(['changes', '--since', '3', '--batch-size', '2', '--json']) == 0
+        
+        assert mock_get_changes.call_args_list == [call(3, 2), call(5, 2)]
+        lines = capsys.readouterr().out.splitlines()
+        assert lines[0] == ('{"seq": 4, "op": "insert", "name": "John Doe", "birthday": "01-15", '
+                            '"notification": "y", "adv_days": 14, "changed_at": "2024-01-01T00:00:00.000Z"}')
+        assert len(lines) == 2
+    
+    @patch('changes.get_changes')
+    def test_changes_expired_cursor(self, mock_get_changes, capsys):
+        """Test changes fails when the cursor's changes were pruned"""
+        from changes import ChangeFeedError
+        mock_get_changes.side_effect = ChangeFeedError("Changes after 1 were pruned")
+        
+        assert cakeday.cli(['changes', '--since', '1']) == 1
+        
+        assert "Error: Changes after 1 were pruned" in capsys.readouterr().err
+    
+    @patch('cakeday.close_pool')
+    @patch('server.make_server')
+    def test_serve(self, mock_make_server, mock_close_pool, capsys):
+        """Test serve runs the service until interrupted and then releases connections"""
+        server = mock_make_server.return_value
+        server.server_address = ('127.0.0.1', 9000)
+        server.serve_forever.side_effect = KeyboardInterrupt
+        
+        assert cakeday.cli(['serve', '--port', '9000', '--no-cache']) == 0
+        
+        mock_make_server.assert_called_once_with('127.0.0.1', 9000, tenant=None, cache=False)
+        server.server_close.assert_called_once()
+        mock_close_pool.assert_called_once()
+        assert "Serving on http://127.0.0.1:9000" in capsys.readouterr().err
+    
+    @patch('notifications.dispatch')
+    def test_notify(self, mock_dispatch, capsys):
+        """Test notify runs a dispatch for the given date and prints counts"""
+        from datetime import datetime
+        mock_dispatch.return_value = MagicMock(sent=2, failed=[], skipped=1)
+        
+        assert cakeday.cli(['notify', '--date', '2024-01-15']) == 0
+        
+        mock_dispatch.assert_called_once_with(on_date=datetime(2024, 1, 15))
+        assert capsys.readouterr().out == "2\t0\t1\n"
+    
+    def test_notify_rejects_bad_date(self, capsys):
+        """Test notify --date must be YYYY-MM-DD"""
+        with pytest.raises(SystemExit):
+            cakeday.cli(['notify', '--date', '01-15'])
+        
+        assert "expected YYYY-MM-DD" in capsys.readouterr().err
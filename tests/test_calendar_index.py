@@ -0,0 +1,155 @@
+import pytest
+import sys
+import os
+import sqlite3
+from datetime import datetime
+from unittest.mock import patch
+
+# Add the src directory to the path to import calendar_index
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'cakeday'))
+
+import operations
+from calendar_index import CalendarIndex, month_days_on
+from memo import write_count
+from tests.test_operations import RealDatabase
+
+
+class TestCalendarIndex:
+    """Test cases for CalendarIndex buckets"""
+    
+    def setup_method(self):
+        """Set up an in-memory database and an index over it"""
+        self.conn = sqlite3.connect(':memory:')
+        with open(operations.SCHEMA_PATH) as f:
+            self.conn.executescript(f.read())
+        self.conn.executemany(operations.INSERT_SQL, [
+            ('Alice', '07-25', 'y', 10),
+            ('Bob', '07-15', 'y', 0),
+            ('Dave', '07-25', 'n', 0),
+            ('Leap', '02-29', 'y', 3),
+        ])
+        self.conn.commit()
+        self.index = CalendarIndex()
+        self.index.sync(self.conn)
+    
+    def teardown_method(self):
+        """Close the database"""
+        self.conn.close()
+    
+    def test_month_days_on(self):
+        """Test Feb 28 also celebrates Feb 29 birthdays in non-leap years only"""
+        assert month_days_on(datetime(2023, 2, 28)) == (228, 229)
+        assert month_days_on(datetime(2024, 2, 28)) == (228,)
+        assert month_days_on(datetime(2024, 2, 29)) == (229,)
+    
+    def test_birthdays_on(self):
+        """Test a day's bucket holds every birthday on it"""
+        assert self.index.birthdays_on(datetime(2024, 7, 25)) == [('Alice', '07-25'), ('Dave', '07-25')]
+        assert self.index.birthdays_on(datetime(2023, 2, 28)) == [('Leap', '02-29')]
+        assert self.index.birthdays_on(datetime(2024, 2, 28)) == []
+    
+    def test_notices_on(self):
+        """Test notices are found adv_days before the birthday, for opted-in records only"""
+        assert self.index.notices_on(datetime(2024, 7, 15)) == [('Alice', '07-25', 10), ('Bob', '07-15', 0)]
+        assert self.index.notices_on(datetime(2023, 2, 25)) == [('Leap', '02-29', 3)]
+        assert self.index.notices_on(datetime(2024, 2, 26)) == [('Leap', '02-29', 3)]
+    
+    def test_upcoming_wraps_once(self):
+        """Test a full-year walk lists every birthday once with its first occurrence"""
+        upcoming = self.index.upcoming(datetime(2024, 7, 20), 365)
+        
+        assert [(name, days) for name, _, days, _ in upcoming] == [
+            ('Alice', 5), ('Dave', 5), ('Leap', 223), ('Bob', 360),
+        ]
+        assert upcoming[2][3] == datetime(2025, 2, 28)
+    
+    def test_invalidate_refreshes_names(self):
+        """Test invalidated names are re-read on the next sync"""
+        before = write_count(self.conn)
+        self.conn.execute("UPDATE cakeday SET birthday = '07-16', notification = 'n' WHERE name = 'Bob'")
+        self.conn.execute("DELETE FROM cakeday WHERE name = 'Dave'")
+        self.conn.commit()
+        
+        self.index.invalidate(['Bob', 'Dave'], (before, write_count(self.conn)))
+        with patch.object(self.index, '_add', wraps=self.index._add) as add:
+            self.index.sync(self.conn)
+        
+        assert add.call_count == 1
+        assert self.index.birthdays_on(datetime(2024, 7, 16)) == [('Bob', '07-16')]
+        assert self.index.birthdays_on(datetime(2024, 7, 25)) == [('Alice', '07-25')]
+        assert self.index.notices_on(datetime(2024, 7, 16)) == []
+        assert 0 not in self.index.adv_days
+    
+    def test_unaccounted_write_rebuilds(self):
+        """Test a write the index was not told about is picked up through the write counter"""
+        self.conn.execute(operations.INSERT_SQL, ('Zoe', '07-15', 'n', 0))
+        self.conn.commit()
+        
+        assert self.index.sync(self.conn)
+        assert self.index.birthdays_on(datetime(2024, 7, 15)) == [('Bob', '07-15'), ('Zoe', '07-15')]
+    
+    def test_database_without_write_counter(self):
+        """Test sync reports that it cannot track a database without cakeday_meta"""
+        self.conn.execute('DROP TABLE cakeday_meta')
+        
+        assert not CalendarIndex().sync(self.conn)
+
+
+class TestCalendarIndexOperations(RealDatabase):
+    """Test operations.py keeps the calendar index current"""
+    
+    @pytest.fixture(autouse=True)
+    def records(self, database):
+        """Add sample records and enable the index"""
+        operations.add_birthdays([('Alice', '01-02', 'y', 3), ('Bob', '12-31', 'n', 0), ('Carol', '02-29', 'n', 0)])
+        operations.enable_calendar_index()
+    
+    def upcoming(self, today, days_ahead):
+        with patch('operations.datetime') as mock_datetime:
+            mock_datetime.now.return_value = today
+            mock_datetime.side_effect = lambda *args, **kwargs: datetime(*args, **kwargs)
+            return operations.get_upcoming_birthdays(days_ahead)
+    
+    @pytest.mark.parametrize('today', [datetime(2023, 12, 20), datetime(2023, 2, 28), datetime(2024, 2, 28),
+                                       datetime(2024, 3, 1)])
+    @pytest.mark.parametrize('days_ahead', [0, 1, 30, 365, 500])
+    def test_matches_range_scan(self, today, days_ahead):
+        """Test bucket walks return exactly what the month_day range scan returns"""
+        from_index = self.upcoming(today, days_ahead)
+        operations.disable_calendar_index()
+        
+        assert from_index == self.upcoming(today, days_ahead)
+    
+    def test_writes_update_index(self):
+        """Test adds, updates and deletes are reflected without a rebuild"""
+        self.upcoming(datetime(2023, 12, 30), 5)
+        
+        operations.add_birthdays(('Dan', '12-30', 'n', 0))
+        operations.update_birthdays({'name': 'Bob', 'birthday': '01-01'})
+        operations.delete_birthdays('Alice')
+        
+        assert [row[:3] for row in self.upcoming(datetime(2023, 12, 30), 5)] == [('Dan', '12-30', 0),
+                                                                                 ('Bob', '01-01', 2)]
+    
+    def test_other_process_write_detected(self):
+        """Test a commit from another connection triggers a rebuild"""
+        self.upcoming(datetime(2023, 12, 30), 5)
+        other = sqlite3.connect(self.db_path)
+        other.execute(operations.INSERT_SQL, ('Zoe', '12-31', 'n', 0))
+        other.commit()
+        other.close()
+        
+        assert [row[0] for row in self.upcoming(datetime(2023, 12, 30), 5)] == ['Bob', 'Zoe', 'Alice']
+    
+    def test_write_on_unseen_connection_detected(self):
+        """Test a commit is caught even when the index is next synced through a connection it has not used"""
+        self.upcoming(datetime(2023, 12, 30), 5)
+        other = sqlite3.connect(self.db_path)
+        other.execute(operations.INSERT_SQL, ('Zoe', '12-31', 'n', 0))
+        other.commit()
+        
+        calendar = operations._calendars[operations._tenant.get()]
+        calendar.sync(other)
+        other.close()
+        
+        assert calendar.birthdays_on(datetime(2023, 12, 31)) == [('Bob', '12-31'), ('Zoe', '12-31')]
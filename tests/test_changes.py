@@ -0,0 +1,83 @@
+import pytest
+import sys
+import os
+import sqlite3
+
+# Add the src directory to the path to import changes
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'cakeday'))
+
+import operations
+from changes import ChangeFeedError, get_changes, iter_changes, latest_sequence, prune_changes
+
+
+class TestChangeFeed:
+    """Test cases for the trigger-filled change feed"""
+
+    @pytest.fixture(autouse=True)
+    def database(self, pooled_db):
+        """Point the shared pool at a fresh database"""
+        self.db_path = pooled_db
+
+    def ops(self, since=0):
+        return [(change.seq, change.op, change.name) for change in get_changes(since)]
+
+    def test_writes_are_logged_in_order(self):
+        """Test inserts, updates and deletes each log the full new row (or the deleted name)"""
+        operations.add_birthdays([('John Doe', '01-15', 'y', 14), ('Jane Smith', '06-30', 'n', 0)])
+        operations.update_birthdays({'name': 'John Doe', 'birthday': '01-16'})
+        operations.delete_birthdays('Jane Smith')
+
+        changes = get_changes()
+
+        assert [(change.seq, change.op, change.name) for change in changes] == [
+            (1, 'insert', 'John Doe'), (2, 'insert', 'Jane Smith'), (3, 'update', 'John Doe'), (4, 'delete', 'Jane Smith')]
+        assert changes[2][3:6] == ('01-16', 'y', 14)
+        assert changes[3][3:6] == (None, None, None)
+        assert changes[0].changed_at.endswith('Z')
+        assert latest_sequence() == 4
+
+    def test_unchanged_update_not_logged(self):
+        """Test an update that writes the values a row already has adds no change"""
+        operations.add_birthdays(('John Doe', '01-15', 'y', 14))
+        operations.update_birthdays({'name': 'John Doe', 'birthday': '01-15', 'adv_days': 14})
+        
+        assert self.ops() == [(1, 'insert', 'John Doe')]
+    
+    def test_rename_logs_delete_and_update(self):
+        """Test renaming a record from another connection tells consumers to drop the old name"""
+        operations.add_birthdays(('John Doe', '01-15', 'n', 0))
+        other = sqlite3.connect(self.db_path)
+        other.execute("UPDATE cakeday SET name = 'John Smith' WHERE name = 'John Doe'")
+        other.commit()
+        other.close()
+
+        assert self.ops(since=1) == [(2, 'delete', 'John Doe'), (3, 'update', 'John Smith')]
+
+    def test_iter_changes_pages_from_cursor(self):
+        """Test iterating in small batches yields every change after the cursor once"""
+        operations.add_birthdays([(f'Person {i}', '03-01', 'n', 0) for i in range(5)])
+
+        assert [change.seq for change in iter_changes(since=1, batch_size=2)] == [2, 3, 4, 5]
+        assert list(iter_changes(since=5)) == []
+
+    def test_pruned_cursor_expires(self):
+        """Test pruning keeps sequence numbers increasing and rejects cursors it skipped"""
+        operations.add_birthdays([('John Doe', '01-15', 'n', 0), ('Jane Smith', '06-30', 'n', 0)])
+
+        assert prune_changes(2) == 2
+        assert get_changes(2) == []
+        with pytest.raises(ChangeFeedError, match="resynchronise"):
+            get_changes(1)
+
+        operations.delete_birthdays('John Doe')
+        assert self.ops(since=2) == [(3, 'delete', 'John Doe')]
+        assert latest_sequence() == 3
+
+    def test_database_without_feed(self):
+        """Test a database that predates the feed asks for a migration"""
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('DROP TABLE cakeday_changes')
+        conn.close()
+
+        with pytest.raises(ChangeFeedError, match="migrate"):
+            get_changes()
@@ -0,0 +1,169 @@
+import sys
+import os
+import io
+import logging
+
+# Add the src directory to the path to import instrumentation
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'cakeday'))
+
+import instrumentation
+import operations
+from instrumentation import HistogramSink, LoggingSink, PrometheusTextfileSink, instrumented, profile_session
+from tests.test_operations import RealDatabase
+
+
+class TestInstrumented:
+    """Test cases for the instrumented decorator and span"""
+    
+    def teardown_method(self):
+        """Turn instrumentation back off"""
+        instrumentation.clear_sinks()
+    
+    def test_no_sink_passes_through(self):
+        """Test calls are not recorded while no sink is registered"""
+        @instrumented()
+        def double(x):
+            return x * 2
+        
+        assert not instrumentation.enabled()
+        assert double(4) == 8
+        assert double.__name__ == 'double'
+    
+    def test_records_timing_and_rows(self):
+        """Test each call reports its name, duration and row count"""
+        sink = instrumentation.add_sink(HistogramSink())
+        
+        @instrumented()
+        def rows(n):
+            return list(range(n))
+        
+        @instrumented(name='lookup', rows=lambda result: 0 if result is None else 1)
+        def lookup(found):
+            return ('x',) if found else None
+        
+        rows(3)
+        rows(4)
+        lookup(True)
+        lookup(False)
+        
+        assert sink.stats['rows']['count'] == 2
+        assert sink.stats['rows']['rows'] == 7
+        assert sink.stats['lookup']['rows'] == 1
+        assert sink.stats['rows']['seconds'] > 0
+    
+    def test_span(self):
+        """Test span records a block under its own name"""
+        sink = instrumentation.add_sink(HistogramSink())
+        
+        with instrumentation.span('phase'):
+            pass
+        
+        assert sink.stats['phase']['count'] == 1
+    
+    def test_logging_sink(self, caplog):
+        """Test LoggingSink logs each call"""
+        instrumentation.add_sink(LoggingSink(level=logging.INFO))
+        
+        with caplog.at_level(logging.INFO, logger='cakeday.instrumentation'):
+            instrumentation.record('get_all', 0.0015, 12)
+            instrumentation.gauge('connections_open', 2)
+        
+        assert caplog.messages == ['get_all took 1.500 ms (12 rows)', 'connections_open = 2']
+
+
+class TestHistogramSink:
+    """Test cases for HistogramSink"""
+    
+    def test_quantiles_use_bucket_bounds(self):
+        """Test quantiles report the upper bound of the bucket they fall in"""
+        sink = HistogramSink(buckets=(0.001, 0.01, 0.1))
+        for seconds in [0.0005] * 9 + [0.05]:
+            sink.record('call', seconds)
+        
+        assert sink.quantile('call', 0.5) == 0.001
+        assert sink.quantile('call', 0.99) == 0.05
+        assert sink.stats['call']['buckets'] == [9, 0, 1, 0]
+    
+    def test_summary(self):
+        """Test summary lists calls and gauges"""
+        sink = HistogramSink()
+        sink.record('get_all', 0.002, 10)
+        sink.gauge('connections_open', 1)
+        
+        summary = sink.summary()
+        
+        assert 'get_all' in summary
+        assert 'connections_open = 1' in summary
+
+
+class TestPrometheusTextfileSink:
+    """Test cases for PrometheusTextfileSink"""
+    
+    def test_write(self, tmp_path):
+        """Test the text file holds cumulative buckets, sums, counts and gauges"""
+        path = tmp_path / 'cakeday.prom'
+        sink = PrometheusTextfileSink(str(path), buckets=(0.001, 0.01))
+        sink.record('get_all', 0.0005, 3)
+        sink.record('get_all', 0.005, 4)
+        sink.gauge('connections_open', 2)
+        
+        sink.write()
+        text = path.read_text()
+        
+        assert 'cakeday_call_seconds_bucket{call="get_all",le="0.001"} 1' in text
+        assert 'cakeday_call_seconds_bucket{call="get_all",le="0.01"} 2' in text
+        assert 'cakeday_call_seconds_bucket{call="get_all",le="+Inf"} 2' in text
+        assert 'cakeday_call_seconds_count{call="get_all"} 2' in text
+        assert 'cakeday_call_rows_total{call="get_all"} 7' in text
+        assert 'cakeday_connections_open 2' in text
+        assert os.listdir(tmp_path) == ['cakeday.prom']
+
+
+class TestOperationsInstrumentation(RealDatabase):
+    """Test operations.py reports through registered sinks"""
+    
+    def teardown_method(self):
+        """Turn instrumentation off"""
+        instrumentation.clear_sinks()
+    
+    def test_query_functions_report(self):
+        """Test connections, reads, writes and upcoming-birthday phases are recorded"""
+        sink = instrumentation.add_sink(HistogramSink())
+        
+        operations.add_birthdays([('Alice', '01-15', 'y', 3), ('Bob', '06-01', 'n', 0)])
+        operations.get_all()
+        operations.get_by_name('Alice')
+        operations.get_by_name('Nobody')
+        operations.get_upcoming_birthdays(365)
+        
+        assert sink.stats['add_birthdays']['rows'] == 2
+        assert sink.stats['get_all']['rows'] == 2
+        assert sink.stats['get_by_name']['count'] == 2
+        assert sink.stats['get_by_name']['rows'] == 1
+        assert sink.stats['get_upcoming_birthdays']['rows'] == 2
+        assert sink.stats['get_upcoming_birthdays.sql']['count'] == 1
+        assert sink.stats['get_upcoming_birthdays.dates']['count'] == 1
+        assert sink.stats['get_db_connection']['count'] == 5
+        assert sink.gauges['connections_open'] == 1
+
+
+class TestProfileSession:
+    """Test cases for profile_session"""
+    
+    def test_prints_summaries(self):
+        """Test the session result is returned and all three reports are printed"""
+        out = io.StringIO()
+        
+        @instrumented()
+        def work():
+            return [str(i) for i in range(1000)]
+        
+        result = profile_session(work, out=out)
+        
+        assert len(result) == 1000
+        report = out.getvalue()
+        assert '=== cProfile' in report
+        assert '=== tracemalloc' in report
+        assert '=== Instrumented calls ===' in report
+        assert 'work' in report
+        assert not instrumentation.enabled()
@@ -0,0 +1,91 @@
+import pytest
+import sys
+import os
+import sqlite3
+from datetime import datetime
+
+# Add the src directory to the path to import memo
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'cakeday'))
+
+import operations
+from cache import MISSING
+from memo import UpcomingMemo, write_count
+
+
+START = datetime(2024, 1, 10)
+ROWS = [('John Doe', '01-15', 5, datetime(2024, 1, 15)), ('Jane Smith', '01-20', 10, datetime(2024, 1, 20))]
+
+
+class TestUpcomingMemo:
+    """Test cases for the upcoming-birthday result cache"""
+    
+    @pytest.fixture(autouse=True)
+    def database(self, db_path, tmp_path):
+        """Create a database from the schema"""
+        self.db_path = db_path
+        self.tmp_path = tmp_path
+        yield
+        operations.disable_upcoming_cache()
+        operations.close_pool()
+    
+    def test_write_count_bumped_by_triggers(self):
+        """Test every insert, update and delete moves the write counter"""
+        conn = sqlite3.connect(self.db_path)
+        assert write_count(conn) == 0
+        
+        conn.execute("INSERT INTO cakeday (name, birthday) VALUES ('John Doe', '01-15')")
+        conn.execute("UPDATE cakeday SET birthday = '01-16'")
+        conn.execute("DELETE FROM cakeday")
+        conn.commit()
+        
+        assert write_count(conn) == 3
+        assert write_count(sqlite3.connect(':memory:')) is None
+    
+    def test_entries_keyed_by_version(self):
+        """Test an entry is only returned for the same date, days_ahead and write counter"""
+        memo = UpcomingMemo()
+        memo.put(self.db_path, 4, START, 30, ROWS)
+        
+        assert memo.get(self.db_path, 4, START, 30) is ROWS
+        assert memo.get(self.db_path, 4, START, 7) is MISSING
+        assert memo.get(self.db_path, 4, datetime(2024, 1, 11), 30) is MISSING
+        assert memo.get(self.db_path, 5, START, 30) is MISSING
+        assert memo.stats()['hits'] == 1
+    
+    def test_shared_between_processes(self):
+        """Test a second memo (as in another process) reads entries saved on disk"""
+        UpcomingMemo().put(self.db_path, 4, START, 30, ROWS)
+        
+        assert os.path.exists(self.db_path + '-upcoming.json')
+        assert UpcomingMemo().get(self.db_path, 4, START, 30) == ROWS
+        assert UpcomingMemo().get(self.db_path, 5, START, 30) is MISSING
+    
+    def test_directory_and_memory_databases(self):
+        """Test results can be kept in another directory and are not saved for in-memory databases"""
+        directory = str(self.tmp_path / 'cache')
+        UpcomingMemo(directory).put(self.db_path, 1, START, 30, ROWS)
+        
+        assert len(os.listdir(directory)) == 1
+        assert UpcomingMemo(directory).get(self.db_path, 1, START, 30) == ROWS
+        assert UpcomingMemo().path('file:cakeday-memory-1?mode=memory&cache=shared') is None
+    
+    def test_get_upcoming_birthdays_memoized(self):
+        """Test repeated calls are served from the cache until a write from any connection"""
+        operations.configure_pool(self.db_path)
+        operations.add_birthdays([('John Doe', '01-15', 'n', 0)])
+        memo = operations.enable_upcoming_cache()
+        
+        first = operations.get_upcoming_birthdays(366)
+        first.clear()
+        assert [row[0] for row in operations.get_upcoming_birthdays(366)] == ['John Doe']
+        
+        other = sqlite3.connect(self.db_path)
+        other.execute("INSERT INTO cakeday (name, birthday) VALUES ('Jane Smith', '06-30')")
+        other.commit()
+        other.close()
+        
+        second = operations.get_upcoming_birthdays(366)
+        assert {row[0] for row in second} == {'John Doe', 'Jane Smith'}
+        operations.disable_upcoming_cache()
+        assert operations.get_upcoming_birthdays(366) == second
+        assert memo.stats() == {'hits': 1, 'misses': 2, 'hit_rate': 1 / 3}
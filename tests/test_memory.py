@@ -0,0 +1,85 @@
+import pytest
+import sys
+import os
+import sqlite3
+
+# Add the src directory to the path to import memory
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'cakeday'))
+
+import operations
+from memory import MemoryDatabase
+
+
+def count_rows(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute('SELECT COUNT(*) FROM cakeday').fetchone()[0]
+    finally:
+        conn.close()
+
+
+class TestMemoryDatabase:
+    """Test cases for the shared-cache in-memory database"""
+    
+    @pytest.fixture(autouse=True)
+    def database(self, db_path):
+        """Create an on-disk database with one record"""
+        self.path = db_path
+        conn = sqlite3.connect(self.path)
+        conn.execute("INSERT INTO cakeday (name, birthday, notification, adv_days) VALUES ('John Doe', '01-15', 'y', 7)")
+        conn.commit()
+        conn.close()
+        yield
+        operations.close_pool()
+    
+    def test_loads_and_shares(self):
+        """Test the file is loaded into memory and visible to every connection on the uri"""
+        memory = MemoryDatabase(self.path, checkpoint_interval=0)
+        try:
+            other = sqlite3.connect(memory.uri, uri=True)
+            assert other.execute('SELECT name FROM cakeday').fetchall() == [('John Doe',)]
+            other.close()
+        finally:
+            memory.close()
+    
+    def test_checkpoint_only_when_changed(self):
+        """Test checkpoint writes back changes and skips an unchanged database"""
+        memory = MemoryDatabase(self.path, checkpoint_interval=0)
+        try:
+            assert memory.checkpoint() is False
+            
+            writer = sqlite3.connect(memory.uri, uri=True)
+            writer.execute("INSERT INTO cakeday (name, birthday) VALUES ('Jane Smith', '03-22')")
+            writer.commit()
+            writer.close()
+            assert count_rows(self.path) == 1
+            
+            assert memory.checkpoint() is True
+            assert count_rows(self.path) == 2
+            assert memory.checkpoint() is False
+            assert memory.checkpoints == 1
+        finally:
+            memory.close()
+    
+    def test_operations_in_memory(self):
+        """Test operations run against the in-memory copy and close_pool writes it back"""
+        operations.configure_memory_database(self.path, checkpoint_interval=0)
+        
+        result = operations.add_birthdays([('Jane Smith', '03-22', 'n', 0)])
+        
+        assert result.succeeded == ['Jane Smith']
+        assert operations.get_by_name('Jane Smith') == ('Jane Smith', '03-22', 'n', 0)
+        assert count_rows(self.path) == 1
+        
+        operations.close_pool()
+        
+        assert count_rows(self.path) == 2
+        assert operations.checkpoint_memory_database() is False
+    
+    def test_parallel_scan_rejected(self):
+        """Test process-pool scans refuse an in-memory database"""
+        from parallel import parallel_upcoming
+        operations.configure_memory_database(self.path, checkpoint_interval=0)
+        
+        with pytest.raises(ValueError, match="in-memory"):
+            parallel_upcoming(workers=2)
@@ -0,0 +1,200 @@
+import pytest
+import sys
+import os
+import sqlite3
+
+# Add the src directory to the path to import migrations
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'cakeday'))
+
+import operations
+from migrations import SCHEMA_VERSION, MigrationError, has_table, migrate, pending_migrations, schema_version
+
+
+LEGACY_ROWS = [
+    ('John Doe', '01-15', 'Y', 14),
+    ('Jane Smith', ' 06-30 ', 'n', 7),
+    ('Bob Wilson', '02-29', None, None),
+    ('Alice Brown', '12-25', 'yes', None),
+]
+
+
+class TestMigrate:
+    """Test cases for upgrading databases with the migration framework"""
+    
+    @pytest.fixture(autouse=True)
+    def legacy(self, tmp_path):
+        """Create a database with the original, unversioned schema"""
+        self.tmp_path = tmp_path
+        self.db_path = str(tmp_path / 'legacy.db')
+        self.conn = sqlite3.connect(self.db_path)
+        self.conn.execute('CREATE TABLE cakeday (name TEXT PRIMARY KEY, birthday TEXT, notification TEXT, '
+                          'adv_days INTEGER)')
+        self.conn.executemany('INSERT INTO cakeday VALUES (?, ?, ?, ?)', LEGACY_ROWS)
+        self.conn.commit()
+        yield
+        self.conn.close()
+        operations.close_pool()
+    
+    def rows(self):
+        return self.conn.execute('SELECT name, birthday, notification, adv_days, month_day, month, day, notify '
+                                 'FROM cakeday ORDER BY name').fetchall()
+    
+    def test_new_database_is_current(self, db_path):
+        """Test the schema file creates a database needing no migrations"""
+        conn = sqlite3.connect(db_path)
+        
+        assert schema_version(conn) == SCHEMA_VERSION
+        assert pending_migrations(conn) == []
+        assert migrate(conn) == []
+        conn.close()
+    
+    def test_empty_database_gets_schema(self):
+        """Test migrating an empty database creates the current schema"""
+        conn = sqlite3.connect(str(self.tmp_path / 'empty.db'))
+        
+        assert migrate(conn) == [1, 2, 3, 4, 5]
+        
+        assert schema_version(conn) == SCHEMA_VERSION
+        assert has_table(conn, 'cakeday_fts')
+        conn.close()
+    
+    def test_legacy_database_migrated(self):
+        """Test an unversioned database gains typed, normalized columns and keeps its search index working"""
+        assert schema_version(self.conn) == 0
+        
+        assert migrate(self.conn, batch_size=2) == [1, 2, 3, 4, 5]
+        
+        assert schema_version(self.conn) == SCHEMA_VERSION
+        assert self.rows() == [
+            ('Alice Brown', '12-25', 'yes', 0, 1225, 12, 25, 1),
+            ('Bob Wilson', '02-29', 'n', 0, 229, 2, 29, 0),
+            ('Jane Smith', '06-30', 'n', 0, 630, 6, 30, 0),
+            ('John Doe', '01-15', 'y', 14, 115, 1, 15, 1),
+        ]
+        assert not has_table(self.conn, 'cakeday_v2')
+        assert not has_table(self.conn, 'schema_migration_progress')
+        assert has_table(self.conn, 'sent_notifications')
+        assert self.conn.execute("SELECT name FROM cakeday_fts WHERE name MATCH 'Smith'").fetchall() == [('Jane Smith',)]
+    
+    def test_migrated_schema_matches_schema_file(self, db_path):
+        """Test a migrated database ends up with the same columns, indexes and triggers as a new one"""
+        def objects(conn):
+            return (sorted(conn.execute("SELECT type, name, tbl_name FROM sqlite_master WHERE name NOT LIKE 'sqlite_%'")),
+                    conn.execute('PRAGMA table_xinfo(cakeday)').fetchall())
+        
+        fresh = sqlite3.connect(db_path)
+        migrate(self.conn)
+        
+        assert objects(self.conn) == objects(fresh)
+        fresh.close()
+    
+    def test_constraints_enforced(self):
+        """Test the migrated table rejects invalid records"""
+        migrate(self.conn)
+        
+        for row in [('Bad Month', '13-01', 'n', 0), ('Bad Day', '04-31', 'n', 0), ('Bad Flag', '01-01', 'maybe', 0),
+                    ('Bad Days', '01-01', 'y', -1), ('', '01-01', 'n', 0)]:
+            with pytest.raises(sqlite3.IntegrityError):
+                self.conn.execute('INSERT INTO cakeday (name, birthday, notification, adv_days) VALUES (?, ?, ?, ?)',
+                                  row)
+    
+    def test_invalid_record_reported_and_resumable(self):
+        """Test a record the new schema rejects stops the migration, which resumes once it is fixed"""
+        self.conn.execute("INSERT INTO cakeday VALUES ('Broken Date', '02-30', 'n', 0)")
+        self.conn.commit()
+        
+        with pytest.raises(MigrationError, match="Broken Date"):
+            migrate(self.conn, batch_size=2)
+        
+        assert schema_version(self.conn) == 1
+        assert self.conn.execute('SELECT last_rowid FROM schema_migration_progress').fetchone()[0] == 4
+        
+        self.conn.execute("UPDATE cakeday SET birthday = '02-28' WHERE name = 'Broken Date'")
+        self.conn.commit()
+        
+        assert migrate(self.conn, batch_size=2) == [2, 3, 4, 5]
+        assert self.conn.execute('SELECT COUNT(*) FROM cakeday').fetchone()[0] == 5
+    
+    def test_interrupted_migration_resumes(self):
+        """Test a migration stopped between batches picks up where it left off"""
+        def stop(version, copied):
+            if version == 2:
+                raise KeyboardInterrupt
+        
+        with pytest.raises(KeyboardInterrupt):
+            migrate(self.conn, batch_size=1, progress=stop)
+        assert self.conn.execute('SELECT COUNT(*) FROM cakeday_v2').fetchone()[0] == 1
+        
+        copied = []
+        assert migrate(self.conn, batch_size=1, progress=lambda version, count: copied.append((version, count))) == [
+            2, 3, 4, 5]
+        
+        assert copied == [(2, 1), (2, 2), (2, 3)]
+        assert len(self.rows()) == 4
+    
+    def test_concurrent_writes_carried_over(self):
+        """Test writes made by another connection during the copy end up in the migrated table"""
+        other = sqlite3.connect(self.db_path)
+        
+        def write(version, copied):
+            if version == 2 and copied == 1:
+                other.execute("UPDATE cakeday SET birthday = '01-16' WHERE name = 'John Doe'")
+                other.execute("DELETE FROM cakeday WHERE name = 'Alice Brown'")
+                other.execute("INSERT INTO cakeday (name, birthday, notification, adv_days) VALUES ('Eve Adams', '03-01', 'y', 2)")
+                other.commit()
+        
+        migrate(self.conn, batch_size=1, progress=write)
+        other.close()
+        
+        assert [row[:5] for row in self.rows()] == [
+            ('Bob Wilson', '02-29', 'n', 0, 229),
+            ('Eve Adams', '03-01', 'y', 2, 301),
+            ('Jane Smith', '06-30', 'n', 0, 630),
+            ('John Doe', '01-16', 'y', 14, 116),
+        ]
+    
+    def test_name_index_filled_in_batches(self):
+        """Test writes made while the name index fills leave it consistent, and an interrupted fill resumes"""
+        other = sqlite3.connect(self.db_path)
+        
+        def write(version, filled):
+            if version == 1 and filled == 1:
+                other.execute("UPDATE cakeday SET name = 'Johnny Doe' WHERE name = 'John Doe'")
+                other.execute("UPDATE cakeday SET name = 'Alicia Brown' WHERE name = 'Alice Brown'")
+                other.execute("DELETE FROM cakeday WHERE name = 'Jane Smith'")
+                other.execute("INSERT INTO cakeday VALUES ('Eve Adams', '03-01', 'y', 2, NULL)")
+                other.commit()
+            if version == 1 and filled == 2:
+                raise KeyboardInterrupt
+        
+        with pytest.raises(KeyboardInterrupt):
+            migrate(self.conn, batch_size=1, progress=write)
+        assert schema_version(self.conn) == 0
+        migrate(self.conn, batch_size=1)
+        other.close()
+        
+        self.conn.execute("INSERT INTO cakeday_fts (cakeday_fts) VALUES ('integrity-check')")
+        def search(fragment):
+            return [name for name, in self.conn.execute('SELECT name FROM cakeday_fts WHERE cakeday_fts MATCH ?',
+                                                         (f'"{fragment}"',))]
+        
+        assert (search('ohn'), search('ici'), search('ada'), search('smi')) == (['Johnny Doe'], ['Alicia Brown'],
+                                                                               ['Eve Adams'], [])
+    
+    def test_newer_database_rejected(self):
+        """Test a database from a newer release is left alone"""
+        self.conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION + 1}')
+        
+        with pytest.raises(MigrationError, match="newer"):
+            migrate(self.conn)
+    
+    def test_operations_after_migration(self):
+        """Test the operations API works against a migrated database"""
+        migrate(self.conn)
+        operations.configure_pool(self.db_path)
+        
+        result = operations.add_birthdays([('Eve Adams', '03-01', 'y', 2)])
+        
+        assert result.succeeded == ['Eve Adams']
+        assert operations.get_by_name('John Doe') == ('John Doe', '01-15', 'y', 14)
+        assert [row[0] for row in operations.search_names('Adams')] == ['Eve Adams']
@@ -0,0 +1,229 @@
+import pytest
+import sys
+import os
+import smtplib
+import sqlite3
+from datetime import datetime, timedelta
+
+# Add the src directory to the path to import notifications
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'cakeday'))
+
+import notifications
+import operations
+
+SETTINGS = notifications.SmtpSettings(
+    host='localhost', port=8025, username=None, password=None, starttls=False,
+    sender='cakeday@example.com', recipient='me@example.com',
+)
+
+
+class FakeSMTP:
+    """Stand-in for smtplib.SMTP that records what it sends"""
+    
+    connections = []
+    failures = []
+    
+    def __init__(self, host, port, timeout=None):
+        self.sent = []
+        self.closed = False
+        FakeSMTP.connections.append(self)
+    
+    def send_message(self, message):
+        if FakeSMTP.failures:
+            raise FakeSMTP.failures.pop(0)
+        self.sent.append(message)
+    
+    def quit(self):
+        self.closed = True
+    
+    def close(self):
+        self.closed = True
+
+
+class NotificationDatabaseTest:
+    """Shared setup pointing the pool at a temporary database"""
+    
+    @pytest.fixture(autouse=True)
+    def database(self, pooled_db):
+        """Set up test database with sample records"""
+        self.db_path = pooled_db
+        operations.add_birthdays([
+            ('Alice', '07-25', 'y', 10),    # notice opens 07-15
+            ('Bob', '07-15', 'y', 0),       # notice opens on the birthday
+            ('Carol', '07-22', 'y', 7),     # notice opens 07-15
+            ('Dave', '07-25', 'n', 0),      # opted out
+            ('Eve', '07-26', 'y', 10),      # notice opens 07-16
+            ('NewYear', '01-05', 'y', 21),  # notice opens 12-15 of the previous year
+            ('Leap', '02-29', 'y', 3),      # notice opens 02-25 in non-leap years
+        ])
+        FakeSMTP.connections = []
+        FakeSMTP.failures = []
+
+
+class TestGetDueNotifications(NotificationDatabaseTest):
+    """Test cases for get_due_notifications"""
+    
+    def test_due_today(self):
+        """Test only opted-in records whose window opens on the date are returned"""
+        due = notifications.get_due_notifications(datetime(2024, 7, 15))
+        
+        assert [(notice.name, notice.adv_days) for notice in due] == [('Alice', 10), ('Bob', 0), ('Carol', 7)]
+        assert due[0].birthday_date == datetime(2024, 7, 25)
+    
+    def test_row_written_outside_operations(self):
+        """Test a row inserted with only the caller-written columns is found through the month_day index"""
+        soon = (datetime.now() + timedelta(days=1)).strftime('%m-%d')
+        conn = sqlite3.connect(self.db_path)
+        conn.executemany('INSERT INTO cakeday (name, birthday, notification, adv_days) VALUES (?, ?, ?, ?)',
+                         [('Zed', '07-20', 'y', 5), ('Soon', soon, 'n', 0)])
+        conn.commit()
+        conn.close()
+        
+        assert 'Zed' in [notice.name for notice in notifications.get_due_notifications(datetime(2024, 7, 15))]
+        assert 'Soon' in [record[0] for record in operations.get_upcoming_birthdays(7)]
+    
+    def test_calendar_index_matches_sql(self):
+        """Test notices read from the calendar index match the index-scan query for every day of a year"""
+        start = datetime(2023, 1, 1)
+        expected = {}
+        for offset in range(0, 366, 5):
+            day = start + timedelta(days=offset)
+            expected[day] = notifications.get_due_notifications(day, day + timedelta(days=4))
+        
+        operations.enable_calendar_index()
+        for day, due in expected.items():
+            assert notifications.get_due_notifications(day, day + timedelta(days=4)) == due
+    
+    def test_due_batches_page_the_scan(self):
+        """Test paged reads return the same notices as the streaming scan, at most batch_size at a time"""
+        operations.add_birthdays([(f'Person {i}', '07-20', 'y', 5) for i in range(5)])
+        start, end = datetime(2024, 7, 15), datetime(2024, 7, 16)
+        
+        pages = list(notifications.iter_due_batches(start, end, batch_size=2))
+        
+        assert all(len(page) <= 2 for page in pages)
+        assert sorted(notice for page in pages for notice in page) == \
+            sorted(notifications.iter_due_notifications(start, end))
+    
+    def test_due_range(self):
+        """Test a date range covers every notice opening inside it"""
+        due = notifications.get_due_notifications(datetime(2024, 7, 15), datetime(2024, 7, 16))
+        
+        assert [notice.name for notice in due] == ['Alice', 'Bob', 'Carol', 'Eve']
+    
+    def test_due_across_year_end(self):
+        """Test a notice for a January birthday opens in December"""
+        due = notifications.get_due_notifications(datetime(2024, 12, 15))
+        
+        assert [notice.name for notice in due] == ['NewYear']
+        assert due[0].birthday_date == datetime(2025, 1, 5)
+    
+    def test_due_feb_29_in_non_leap_year(self):
+        """Test Feb 29 birthdays are counted back from Feb 28 in non-leap years"""
+        assert [notice.name for notice in notifications.get_due_notifications(datetime(2023, 2, 25))] == ['Leap']
+        assert [notice.name for notice in notifications.get_due_notifications(datetime(2024, 2, 26))] == ['Leap']
+
+
+class TestDispatch(NotificationDatabaseTest):
+    """Test cases for dispatch and SMTPConnectionPool"""
+    
+    def test_dispatch_reuses_connections(self):
+        """Test every due reminder is sent over a single pooled connection"""
+        result = notifications.dispatch(datetime(2024, 7, 15), SETTINGS, pool_size=1, smtp_factory=FakeSMTP)
+        
+        assert result.sent == 3
+        assert result.failed == []
+        assert len(FakeSMTP.connections) == 1
+        subjects = [message['Subject'] for message in FakeSMTP.connections[0].sent]
+        assert subjects == ['Birthday reminder: Alice in 10 days', 'Birthday reminder: Bob today',
+                            'Birthday reminder: Carol in 7 days']
+        assert FakeSMTP.connections[0].closed
+    
+    def test_transient_failure_is_retried_on_new_connection(self):
+        """Test a dropped connection is replaced and the message retried"""
+        FakeSMTP.failures = [smtplib.SMTPServerDisconnected("gone")]
+        pool = notifications.SMTPConnectionPool(SETTINGS, size=1, backoff=0, smtp_factory=FakeSMTP)
+        
+        pool.send("message")
+        
+        assert len(FakeSMTP.connections) == 2
+        assert FakeSMTP.connections[1].sent == ["message"]
+    
+    def test_permanent_failure_is_not_retried(self):
+        """Test a 5xx rejection is reported without retrying"""
+        FakeSMTP.failures = [smtplib.SMTPDataError(550, b"rejected")]
+        
+        result = notifications.dispatch(datetime(2024, 12, 15), SETTINGS, pool_size=1, smtp_factory=FakeSMTP)
+        
+        assert result.sent == 0
+        assert [name for name, _ in result.failed] == ['NewYear']
+        assert len(FakeSMTP.connections) == 1
+    
+    def test_settings_from_env(self):
+        """Test SMTP settings are read from the environment"""
+        settings = notifications.settings_from_env({'CAKEDAY_SMTP_HOST': 'relay', 'CAKEDAY_SMTP_PORT': '8025',
+                                                    'CAKEDAY_MAIL_TO': 'me@example.com'})
+        
+        assert (settings.host, settings.port, settings.recipient) == ('relay', 8025, 'me@example.com')
+        assert settings.starttls is False
+
+
+class TestNotificationLedger(NotificationDatabaseTest):
+    """Test cases for the sent_notifications ledger and dispatch watermark"""
+    
+    def dispatch(self, on_date):
+        return notifications.dispatch(on_date, SETTINGS, pool_size=1, smtp_factory=FakeSMTP)
+    
+    def sent_names(self):
+        return [message['Subject'].split(': ')[1].split(' ')[0]
+                for smtp in FakeSMTP.connections for message in smtp.sent]
+    
+    def test_rerun_sends_nothing_twice(self):
+        """Test a second run on the same day sends no duplicates"""
+        first = self.dispatch(datetime(2024, 7, 15))
+        second = self.dispatch(datetime(2024, 7, 15))
+        
+        assert first.sent == 3
+        assert (second.sent, second.skipped) == (0, 0)
+        assert self.sent_names() == ['Alice', 'Bob', 'Carol']
+        assert notifications.get_watermark() == datetime(2024, 7, 15)
+    
+    def test_run_catches_up_from_watermark(self):
+        """Test a run after a missed day covers every day since the watermark"""
+        notifications.set_watermark(datetime(2024, 7, 14))
+        
+        result = self.dispatch(datetime(2024, 7, 16))
+        
+        assert result.sent == 4
+        assert self.sent_names() == ['Alice', 'Bob', 'Carol', 'Eve']
+    
+    def test_overlapping_run_skips_claimed_notices(self):
+        """Test notices claimed by another in-flight run are not sent again"""
+        due = notifications.get_due_notifications(datetime(2024, 7, 15))
+        assert len(notifications.claim_notifications(due[:1])) == 1
+        
+        result = self.dispatch(datetime(2024, 7, 15))
+        
+        assert (result.sent, result.skipped) == (2, 1)
+        assert self.sent_names() == ['Bob', 'Carol']
+    
+    def test_stale_claim_is_taken_over(self):
+        """Test a claim left by a crashed run is retried after the lease expires"""
+        due = notifications.get_due_notifications(datetime(2024, 7, 15))
+        notifications.claim_notifications(due[:1], now=datetime.now() - notifications.CLAIM_LEASE * 2)
+        
+        result = self.dispatch(datetime(2024, 7, 15))
+        
+        assert (result.sent, result.skipped) == (3, 0)
+    
+    def test_failed_send_is_retried_next_run(self):
+        """Test a failed reminder is released and the watermark held back for it"""
+        FakeSMTP.failures = [smtplib.SMTPDataError(550, b"rejected")]
+        
+        first = self.dispatch(datetime(2024, 7, 15))
+        assert (first.sent, [name for name, _ in first.failed]) == (2, ['Alice'])
+        assert notifications.get_watermark() == datetime(2024, 7, 14)
+        
+        second = self.dispatch(datetime(2024, 7, 15))
+        assert (second.sent, second.skipped) == (1, 2)
+        assert self.sent_names() == ['Bob', 'Carol', 'Alice']
@@ -4,7 +4,7 @@ import os
 import sqlite3
 import tempfile
 from datetime import datetime
-from unittest.mock import patch, MagicMock, mock_open
+from unittest.mock import patch, MagicMock
 
 # Add the src directory to the path to import operations
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'cakeday'))
@@ -20,6 +20,7 @@ class TestValidationFunctions:
         assert operations.validate_birthday_format("01-15") == True
         assert operations.validate_birthday_format("12-31") == True
         assert operations.validate_birthday_format("06-30") == True
+        assert operations.validate_birthday_format("02-29") == True
     
     def test_validate_birthday_format_invalid(self):
         """Test validate_birthday_format with invalid inputs"""
@@ -30,6 +31,10 @@ class TestValidationFunctions:
         assert operations.validate_birthday_format("01-15-2023") == False
         assert operations.validate_birthday_format("invalid") == False
         assert operations.validate_birthday_format("") == False
+        assert operations.validate_birthday_format("13-01") == False
+        assert operations.validate_birthday_format("00-10") == False
+        assert operations.validate_birthday_format("02-30") == False
+        assert operations.validate_birthday_format("04-31") == False
     
     def test_validate_notification_input_valid(self):
         """Test validate_notification_input with valid inputs"""
@@ -51,6 +56,64 @@ class TestValidationFunctions:
         assert operations.validate_notification_input("") == False
 
 
+class TestMonthDayHelpers:
+    """Test cases for the month_day key helpers"""
+    
+    def test_birthday_to_month_day(self):
+        """Test birthday_to_month_day converts mm-dd to an integer key"""
+        assert operations.birthday_to_month_day("01-05") == 105
+        assert operations.birthday_to_month_day("12-31") == 1231
+        assert operations.birthday_to_month_day("02-29") == 229
+    
+    def test_month_day_ranges_same_year(self):
+        """Test month_day_ranges for a window inside one year"""
+        assert operations.month_day_ranges(datetime(2024, 7, 15), 30) == [(715, 814)]
+    
+    def test_month_day_ranges_year_boundary(self):
+        """Test month_day_ranges splits a window crossing New Year"""
+        assert operations.month_day_ranges(datetime(2024, 12, 20), 30) == [(1220, 1231), (101, 119)]
+    
+    def test_month_day_ranges_feb_28_non_leap_year(self):
+        """Test month_day_ranges includes Feb 29 when the window ends on Feb 28 of a non-leap year"""
+        assert operations.month_day_ranges(datetime(2023, 2, 20), 8) == [(220, 229)]
+        assert operations.month_day_ranges(datetime(2024, 2, 20), 8) == [(220, 228)]
+    
+    def test_month_day_ranges_full_year(self):
+        """Test month_day_ranges covers every day for windows of a year or more"""
+        assert operations.month_day_ranges(datetime(2024, 7, 15), 365) == [(101, 1231)]
+
+
+class TestNormalizeRecord:
+    """Test cases for normalize_record"""
+    
+    def test_normalize_record_valid(self):
+        """Test a valid record is converted to a stored row"""
+        row = operations.normalize_record({'name': ' John Doe ', 'birthday': '01-15', 'notification': 'Y', 'adv_days': '14'})
+        assert row == ('John Doe', '01-15', 'y', 14)
+    
+    def test_normalize_record_tuple(self):
+        """Test a record tuple in RECORD_FIELDS order is accepted"""
+        row = operations.normalize_record(('John Doe', '02-29', 'yes', 3))
+        assert row == ('John Doe', '02-29', 'yes', 3)
+    
+    def test_normalize_record_no_notification_zeroes_adv_days(self):
+        """Test adv_days is stored as 0 when notifications are off"""
+        row = operations.normalize_record({'name': 'Jane', 'birthday': '06-30', 'notification': 'n', 'adv_days': '5'})
+        assert row == ('Jane', '06-30', 'n', 0)
+    
+    @pytest.mark.parametrize('record', [
+        {'name': '', 'birthday': '01-15', 'notification': 'y', 'adv_days': 1},
+        {'name': 'John', 'birthday': '1-15', 'notification': 'y', 'adv_days': 1},
+        {'name': 'John', 'birthday': '01-15', 'notification': 'maybe', 'adv_days': 1},
+        {'name': 'John', 'birthday': '01-15', 'notification': 'y', 'adv_days': 'soon'},
+        {'name': 'John', 'birthday': '01-15', 'notification': 'y', 'adv_days': -1},
+    ])
+    def test_normalize_record_invalid(self, record):
+        """Test invalid records raise ValueError"""
+        with pytest.raises(ValueError):
+            operations.normalize_record(record)
+
+
 class TestDatabaseFunctions:
     """Test cases for database functions"""
     
@@ -89,7 +152,7 @@ class TestDatabaseFunctions:
         result = operations.get_all()
         
         assert result == []
-        mock_cursor.execute.assert_called_once_with('SELECT * FROM cakeday ORDER BY name')
+        mock_cursor.execute.assert_called_once_with('SELECT name, birthday, notification, adv_days, month, day FROM cakeday ORDER BY name')
     
     @patch('operations.get_db_connection')
     def test_get_all_with_records(self, mock_get_db_connection):
@@ -121,7 +184,7 @@ class TestDatabaseFunctions:
         result = operations.get_by_name("John Doe")
         
         assert result == ("John Doe", "01-15", "y", 14)
-        mock_cursor.execute.assert_called_once_with('SELECT * FROM cakeday WHERE name = ?', ("John Doe",))
+        mock_cursor.execute.assert_called_once_with('SELECT name, birthday, notification, adv_days, month, day FROM cakeday WHERE name = ?', ("John Doe",))
     
     @patch('operations.get_db_connection')
     def test_get_by_name_not_found(self, mock_get_db_connection):
@@ -137,6 +200,232 @@ class TestDatabaseFunctions:
         assert result is None
 
 
+class RealDatabase:
+    """Shared setup pointing the shared pool at a fresh temporary database"""
+    
+    @pytest.fixture(autouse=True)
+    def database(self, pooled_db, tmp_path):
+        """Point the shared pool at a fresh database"""
+        self.db_path = pooled_db
+        self.tmp_path = tmp_path
+
+
+class TestBatchApi(RealDatabase):
+    """Test cases for the non-interactive add/update/delete API"""
+    
+    def test_add_birthdays_batch(self):
+        """Test add_birthdays writes valid records and reports failures"""
+        result = operations.add_birthdays([
+            {'name': 'John Doe', 'birthday': '01-15', 'notification': 'y', 'adv_days': 14},
+            ('Jane Smith', '06-30', 'n', 0),
+            ('John Doe', '02-20', 'n', 0),
+            ('Bad Date', '6-30', 'n', 0),
+        ])
+        
+        assert result.succeeded == ['John Doe', 'Jane Smith']
+        assert [name for name, _ in result.failed] == ['John Doe', 'Bad Date']
+        assert "already exists" in result.failed[0][1]
+        assert operations.get_all() == [("Jane Smith", "06-30", "n", 0), ("John Doe", "01-15", "y", 14)]
+    
+    def test_add_birthdays_single_record(self):
+        """Test add_birthdays accepts a single record"""
+        result = operations.add_birthdays(('John Doe', '01-15', 'y', 14))
+        
+        assert result.succeeded == ['John Doe']
+        assert result.failed == []
+    
+    def test_update_birthdays_partial_change(self):
+        """Test update_birthdays keeps fields that are not supplied"""
+        operations.add_birthdays([('John Doe', '01-15', 'y', 14), ('Jane Smith', '06-30', 'y', 7)])
+        
+        result = operations.update_birthdays([
+            {'name': 'John Doe', 'birthday': '02-20'},
+            {'name': 'Jane Smith', 'notification': 'n'},
+            {'name': 'Nobody', 'birthday': '03-03'},
+        ])
+        
+        assert result.succeeded == ['John Doe', 'Jane Smith']
+        assert result.failed == [('Nobody', 'No record found for Nobody')]
+        assert operations.get_by_name('John Doe') == ('John Doe', '02-20', 'y', 14)
+        assert operations.get_by_name('Jane Smith') == ('Jane Smith', '06-30', 'n', 0)
+        with operations.get_db_connection() as conn:
+            assert conn.execute("SELECT month_day FROM cakeday WHERE name = 'John Doe'").fetchone() == (220,)
+    
+    def test_delete_birthdays(self):
+        """Test delete_birthdays removes names and reports missing ones"""
+        operations.add_birthdays([('John Doe', '01-15', 'y', 14), ('Jane Smith', '06-30', 'n', 0)])
+        
+        result = operations.delete_birthdays(['John Doe', 'Nobody'])
+        
+        assert result.succeeded == ['John Doe']
+        assert result.failed == [('Nobody', 'No record found for Nobody')]
+        assert operations.get_all() == [("Jane Smith", "06-30", "n", 0)]
+    
+    def test_delete_birthdays_accepts_tuple(self):
+        """Test a tuple of names is a batch of names, not one record"""
+        operations.add_birthdays([('John Doe', '01-15', 'y', 14), ('Jane Smith', '06-30', 'n', 0)])
+        
+        assert operations.delete_birthdays(('John Doe', 'Jane Smith')).succeeded == ['John Doe', 'Jane Smith']
+        assert operations.get_all() == []
+    
+    def test_batch_rolled_back_on_unexpected_error(self):
+        """Test an unexpected error leaves none of the batch written"""
+        with patch('operations.normalize_record', side_effect=[('John Doe', '01-15', 'y', 14), RuntimeError("boom")]):
+            with pytest.raises(RuntimeError):
+                operations.add_birthdays([('John Doe', '01-15', 'y', 14), ('Jane Smith', '06-30', 'n', 0)])
+        
+        assert operations.get_all() == []
+
+
+class TestReadCache(RealDatabase):
+    """Test cases for the cached get_by_name/get_all path"""
+    
+    @pytest.fixture(autouse=True)
+    def records(self, database):
+        """Set up test database with one record and enable the cache"""
+        operations.add_birthdays(('John Doe', '01-15', 'y', 14))
+        operations.enable_cache()
+    
+    def test_repeated_reads_hit_cache(self):
+        """Test repeated reads are served from memory"""
+        for _ in range(3):
+            assert operations.get_by_name('John Doe') == ('John Doe', '01-15', 'y', 14)
+            assert operations.get_all() == [('John Doe', '01-15', 'y', 14)]
+        
+        stats = operations.cache_stats()
+        assert (stats['hits'], stats['misses']) == (4, 2)
+
+    def test_cached_record_cannot_be_changed(self):
+        """Test a caller cannot alter the record later reads are served from"""
+        record = operations.get_by_name('John Doe')
+        assert (record.month, record.day) == (1, 15)
+        with pytest.raises(AttributeError):
+            record.adv_days = 0
+        assert operations.get_by_name('John Doe') == ('John Doe', '01-15', 'y', 14)
+    
+    def test_writes_invalidate_cache(self):
+        """Test every write path drops stale entries"""
+        assert operations.get_by_name('Jane Smith') is None
+        operations.get_all()
+        
+        operations.add_birthdays(('Jane Smith', '06-30', 'n', 0))
+        assert operations.get_by_name('Jane Smith') == ('Jane Smith', '06-30', 'n', 0)
+        
+        operations.update_birthdays({'name': 'John Doe', 'birthday': '02-20'})
+        assert operations.get_by_name('John Doe') == ('John Doe', '02-20', 'y', 14)
+        
+        operations.delete_birthdays('Jane Smith')
+        assert operations.get_by_name('Jane Smith') is None
+        assert operations.get_all() == [('John Doe', '02-20', 'y', 14)]
+    
+    def test_own_write_keeps_other_entries(self):
+        """Test a write through operations.py only drops the entries it touched"""
+        operations.get_by_name('John Doe')
+        operations.add_birthdays(('Jane Smith', '06-30', 'n', 0))
+        operations.get_by_name('John Doe')
+        
+        assert operations.cache_stats()['hits'] == 1
+    
+    def test_external_write_detected_by_write_count(self):
+        """Test a write from another process is picked up"""
+        assert operations.get_by_name('Jane Smith') is None
+        
+        other = sqlite3.connect(self.db_path)
+        other.execute("INSERT INTO cakeday VALUES ('Jane Smith', '06-30', 'n', 0)")
+        other.commit()
+        other.close()
+        
+        assert operations.get_by_name('Jane Smith') == ('Jane Smith', '06-30', 'n', 0)
+    
+    def test_keyset_pages_and_iter_all(self):
+        """Test get_page pages forward/back by name and iter_all streams every record"""
+        operations.disable_cache()
+        operations.add_birthdays([(f"Person {i}", "01-15", "n", 0) for i in range(5)])
+        
+        first = operations.get_page(page_size=2)
+        second = operations.get_page(after=first[-1][0], page_size=2)
+        
+        assert [record[0] for record in first] == ['John Doe', 'Person 0']
+        assert [record[0] for record in second] == ['Person 1', 'Person 2']
+        assert operations.get_page(before=second[0][0], page_size=2) == first
+        assert [record[0] for record in operations.iter_all(page_size=2)] == [record[0] for record in operations.get_all()]
+    
+    def test_cache_stats_none_when_disabled(self):
+        """Test cache_stats reports None while the cache is off"""
+        operations.disable_cache()
+        assert operations.cache_stats() is None
+
+
+class TestSearchNames(RealDatabase):
+    """Test cases for search_names"""
+    
+    @pytest.fixture(autouse=True)
+    def records(self, database):
+        """Set up test database with sample names"""
+        operations.add_birthdays([(name, '01-15', 'n', 0) for name in
+                                  ['Jonathan Smith', 'John Doe', 'Johnny Cash', 'Jane Smyth', 'Bob']])
+    
+    def names(self, query, **kwargs):
+        return [record[0] for record in operations.search_names(query, **kwargs)]
+    
+    def test_exact_then_prefix_then_substring(self):
+        """Test exact matches rank before prefixes and prefixes before substrings"""
+        operations.add_birthdays(('Big John', '02-02', 'n', 0))
+        
+        assert self.names('john') == ['John Doe', 'Johnny Cash', 'Big John']
+        assert self.names('John Doe')[0] == 'John Doe'
+    
+    def test_prefix_not_crowded_out(self):
+        """Test a prefix match is returned even when more than limit better-ranked substring matches exist"""
+        operations.add_birthdays([(f'Jo Smith{i:02d}', '03-03', 'n', 0) for i in range(40)] +
+                                 [('Smithfield Bartholomew-Winchester', '03-03', 'n', 0)])
+        
+        assert self.names('smith', limit=10)[0] == 'Smithfield Bartholomew-Winchester'
+    
+    def test_substring_is_case_insensitive(self):
+        """Test a fragment from the middle of a name is found"""
+        assert self.names('SMIT') == ['Jonathan Smith']
+    
+    def test_typo_tolerant(self):
+        """Test misspelled names are found through shared trigrams"""
+        assert self.names('smiht') == ['Jonathan Smith']
+        assert self.names('jonathon') == ['Jonathan Smith']
+        assert self.names('jhon doe') == ['John Doe']
+        assert self.names('jane smith') == ['Jane Smyth', 'Jonathan Smith']
+    
+    def test_short_query_uses_prefix(self):
+        """Test queries shorter than a trigram match name prefixes"""
+        assert self.names('jo') == ['John Doe', 'Johnny Cash', 'Jonathan Smith']
+        assert self.names('B') == ['Bob']
+    
+    def test_prefix_ignores_case(self):
+        """Test a prefix in any casing finds names with inner capitals"""
+        operations.add_birthdays(('McDonald Ross', '04-04', 'n', 0))
+        
+        assert self.names('mc') == self.names('MC') == ['McDonald Ross']
+        assert self.names('mcdonald') == ['McDonald Ross']
+    
+    def test_common_fragment_bounded(self):
+        """Test a fragment in more names than FTS_CANDIDATES still fills the limit"""
+        operations.add_birthdays([(f'Ann Person{i:04d}', '05-05', 'n', 0) for i in range(operations.FTS_CANDIDATES + 50)])
+        
+        results = self.names('erson', limit=5)
+        
+        assert len(results) == 5 and all('erson' in name for name in results)
+    
+    def test_index_follows_writes(self):
+        """Test triggers keep the search index in sync with cakeday"""
+        operations.delete_birthdays('Bob')
+        operations.add_birthdays(('Roberta Flack', '02-10', 'n', 0))
+        
+        assert self.names('bob') == []
+        assert self.names('berta') == ['Roberta Flack']
+    
+    def test_empty_query(self):
+        """Test an empty query returns nothing"""
+        assert operations.search_names('  ') == []
+
+
 class TestCreateFunction:
     """Test cases for create function"""
     
@@ -174,7 +463,7 @@ class TestCreateFunction:
             
             assert "Successfully added birthday for John Doe" in captured.out
             mock_cursor.execute.assert_called_with(
-                'INSERT INTO cakeday VALUES (?, ?, ?, ?)', 
+                'INSERT INTO cakeday (name, birthday, notification, adv_days) VALUES (?, ?, ?, ?)',
                 ("John Doe", "01-15", "y", 14)
             )
     
@@ -223,7 +512,7 @@ class TestCreateFunction:
                 
                 assert "Successfully added birthday for John Doe" in captured.out
                 mock_cursor.execute.assert_called_with(
-                    'INSERT INTO cakeday VALUES (?, ?, ?, ?)', 
+                    'INSERT INTO cakeday (name, birthday, notification, adv_days) VALUES (?, ?, ?, ?)',
                     ("John Doe", "01-15", "n", 0)
                 )
 
@@ -316,7 +605,7 @@ class TestUpdateFunction:
             
             assert "Successfully updated birthday for John Doe" in captured.out
             mock_cursor.execute.assert_called_with(
-                'UPDATE cakeday SET birthday = ?, notification = ?, adv_days = ? WHERE name = ?', 
+                'UPDATE cakeday SET birthday = ?, notification = ?, adv_days = ? WHERE name = ?',
                 ("02-20", "n", 0, "John Doe")
             )
     
@@ -336,7 +625,7 @@ class TestUpdateFunction:
             
             assert "Successfully updated birthday for John Doe" in captured.out
             mock_cursor.execute.assert_called_with(
-                'UPDATE cakeday SET birthday = ?, notification = ?, adv_days = ? WHERE name = ?', 
+                'UPDATE cakeday SET birthday = ?, notification = ?, adv_days = ? WHERE name = ?',
                 ("01-15", "y", 14, "John Doe")
             )
 
@@ -361,7 +650,10 @@ class TestUpcomingBirthdays:
         result = operations.get_upcoming_birthdays(30)
         
         assert result == []
-        mock_cursor.execute.assert_called_once_with('SELECT * FROM cakeday ORDER BY name')
+        mock_cursor.execute.assert_called_once_with(
+            'SELECT name, birthday, month, day FROM cakeday WHERE month_day BETWEEN ? AND ?',
+            [715, 814]
+        )
     
     @patch('operations.get_db_connection')
     @patch('operations.datetime')
@@ -374,11 +666,11 @@ class TestUpcomingBirthdays:
         mock_conn = MagicMock()
         mock_cursor = MagicMock()
         mock_cursor.fetchall.return_value = [
-            ("Alice", "07-15", "y", 14),  # Today
-            ("Bob", "07-16", "y", 7),     # Tomorrow 
-            ("Charlie", "07-25", "n", 0), # 10 days away
-            ("Dave", "08-15", "y", 14),   # 31 days away (outside window)
-            ("Eve", "06-15", "y", 14),    # Past birthday, next year
+            ("Alice", "07-15", 7, 15),  # Today
+            ("Bob", "07-16", 7, 16),     # Tomorrow 
+            ("Charlie", "07-25", 7, 25), # 10 days away
+            ("Dave", "08-15", 8, 15),   # 31 days away (outside window)
+            ("Eve", "06-15", 6, 15),    # Past birthday, next year
         ]
         mock_conn.cursor.return_value = mock_cursor
         mock_get_db_connection.return_value.__enter__.return_value = mock_conn
@@ -414,7 +706,7 @@ class TestUpcomingBirthdays:
         mock_conn = MagicMock()
         mock_cursor = MagicMock()
         mock_cursor.fetchall.return_value = [
-            ("LeapYear", "02-29", "y", 14),  # Feb 29 - should work in leap year
+            ("LeapYear", "02-29", 2, 29),  # Feb 29 - should work in leap year
         ]
         mock_conn.cursor.return_value = mock_cursor
         mock_get_db_connection.return_value.__enter__.return_value = mock_conn
@@ -437,7 +729,7 @@ class TestUpcomingBirthdays:
         mock_conn = MagicMock()
         mock_cursor = MagicMock()
         mock_cursor.fetchall.return_value = [
-            ("LeapYear", "02-29", "y", 14),  # Feb 29 - should fallback to Feb 28
+            ("LeapYear", "02-29", 2, 29),  # Feb 29 - should fallback to Feb 28
         ]
         mock_conn.cursor.return_value = mock_cursor
         mock_get_db_connection.return_value.__enter__.return_value = mock_conn
@@ -460,8 +752,8 @@ class TestUpcomingBirthdays:
         mock_conn = MagicMock()
         mock_cursor = MagicMock()
         mock_cursor.fetchall.return_value = [
-            ("NewYear", "01-05", "y", 14),  # Jan 5 next year
-            ("Christmas", "12-25", "y", 14), # Dec 25 this year
+            ("NewYear", "01-05", 1, 5),  # Jan 5 next year
+            ("Christmas", "12-25", 12, 25), # Dec 25 this year
         ]
         mock_conn.cursor.return_value = mock_cursor
         mock_get_db_connection.return_value.__enter__.return_value = mock_conn
@@ -488,8 +780,8 @@ class TestUpcomingBirthdays:
         mock_conn = MagicMock()
         mock_cursor = MagicMock()
         mock_cursor.fetchall.return_value = [
-            ("Alice", "07-20", "y", 14),  # 5 days away
-            ("Bob", "07-25", "y", 7),     # 10 days away
+            ("Alice", "07-20", 7, 20),  # 5 days away
+            ("Bob", "07-25", 7, 25),     # 10 days away
         ]
         mock_conn.cursor.return_value = mock_cursor
         mock_get_db_connection.return_value.__enter__.return_value = mock_conn
@@ -500,4 +792,25 @@ class TestUpcomingBirthdays:
         # Should only return Alice (5 days away)
         assert len(result) == 1
         assert result[0][0] == "Alice"
-        assert result[0][2] == 5
\ No newline at end of file
+        assert result[0][2] == 5
+    @patch('operations.datetime')
+    def test_get_upcoming_birthdays_sql_range_scan(self, mock_datetime):
+        """Test get_upcoming_birthdays only fetches rows inside the window from a real database"""
+        mock_datetime.now.return_value = datetime(2023, 12, 20, 15, 30)
+        mock_datetime.side_effect = lambda *args, **kwargs: datetime(*args, **kwargs)
+        
+        conn = sqlite3.connect(':memory:')
+        with open(operations.SCHEMA_PATH) as f:
+            conn.executescript(f.read())
+        conn.executemany(
+            'INSERT INTO cakeday (name, birthday, notification, adv_days) VALUES (?, ?, ?, ?)',
+            [(name, bday, 'n', 0)
+             for name, bday in [("Today", "12-20"), ("NewYear", "01-05"), ("Past", "12-19"),
+                                ("Far", "06-01"), ("Leap", "02-29")]]
+        )
+        
+        with patch('operations.get_db_connection') as mock_get_db_connection:
+            mock_get_db_connection.return_value.__enter__.return_value = conn
+            result = operations.get_upcoming_birthdays(30)
+        
+        assert [(record[0], record[2]) for record in result] == [("Today", 0), ("NewYear", 16)]
@@ -0,0 +1,126 @@
+import pytest
+import sys
+import os
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+# Add the src directory to the path to import parallel
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'cakeday'))
+
+import notifications
+import operations
+import parallel
+from operations import use_tenant
+from tests.test_operations import RealDatabase
+
+
+def sample_records(prefix, count):
+    """Records spread over the whole year, half of them opted in"""
+    return [(f"{prefix} {i:03d}", f"{i % 12 + 1:02d}-{i % 28 + 1:02d}", 'y' if i % 2 else 'n', i % 15)
+            for i in range(count)]
+
+
+class TestRowRanges(RealDatabase):
+    """Test cases for row_ranges"""
+    
+    def test_ranges_cover_every_rowid(self):
+        """Test the ranges are contiguous and cover the table"""
+        operations.add_birthdays(sample_records('Person', 10))
+        
+        assert parallel.row_ranges(self.db_path, 3) == [(1, 4), (5, 8), (9, 10)]
+        assert parallel.row_ranges(self.db_path, 1) == [(1, 10)]
+    
+    def test_empty_table(self):
+        """Test an empty table has no ranges"""
+        assert parallel.row_ranges(self.db_path, 4) == []
+
+
+class TestParallelScan(RealDatabase):
+    """Test cases for the process-pool scans of the default database"""
+    
+    @pytest.fixture(autouse=True)
+    def records(self, database):
+        """Add sample records"""
+        operations.add_birthdays(sample_records('Person', 120))
+        self.today = datetime(2024, 7, 15)
+    
+    def test_upcoming_matches_serial(self):
+        """Test the merged parallel result equals get_upcoming_birthdays"""
+        with patch('operations.datetime') as mock_datetime:
+            mock_datetime.now.return_value = self.today
+            mock_datetime.side_effect = lambda *args, **kwargs: datetime(*args, **kwargs)
+            expected = operations.get_upcoming_birthdays(60)
+        
+        result = parallel.parallel_upcoming(60, today=self.today, workers=2, min_rows_per_task=10)
+        
+        assert result == expected
+        assert len(result) > 0
+    
+    def test_due_notifications_match_serial(self):
+        """Test the merged parallel notices equal get_due_notifications"""
+        end = self.today + timedelta(days=45)
+        expected = notifications.get_due_notifications(self.today, end)
+        
+        result = parallel.parallel_due_notifications(self.today, end, workers=2, min_rows_per_task=10)
+        
+        assert result == expected
+        assert len(result) > 0
+    
+    def test_small_table_runs_inline(self):
+        """Test a table below min_rows_per_task is scanned without a process pool"""
+        with patch('parallel.ProcessPoolExecutor') as mock_executor:
+            result = parallel.parallel_upcoming(365, today=self.today)
+        
+        mock_executor.assert_not_called()
+        assert len(result) == 120
+    
+    def test_in_memory_database_rejected(self):
+        """Test an in-memory database cannot be handed to worker processes"""
+        operations.configure_pool(':memory:')
+        
+        with pytest.raises(ValueError):
+            parallel.parallel_upcoming(30)
+
+
+class TestParallelTenants(RealDatabase):
+    """Test cases for the process-pool scans across tenant shards"""
+    
+    @pytest.fixture(autouse=True)
+    def shards(self, database):
+        """Create two tenant shards"""
+        operations.configure_shards(str(self.tmp_path / 'tenants'))
+        for tenant in ('acme', 'globex'):
+            with use_tenant(tenant):
+                operations.add_birthdays(sample_records(tenant, 40))
+        self.today = datetime(2024, 7, 15)
+    
+    def teardown_method(self):
+        """Restore the shard directory"""
+        operations.configure_shards()
+    
+    def test_upcoming_matches_fan_out(self):
+        """Test the parallel scan merges shards like get_upcoming_birthdays_for_tenants"""
+        with patch('operations.datetime') as mock_datetime:
+            mock_datetime.now.return_value = self.today
+            mock_datetime.side_effect = lambda *args, **kwargs: datetime(*args, **kwargs)
+            expected = operations.get_upcoming_birthdays_for_tenants(90)
+        
+        result = parallel.parallel_upcoming(90, today=self.today, tenants=['acme', 'globex'], workers=2,
+                                            min_rows_per_task=10)
+        
+        assert result == expected
+        assert {row[0] for row in result} == {'acme', 'globex'}
+    
+    def test_due_notifications_tagged_by_tenant(self):
+        """Test notices from every shard are tagged and merged by notice date"""
+        end = self.today + timedelta(days=30)
+        expected = []
+        for tenant in ('acme', 'globex'):
+            with use_tenant(tenant):
+                expected.extend((tenant, notice) for notice in notifications.get_due_notifications(self.today, end))
+        expected.sort(key=lambda item: (item[1].notice_date, item[1].name, item[0]))
+        
+        result = parallel.parallel_due_notifications(self.today, end, tenants=['acme', 'globex'], workers=2,
+                                                     min_rows_per_task=10)
+        
+        assert result == expected
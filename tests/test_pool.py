@@ -0,0 +1,252 @@
+import pytest
+import sys
+import os
+import sqlite3
+import tempfile
+import threading
+
+# Add the src directory to the path to import pool
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'cakeday'))
+
+from pool import DEFAULT_PROFILE, ConnectionPool, PoolTimeout, retry_on_busy
+
+
+class TestConnectionPool:
+    """Test cases for ConnectionPool"""
+    
+    def setup_method(self):
+        """Set up test database"""
+        self.test_db = tempfile.NamedTemporaryFile(delete=False)
+        self.test_db.close()
+        
+        conn = sqlite3.connect(self.test_db.name)
+        conn.execute('CREATE TABLE cakeday (name TEXT PRIMARY KEY, birthday TEXT, notification TEXT, adv_days INTEGER)')
+        conn.commit()
+        conn.close()
+        
+        self.pool = ConnectionPool(self.test_db.name, size=2, timeout=0.1)
+    
+    def teardown_method(self):
+        """Clean up test database"""
+        self.pool.close()
+        os.unlink(self.test_db.name)
+    
+    def test_connection_reused_between_checkouts(self):
+        """Test sequential checkouts reuse one connection"""
+        with self.pool.connection() as first:
+            pass
+        with self.pool.connection() as second:
+            pass
+        
+        assert first is second
+        assert self.pool.opened == 1
+    
+    def test_nested_checkout_shares_connection(self):
+        """Test nested checkouts in one thread share the outer connection"""
+        with self.pool.connection() as outer:
+            with self.pool.connection() as inner:
+                assert inner is outer
+        
+        assert self.pool.opened == 1
+    
+    def test_threads_get_their_own_connections(self):
+        """Test concurrent threads are handed different connections"""
+        seen = []
+        barrier = threading.Barrier(2)
+        
+        def worker():
+            with self.pool.connection() as conn:
+                seen.append(conn)
+                barrier.wait()
+        
+        threads = [threading.Thread(target=worker) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        assert seen[0] is not seen[1]
+    
+    def test_pool_size_is_enforced(self):
+        """Test a checkout beyond the pool size times out"""
+        checked_out = threading.Barrier(3)
+        done = threading.Event()
+        
+        def holder():
+            with self.pool.connection():
+                checked_out.wait()
+                done.wait()
+        
+        threads = [threading.Thread(target=holder) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        checked_out.wait()
+        
+        try:
+            with pytest.raises(PoolTimeout):
+                self.pool.acquire()
+        finally:
+            done.set()
+            for thread in threads:
+                thread.join()
+    
+    def test_uncommitted_work_rolled_back_on_release(self):
+        """Test a connection is returned without an open transaction"""
+        with self.pool.connection() as conn:
+            conn.execute("INSERT INTO cakeday VALUES ('John Doe', '01-15', 'y', 14)")
+        
+        with self.pool.connection() as conn:
+            assert not conn.in_transaction
+            assert conn.execute('SELECT COUNT(*) FROM cakeday').fetchone()[0] == 0
+    
+    def test_health_check_replaces_broken_connections(self):
+        """Test health_check reopens idle connections that no longer work"""
+        with self.pool.connection() as conn:
+            pass
+        conn.close()
+        
+        assert self.pool.health_check() == 1
+        with self.pool.connection() as replacement:
+            assert replacement is not conn
+            assert ConnectionPool.is_healthy(replacement)
+        assert (self.pool.opened, self.pool.open) == (2, 1)
+    
+    def test_open_count_drops_on_close(self):
+        """Test open counts live connections while opened only ever grows"""
+        with self.pool.connection():
+            pass
+        self.pool.close()
+        
+        assert (self.pool.opened, self.pool.open) == (1, 0)
+    
+    def test_closed_pool_refuses_checkouts(self):
+        """Test acquire fails once the pool is closed"""
+        self.pool.close()
+        
+        with pytest.raises(PoolTimeout):
+            self.pool.acquire()
+    
+    def test_default_profile_applied(self):
+        """Test new connections use WAL and the tuned pragmas"""
+        with self.pool.connection() as conn:
+            assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+            assert conn.execute('PRAGMA synchronous').fetchone()[0] == 1
+            assert conn.execute('PRAGMA busy_timeout').fetchone()[0] == DEFAULT_PROFILE.busy_timeout
+            assert conn.execute('PRAGMA cache_size').fetchone()[0] == DEFAULT_PROFILE.cache_size
+    
+    def test_no_profile_keeps_sqlite_defaults(self):
+        """Test profile=None leaves the connection as sqlite3 opened it"""
+        memory_pool = ConnectionPool(':memory:', profile=None)
+        with memory_pool.connection() as conn:
+            assert conn.execute('PRAGMA cache_size').fetchone()[0] == -2000
+        memory_pool.close()
+    
+    def test_concurrent_readers_and_writers(self):
+        """Test two pools (as two processes would) can read and write at once without lock errors"""
+        other_pool = ConnectionPool(self.test_db.name, size=2, timeout=1.0)
+        errors = []
+        writing = threading.Event()
+        
+        def writer():
+            try:
+                for i in range(200):
+                    with self.pool.connection() as conn:
+                        conn.execute('INSERT INTO cakeday VALUES (?, ?, ?, ?)', (f"Person {i}", '01-15', 'n', 0))
+                        conn.commit()
+                        writing.set()
+            except Exception as e:
+                errors.append(e)
+        
+        def reader():
+            writing.wait()
+            try:
+                for _ in range(200):
+                    with other_pool.connection() as conn:
+                        conn.execute('SELECT COUNT(*) FROM cakeday').fetchone()
+            except Exception as e:
+                errors.append(e)
+        
+        threads = [threading.Thread(target=writer), threading.Thread(target=reader)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        other_pool.close()
+        
+        assert errors == []
+        with self.pool.connection() as conn:
+            assert conn.execute('SELECT COUNT(*) FROM cakeday').fetchone()[0] == 200
+
+
+class TestRetryOnBusy:
+    """Test cases for retry_on_busy"""
+    
+    def setup_method(self):
+        """Record sleeps instead of waiting"""
+        self.sleeps = []
+    
+    def test_retries_locked_errors(self):
+        """Test a write that hits a lock is retried with growing, jittered waits"""
+        calls = []
+        
+        @retry_on_busy(attempts=4, base_delay=0.1, sleep=self.sleeps.append)
+        def write():
+            calls.append(1)
+            if len(calls) < 3:
+                raise sqlite3.OperationalError('database is locked')
+            return 'done'
+        
+        assert write() == 'done'
+        assert len(calls) == 3
+        assert len(self.sleeps) == 2
+        assert 0 <= self.sleeps[0] <= 0.1
+        assert 0 <= self.sleeps[1] <= 0.2
+    
+    def test_gives_up_after_attempts(self):
+        """Test the last lock error is raised once attempts run out"""
+        @retry_on_busy(attempts=3, sleep=self.sleeps.append)
+        def write():
+            raise sqlite3.OperationalError('database is locked')
+        
+        with pytest.raises(sqlite3.OperationalError):
+            write()
+        assert len(self.sleeps) == 2
+    
+    def test_other_errors_not_retried(self):
+        """Test errors unrelated to locking are raised at once"""
+        @retry_on_busy(sleep=self.sleeps.append)
+        def write():
+            raise sqlite3.OperationalError('no such table: cakeday')
+        
+        with pytest.raises(sqlite3.OperationalError):
+            write()
+        assert self.sleeps == []
+    
+    def test_busy_snapshot_retried(self):
+        """Test a real SQLITE_BUSY from a stale WAL read transaction is recognised and retried"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'cakeday.db')
+            pool = ConnectionPool(path)
+            other = sqlite3.connect(path, isolation_level=None)
+            with pool.connection() as conn:
+                conn.execute('CREATE TABLE t (x INTEGER)')
+                conn.commit()
+            attempts = []
+            
+            @retry_on_busy(sleep=self.sleeps.append)
+            def write():
+                with pool.connection() as conn:
+                    attempts.append(1)
+                    conn.execute('BEGIN')
+                    conn.execute('SELECT COUNT(*) FROM t').fetchone()
+                    if len(attempts) == 1:
+                        # Another writer commits after our snapshot was taken
+                        other.execute('INSERT INTO t VALUES (1)')
+                    conn.execute('INSERT INTO t VALUES (2)')
+                    conn.commit()
+            
+            write()
+            other.close()
+            pool.close()
+        
+        assert len(attempts) == 2
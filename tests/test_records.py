@@ -0,0 +1,109 @@
+import pytest
+import sys
+import os
+import pickle
+import sqlite3
+
+# Add the src directory to the path to import records
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'cakeday'))
+
+from records import Birthday, BirthdayList, birthday_factory, parse_month_day
+
+
+ROWS = [('Jane Smith', '06-30', 'n', 0), ('John Doe', '01-15', 'y', 14), ('Jim Beam', '01-15', 'y', 14)]
+
+
+class TestBirthday:
+    """Test cases for the slotted birthday record"""
+
+    def test_parses_month_and_day(self):
+        """Test the birthday string is parsed once into integers"""
+        record = Birthday('John Doe', '01-15', 'y', 14)
+        assert (record.month, record.day, record.month_day) == (1, 15, 115)
+        assert record.notify
+
+    def test_malformed_birthday(self):
+        """Test a malformed birthday leaves month and day unset"""
+        assert parse_month_day('xx-15') == (None, None)
+        assert Birthday('John Doe', None, 'n', 0).month_day is None
+
+    def test_behaves_as_tuple(self):
+        """Test a record unpacks, indexes, hashes and compares like its tuple"""
+        record = Birthday(*ROWS[1])
+        name, birthday, notification, adv_days = record
+        assert (name, birthday, notification, adv_days) == ROWS[1]
+        assert record == ROWS[1] and record[0] == 'John Doe' and record[-1] == 14
+        assert hash(record) == hash(ROWS[1])
+        assert Birthday(*ROWS[0]) < record
+
+    def test_no_instance_dict(self):
+        """Test records carry no per-instance __dict__"""
+        with pytest.raises(AttributeError):
+            Birthday(*ROWS[0]).extra = 1
+
+    def test_read_only(self):
+        """Test fields cannot be changed, so cached records are safe to share"""
+        record = Birthday(*ROWS[1])
+        with pytest.raises(AttributeError, match="read-only"):
+            record.name = 'Someone Else'
+        with pytest.raises(AttributeError, match="read-only"):
+            del record.month
+        assert record == ROWS[1] and record.month == 1
+
+    def test_stored_month_and_day(self):
+        """Test rows carrying month and day are used as given rather than re-parsed"""
+        conn = sqlite3.connect(':memory:')
+        conn.row_factory = birthday_factory
+        record = conn.execute("SELECT 'John Doe', '01-15', 'y', 14, 1, 15").fetchone()
+        conn.close()
+        assert record == ROWS[1] and (record.month, record.day) == (1, 15)
+        assert Birthday('Leap', '02-29', 'n', 0, 3, 1).month_day == 301
+
+    def test_pickles(self):
+        """Test records survive a round trip to worker processes"""
+        record = pickle.loads(pickle.dumps(Birthday(*ROWS[1])))
+        assert record == ROWS[1] and record.month == 1
+
+    def test_row_factory(self):
+        """Test sqlite3 builds records through the row factory"""
+        conn = sqlite3.connect(':memory:')
+        conn.row_factory = birthday_factory
+        record = conn.execute("SELECT 'John Doe', '01-15', 'y', 14").fetchone()
+        conn.close()
+        assert isinstance(record, Birthday)
+        assert record == ROWS[1] and record.day == 15
+
+
+class TestBirthdayList:
+    """Test cases for the columnar record collection"""
+
+    def test_sequence(self):
+        """Test the list indexes, slices and iterates as records"""
+        records = BirthdayList(ROWS)
+        assert len(records) == 3
+        assert records == ROWS
+        assert records[-1] == ROWS[2] and isinstance(records[0], Birthday)
+        assert records[1:] == ROWS[1:]
+        with pytest.raises(IndexError):
+            records[3]
+
+    def test_distinct_values_stored_once(self):
+        """Test repeated birthdays share one value and one parse"""
+        records = BirthdayList(ROWS)
+        assert records._birthdays.values == ['06-30', '01-15']
+        assert records._parsed == [(6, 30), (1, 15)]
+        assert (records[2].month, records[2].day) == (1, 15)
+
+    def test_stored_month_and_day(self):
+        """Test six-column rows supply month and day without parsing the birthday"""
+        records = BirthdayList([('Jane Smith', 'stored', 'n', 0, 6, 30), Birthday('John Doe', '01-15', 'y', 14)])
+        assert records._parsed == [(6, 30), (1, 15)]
+        assert records[0] == ('Jane Smith', 'stored', 'n', 0) and records[0].month_day == 630
+
+    def test_copy_is_independent(self):
+        """Test appending to a copy leaves the original alone"""
+        records = BirthdayList(ROWS)
+        copy = records.copy()
+        copy.append(('Zed', '12-31', 'n', 0))
+        assert len(records) == 3 and len(copy) == 4
+        assert copy[3].month_day == 1231
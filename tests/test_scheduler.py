@@ -0,0 +1,144 @@
+import sys
+import os
+import smtplib
+import threading
+from datetime import datetime, time, timezone
+from zoneinfo import ZoneInfo
+
+# Add the src directory to the path to import scheduler
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'cakeday'))
+
+import notifications
+import operations
+import scheduler
+from tests.test_notifications import SETTINGS, FakeSMTP, NotificationDatabaseTest
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=timezone.utc).timestamp()
+
+
+class TestNextNotice:
+    """Test cases for computing notice instants"""
+
+    def test_notice_in_recipient_zone(self):
+        """Test a notice is due at the send time on the recipient's local notice date"""
+        assert scheduler.next_notice(7, 25, 10, ZoneInfo('Asia/Tokyo'), datetime(2024, 7, 1)) == (
+            utc(2024, 7, 15, 0), datetime(2024, 7, 25))
+        assert scheduler.next_notice(1, 5, 21, ZoneInfo('UTC'), datetime(2024, 12, 16)) == (
+            utc(2025, 12, 15, 9), datetime(2026, 1, 5))
+
+    def test_send_time_in_dst_gap(self):
+        """Test a send time the clocks skip falls an hour later"""
+        assert scheduler.notice_instant(datetime(2024, 3, 10), ZoneInfo('America/New_York'), time(2, 30)) == \
+            utc(2024, 3, 10, 7, 30)
+
+    def test_local_today(self):
+        """Test the recipient's date can differ from UTC's"""
+        now = utc(2024, 7, 14, 20)
+        assert scheduler.local_today(now, ZoneInfo('Asia/Tokyo')) == datetime(2024, 7, 15)
+        assert scheduler.local_today(now, ZoneInfo('UTC')) == datetime(2024, 7, 14)
+
+
+class TestScheduler(NotificationDatabaseTest):
+    """Test cases for the notice_at index and NotificationScheduler"""
+
+    def make(self, when, **options):
+        self.now = [when]
+        return scheduler.NotificationScheduler(SETTINGS, default_zone='UTC', pool_size=1, smtp_factory=FakeSMTP,
+                                               clock=lambda: self.now[0], **options)
+
+    def sent_names(self):
+        return sorted(message['Subject'].split(': ')[1].split(' ')[0]
+                      for smtp in FakeSMTP.connections for message in smtp.sent)
+
+    def test_refresh_fills_index(self):
+        """Test every opted-in record is scheduled once and later refreshes have nothing to do"""
+        assert scheduler.refresh_schedule(utc(2024, 7, 14, 12), default_zone=ZoneInfo('UTC')) == 6
+
+        assert [(entry.name, entry.notice_at) for entry in scheduler.get_schedule(3)] == [
+            ('Alice', utc(2024, 7, 15, 9)), ('Bob', utc(2024, 7, 15, 9)), ('Carol', utc(2024, 7, 15, 9))]
+        assert scheduler.refresh_schedule(utc(2024, 7, 14, 12)) == 0
+
+    def test_unchanged_write_keeps_schedule(self):
+        """Test rewriting a record with the values it already has keeps its computed notice"""
+        scheduler.refresh_schedule(utc(2024, 7, 14, 12), default_zone=ZoneInfo('UTC'))
+        with operations.get_db_connection() as conn:
+            conn.execute("UPDATE cakeday SET adv_days = adv_days, notification = notification")
+            conn.commit()
+        
+        assert scheduler.refresh_schedule(utc(2024, 7, 14, 12)) == 0
+        assert [entry.name for entry in scheduler.get_schedule(3)] == ['Alice', 'Bob', 'Carol']
+    
+    def test_sends_when_due_in_each_zone(self):
+        """Test each notice goes out at 09:00 in its recipient's zone and moves to next year"""
+        assert operations.set_timezones(('Bob', 'Asia/Tokyo')).succeeded == ['Bob']
+        sched = self.make(utc(2024, 7, 15, 1))
+
+        assert sched.run_once().sent == 1
+        assert self.sent_names() == ['Bob']
+        assert sched.next_wakeup() == utc(2024, 7, 15, 9)
+
+        self.now[0] = utc(2024, 7, 15, 9)
+        assert sched.run_once().sent == 2
+        assert sched.run_once().sent == 0
+        assert self.sent_names() == ['Alice', 'Bob', 'Carol']
+        bob = [entry for entry in scheduler.get_schedule(10) if entry.name == 'Bob'][0]
+        assert (bob.notice_at, bob.birthday_date) == (utc(2025, 7, 15, 0), '2025-07-15')
+
+    def test_writes_reschedule(self):
+        """Test records changed or deleted after the heap was loaded follow the table"""
+        sched = self.make(utc(2024, 7, 14, 12))
+        sched.run_once()
+        operations.update_birthdays({'name': 'Alice', 'adv_days': 9})
+        operations.delete_birthdays('Carol')
+
+        self.now[0] = utc(2024, 7, 15, 9)
+        assert sched.run_once().sent == 1
+        self.now[0] = utc(2024, 7, 16, 9)
+        assert sched.run_once().sent == 2
+        assert self.sent_names() == ['Alice', 'Bob', 'Eve']
+
+    def test_failed_send_retried(self):
+        """Test a failed notice is released and sent again after retry_delay"""
+        FakeSMTP.failures = [smtplib.SMTPRecipientsRefused({})]
+        sched = self.make(utc(2024, 12, 15, 9), retry_delay=60)
+
+        result = sched.run_once()
+        assert (result.sent, [name for name, _ in result.failed]) == (0, ['NewYear'])
+        assert sched.next_wakeup() == utc(2024, 12, 15, 9, 1)
+
+        self.now[0] = utc(2024, 12, 15, 9, 1)
+        assert sched.run_once().sent == 1
+
+    def test_shares_ledger_with_dispatch(self):
+        """Test reminders dispatch() already sent are skipped, and missed birthdays are not sent late"""
+        notifications.dispatch(datetime(2024, 7, 15), SETTINGS, pool_size=1, smtp_factory=FakeSMTP)
+        FakeSMTP.connections = []
+        sched = self.make(utc(2024, 7, 15, 9))
+
+        result = sched.run_once()
+        assert (result.sent, result.skipped) == (0, 3)
+
+        # Eve's notice opened 07-16 for a birthday on 07-26
+        self.now[0] = utc(2024, 7, 27, 12)
+        result = sched.run_once()
+        assert (result.sent, result.skipped) == (0, 1)
+        assert FakeSMTP.connections == []
+
+    def test_run_until_stopped(self):
+        """Test run() sleeps between passes and returns once stopped"""
+        sched = self.make(utc(2024, 7, 14, 12), max_sleep=0.01)
+        thread = threading.Thread(target=sched.run)
+        thread.start()
+        sched.stop()
+        thread.join(timeout=5)
+
+        assert not thread.is_alive()
+
+    def test_set_timezones_validates(self):
+        """Test unknown zones and names are rejected and None restores the default zone"""
+        result = operations.set_timezones({'Alice': 'Mars/Olympus', 'Nobody': 'UTC', 'Bob': None})
+
+        assert result.succeeded == ['Bob']
+        assert result.failed == [('Alice', "Unknown time zone 'Mars/Olympus'"), ('Nobody', "No record found for Nobody")]
@@ -0,0 +1,168 @@
+import pytest
+import sys
+import os
+import json
+import threading
+from http.client import HTTPConnection
+
+# Add the src directory to the path to import server
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'cakeday'))
+
+import operations
+from server import answer, make_server
+
+
+class TestApi:
+    """Test cases for the JSON API routes"""
+    
+    @pytest.fixture(autouse=True)
+    def database(self, pooled_db, tmp_path):
+        """Point the shared pool at a fresh database with two records"""
+        self.db_path = pooled_db
+        operations.configure_shards(str(tmp_path / 'tenants'))
+        operations.add_birthdays([('John Doe', '01-15', 'y', 14), ('Jane Smith', '06-30', 'n', 0)])
+        yield
+        operations.configure_shards()
+    
+    def test_get_records(self):
+        """Test listing, paging and fetching records"""
+        assert answer('GET', '/birthdays') == (200, [
+            {'name': 'Jane Smith', 'birthday': '06-30', 'notification': 'n', 'adv_days': 0},
+            {'name': 'John Doe', 'birthday': '01-15', 'notification': 'y', 'adv_days': 14},
+        ])
+        assert answer('GET', '/birthdays?after=Jane+Smith&limit=5')[1][0]['name'] == 'John Doe'
+        assert answer('GET', '/birthdays/John%20Doe') == (
+            200, {'name': 'John Doe', 'birthday': '01-15', 'notification': 'y', 'adv_days': 14})
+        assert answer('GET', '/birthdays/Nobody') == (404, {'error': "No record found for Nobody"})
+    
+    def test_upcoming_and_search(self):
+        """Test upcoming dates are serialized and search finds names"""
+        status, rows = answer('GET', '/upcoming?days=366')
+        
+        assert status == 200
+        assert {row['name'] for row in rows} == {'John Doe', 'Jane Smith'}
+        assert set(rows[0]) == {'name', 'birthday', 'days_until', 'date'}
+        assert [row['name'] for row in answer('GET', '/search?q=Smith')[1]] == ['Jane Smith']
+        assert answer('GET', '/upcoming?days=soon') == (400, {'error': "days must be an integer"})
+    
+    def test_writes(self):
+        """Test add, update and delete report BatchResult fields"""
+        assert answer('POST', '/birthdays', [{'name': 'Bob Wilson', 'birthday': '03-22'}, ['John Doe', '02-20']]) == (
+            200, {'succeeded': ['Bob Wilson'], 'failed': [{'name': 'John Doe', 'error': "Record for John Doe already exists"}]})
+        assert answer('PATCH', '/birthdays/Bob%20Wilson', {'birthday': '04-01'})[1]['succeeded'] == ['Bob Wilson']
+        assert operations.get_by_name('Bob Wilson')[1] == '04-01'
+        assert answer('DELETE', '/birthdays', ['Bob Wilson', 'Nobody'])[1] == {
+            'succeeded': ['Bob Wilson'], 'failed': [{'name': 'Nobody', 'error': "No record found for Nobody"}]}
+        assert answer('POST', '/birthdays') == (400, {'error': "A JSON request body is required"})
+    
+    @pytest.mark.parametrize('method, path, body', [
+        ('POST', '/birthdays', 5),
+        ('POST', '/birthdays', ['John Doe', '02-20']),
+        ('PATCH', '/birthdays', ['John Doe', 'Jane Smith']),
+        ('PATCH', '/birthdays/John%20Doe', [{'birthday': '02-20'}]),
+        ('DELETE', '/birthdays', {'name': 'John Doe'}),
+        ('DELETE', '/birthdays', [['John Doe']]),
+    ])
+    def test_wrong_body_shape(self, method, path, body):
+        """Test well-formed JSON of the wrong shape is a client error, not a server error"""
+        status, payload = answer(method, path, body)
+        
+        assert status == 400 and payload['error'].startswith("Expected")
+        assert len(operations.get_all()) == 2
+    
+    def test_change_without_name(self):
+        """Test a change whose name is missing or not a string fails on its own"""
+        result = answer('PATCH', '/birthdays', [{'birthday': '02-20'}, {'name': ['John Doe'], 'adv_days': 1}])[1]
+        
+        assert result['succeeded'] == []
+        assert [failure['error'] for failure in result['failed']] == ["Each change needs a name"] * 2
+    
+    def test_batch(self):
+        """Test a batch answers each request in order and independently"""
+        status, responses = answer('POST', '/batch', [
+            {'method': 'POST', 'path': '/birthdays', 'body': {'name': 'Bob Wilson', 'birthday': '03-22'}},
+            {'path': '/birthdays/Bob Wilson'},
+            {'path': '/nowhere'},
+            {'method': 'POST', 'path': '/batch', 'body': []},
+        ])
+        
+        assert status == 200
+        assert [response['status'] for response in responses] == [200, 200, 404, 400]
+        assert responses[1]['body']['birthday'] == '03-22'
+    
+    def test_changes(self):
+        """Test the change feed pages from a cursor and reports expired cursors as 410"""
+        status, page = answer('GET', '/changes?since=1&limit=5')
+        
+        assert status == 200
+        assert page['cursor'] == 2
+        assert [(change['seq'], change['op'], change['name']) for change in page['changes']] == [
+            (2, 'insert', 'Jane Smith')]
+        assert answer('GET', '/changes?since=2') == (200, {'changes': [], 'cursor': 2})
+        
+        from changes import prune_changes
+        prune_changes(2)
+        assert answer('GET', '/changes?since=1')[0] == 410
+    
+    def test_unknown_route(self):
+        """Test unknown paths and methods are 404s"""
+        assert answer('GET', '/nowhere')[0] == 404
+        assert answer('PUT', '/birthdays')[0] == 404
+    
+    def test_server_keep_alive_and_tenants(self):
+        """Test one HTTP/1.1 connection serves several requests, routed by the tenant header"""
+        server = make_server(port=0)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            client = HTTPConnection(*server.server_address[:2], timeout=5)
+            client.request('GET', '/birthdays/John%20Doe')
+            response = client.getresponse()
+            assert response.status == 200
+            assert json.loads(response.read())['adv_days'] == 14
+            sock = client.sock
+            
+            client.request('POST', '/birthdays', body=json.dumps({'name': 'Ann Lee', 'birthday': '05-05'}),
+                           headers={'X-Cakeday-Tenant': 'acme'})
+            response = client.getresponse()
+            assert json.loads(response.read())['succeeded'] == ['Ann Lee']
+            
+            client.request('GET', '/birthdays/Ann%20Lee')
+            response = client.getresponse()
+            assert response.status == 404
+            response.read()
+            
+            client.request('GET', '/birthdays/Ann%20Lee', headers={'X-Cakeday-Tenant': '../etc'})
+            response = client.getresponse()
+            assert response.status == 400
+            assert "Invalid tenant name" in json.loads(response.read())['error']
+            
+            client.request('POST', '/batch', body='not json')
+            response = client.getresponse()
+            assert response.status == 400
+            response.read()
+            assert client.sock is sock
+            client.close()
+        finally:
+            server.shutdown()
+            server.server_close()
+    
+    def test_server_rejects_bad_content_length(self):
+        """Test a negative or non-numeric Content-Length is a 400 that closes the connection"""
+        server = make_server(port=0)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            for length in ('-1', 'abc'):
+                client = HTTPConnection(*server.server_address[:2], timeout=5)
+                client.putrequest('POST', '/batch')
+                client.putheader('Content-Length', length)
+                client.endheaders()
+                response = client.getresponse()
+                assert response.status == 400
+                assert "Content-Length" in json.loads(response.read())['error']
+                assert response.will_close
+                client.close()
+        finally:
+            server.shutdown()
+            server.server_close()
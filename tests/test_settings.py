@@ -0,0 +1,68 @@
+import pytest
+import sys
+import os
+import tempfile
+
+# Add the src directory to the path to import settings
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'cakeday'))
+
+from settings import DEFAULT_CHECKPOINT_INTERVAL, DEFAULT_DATABASE, DEFAULT_SHARD_DIR, find_config, load_settings
+
+
+class TestLoadSettings:
+    """Test cases for resolving the database location"""
+    
+    def setup_method(self):
+        """Write a config file in a temporary directory"""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.config_path = os.path.join(self.tmpdir.name, 'cakeday.ini')
+        with open(self.config_path, 'w') as f:
+            f.write("[database]\npath = data/cakeday.db\nin_memory = yes\ncheckpoint_interval = 60\n")
+    
+    def teardown_method(self):
+        """Clean up the config file"""
+        self.tmpdir.cleanup()
+    
+    def test_defaults(self):
+        """Test the bundled database is used when nothing is configured"""
+        settings = load_settings(environ={}, config_path=None)
+        
+        if find_config({}) is None:
+            assert settings.database == DEFAULT_DATABASE
+            assert settings.shard_dir == DEFAULT_SHARD_DIR
+            assert settings.in_memory is False
+            assert settings.checkpoint_interval == DEFAULT_CHECKPOINT_INTERVAL
+        assert os.path.isabs(DEFAULT_DATABASE)
+    
+    def test_config_file(self):
+        """Test config file paths are relative to the file and values are parsed"""
+        settings = load_settings(environ={'CAKEDAY_CONFIG': self.config_path})
+        
+        assert settings.database == os.path.join(self.tmpdir.name, 'data/cakeday.db')
+        assert settings.shard_dir == DEFAULT_SHARD_DIR
+        assert settings.in_memory is True
+        assert settings.checkpoint_interval == 60.0
+    
+    def test_environment_overrides_config(self):
+        """Test environment variables win over the config file"""
+        environ = {'CAKEDAY_CONFIG': self.config_path, 'CAKEDAY_DB': '/srv/cakeday.db', 'CAKEDAY_IN_MEMORY': 'no'}
+        
+        settings = load_settings(environ=environ)
+        
+        assert settings.database == '/srv/cakeday.db'
+        assert settings.in_memory is False
+        assert settings.checkpoint_interval == 60.0
+    
+    def test_overrides_win(self):
+        """Test explicit overrides (CLI flags) win and None overrides are ignored"""
+        environ = {'CAKEDAY_DB': '/srv/cakeday.db', 'CAKEDAY_SHARD_DIR': '/srv/tenants'}
+        
+        settings = load_settings(environ=environ, config_path=self.config_path, database='/tmp/cli.db', shard_dir=None)
+        
+        assert settings.database == '/tmp/cli.db'
+        assert settings.shard_dir == '/srv/tenants'
+    
+    def test_invalid_checkpoint_interval(self):
+        """Test a non-numeric checkpoint interval is reported"""
+        with pytest.raises(ValueError, match="checkpoint_interval"):
+            load_settings(environ={'CAKEDAY_CHECKPOINT_INTERVAL': 'often'}, config_path=self.config_path)
@@ -0,0 +1,116 @@
+import pytest
+import sys
+import os
+import tempfile
+import threading
+from datetime import datetime
+from unittest.mock import patch
+
+# Add the src directory to the path to import operations
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'cakeday'))
+
+import operations
+from operations import use_tenant
+
+
+class TestTenantShards:
+    """Test cases for routing operations to per-tenant shard files"""
+    
+    def setup_method(self):
+        """Point tenant shards at a temporary directory"""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.shard_dir = os.path.join(self.tmpdir.name, 'tenants')
+        operations.configure_shards(self.shard_dir)
+    
+    def teardown_method(self):
+        """Clean up shards"""
+        operations.disable_cache()
+        operations.disable_calendar_index()
+        operations.close_pool()
+        operations.configure_shards()
+        self.tmpdir.cleanup()
+    
+    def test_shard_created_on_first_use(self):
+        """Test a tenant's shard file is created from the schema when first used"""
+        with use_tenant('acme'):
+            assert operations.current_tenant() == 'acme'
+            assert operations.get_all() == []
+        
+        assert os.path.exists(os.path.join(self.shard_dir, 'acme.db'))
+        assert operations.current_tenant() is None
+        assert operations.list_tenants() == ['acme']
+    
+    def test_default_database_keeps_configured_shards(self):
+        """Test the first use of the default database does not repoint or close the shards"""
+        with use_tenant('acme'):
+            operations.add_birthdays(('John Doe', '01-15', 'y', 3))
+            pool = operations.get_pool()
+        
+        operations.apply_settings(operations.get_settings())
+        
+        assert operations.shard_dir() == self.shard_dir
+        with use_tenant('acme'):
+            assert operations.get_pool() is pool
+            assert operations.get_by_name('John Doe') == ('John Doe', '01-15', 'y', 3)
+    
+    def test_tenants_have_separate_namespaces(self):
+        """Test the same name can exist in two tenants with different data"""
+        with use_tenant('acme'):
+            assert operations.add_birthdays(('John Doe', '01-15', 'y', 3)).failed == []
+        with use_tenant('globex'):
+            assert operations.add_birthdays(('John Doe', '06-30', 'n', 0)).failed == []
+        
+        with use_tenant('acme'):
+            assert operations.get_by_name('John Doe') == ('John Doe', '01-15', 'y', 3)
+        with use_tenant('globex'):
+            assert operations.get_by_name('John Doe') == ('John Doe', '06-30', 'n', 0)
+    
+    def test_cache_is_per_tenant(self):
+        """Test cached reads and invalidation never cross tenants"""
+        operations.enable_cache()
+        with use_tenant('acme'):
+            operations.add_birthdays(('John Doe', '01-15', 'y', 3))
+            operations.get_by_name('John Doe')
+        with use_tenant('globex'):
+            assert operations.get_by_name('John Doe') is None
+            operations.add_birthdays(('John Doe', '06-30', 'n', 0))
+            assert operations.get_by_name('John Doe') == ('John Doe', '06-30', 'n', 0)
+        with use_tenant('acme'):
+            assert operations.get_by_name('John Doe') == ('John Doe', '01-15', 'y', 3)
+    
+    def test_invalid_tenant_rejected(self):
+        """Test tenant names cannot escape the shard directory"""
+        with pytest.raises(ValueError):
+            with use_tenant('../etc'):
+                pass
+    
+    def test_threads_route_independently(self):
+        """Test concurrent threads each write to their own tenant"""
+        def writer(tenant):
+            with use_tenant(tenant):
+                operations.add_birthdays([(f"{tenant} {i}", '03-03', 'n', 0) for i in range(20)])
+        
+        threads = [threading.Thread(target=writer, args=(tenant,)) for tenant in ('a', 'b', 'c')]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        counts = operations.for_each_tenant(lambda: len(operations.get_all()))
+        assert counts == {'a': 20, 'b': 20, 'c': 20}
+    
+    def test_upcoming_fan_out_merge(self):
+        """Test upcoming birthdays from every tenant are merged by days until, then name"""
+        with use_tenant('acme'):
+            operations.add_birthdays([('Zed', '07-16', 'n', 0), ('Amy', '07-20', 'n', 0)])
+        with use_tenant('globex'):
+            operations.add_birthdays([('Bob', '07-16', 'n', 0), ('Amy', '07-18', 'n', 0)])
+        
+        with patch('operations.datetime') as mock_datetime:
+            mock_datetime.now.return_value = datetime(2024, 7, 15)
+            mock_datetime.side_effect = lambda *args, **kwargs: datetime(*args, **kwargs)
+            merged = operations.get_upcoming_birthdays_for_tenants(10)
+        
+        assert [(tenant, name, days) for tenant, name, _, days, _ in merged] == [
+            ('globex', 'Bob', 1), ('acme', 'Zed', 1), ('globex', 'Amy', 3), ('acme', 'Amy', 5),
+        ]
@@ -0,0 +1,104 @@
+import pytest
+import sys
+import os
+from datetime import datetime
+from unittest.mock import patch
+
+# Add the src directory to the path to import upcoming
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'cakeday'))
+
+import operations
+import upcoming
+from upcoming import NEVER, UpcomingEngine, days_until_table
+from tests.test_operations import RealDatabase
+
+
+RECORDS = [
+    ('Alice', '01-02', 'n', 0),
+    ('Bob', '12-31', 'n', 0),
+    ('Carol', '02-29', 'n', 0),
+    ('Dave', '12-31', 'n', 0),
+    ('Eve', '07-04', 'n', 0),
+    ('Zed', '01-02', 'n', 0),
+]
+
+
+class TestDaysUntilTable:
+    """Test cases for days_until_table"""
+    
+    def test_wraps_into_next_year(self):
+        """Test dates already passed this year count to next year's occurrence"""
+        table = days_until_table(datetime(2023, 12, 30))
+        
+        assert table[1230] == 0
+        assert table[1231] == 1
+        assert table[101] == 2
+        assert table[1229] == 365
+    
+    def test_leap_day(self):
+        """Test Feb 29 falls on Feb 28 in non-leap years and invalid dates never occur"""
+        assert days_until_table(datetime(2023, 2, 27))[229] == 1
+        assert days_until_table(datetime(2024, 2, 27))[229] == 2
+        assert days_until_table(datetime(2024, 1, 1))[230] == NEVER
+        assert days_until_table(datetime(2024, 1, 1))[0] == NEVER
+
+
+class TestUpcomingEngineArray(RealDatabase):
+    """Test cases for UpcomingEngine using the array fallback"""
+    
+    use_numpy = False
+    
+    @pytest.fixture(autouse=True)
+    def records(self, database):
+        """Load sample records into the engine"""
+        operations.add_birthdays(RECORDS)
+        self.engine = UpcomingEngine.load(use_numpy=self.use_numpy)
+    
+    def test_window_across_new_year(self):
+        """Test rows are sorted by days until, then name, across the year end"""
+        result = self.engine.upcoming(3, start=datetime(2023, 12, 31))
+        
+        assert result == [
+            ('Bob', '12-31', 0, datetime(2023, 12, 31)),
+            ('Dave', '12-31', 0, datetime(2023, 12, 31)),
+            ('Alice', '01-02', 2, datetime(2024, 1, 2)),
+            ('Zed', '01-02', 2, datetime(2024, 1, 2)),
+        ]
+    
+    def test_limit(self):
+        """Test limit returns only the soonest rows"""
+        result = self.engine.upcoming(365, start=datetime(2023, 12, 31), limit=3)
+        
+        assert [row[0] for row in result] == ['Bob', 'Dave', 'Alice']
+        assert self.engine.upcoming(365, start=datetime(2023, 12, 31), limit=0) == []
+    
+    def test_leap_day_in_non_leap_year(self):
+        """Test a Feb 29 birthday is due on Feb 28 in a non-leap year"""
+        result = self.engine.upcoming(1, start=datetime(2023, 2, 27))
+        
+        assert result == [('Carol', '02-29', 1, datetime(2023, 2, 28))]
+    
+    @pytest.mark.parametrize('start', [datetime(2023, 12, 20), datetime(2024, 2, 27), datetime(2023, 2, 28),
+                                       datetime(2024, 7, 4)])
+    @pytest.mark.parametrize('days_ahead', [0, 1, 30, 365])
+    def test_matches_get_upcoming_birthdays(self, start, days_ahead):
+        """Test the engine returns exactly what the SQL path returns"""
+        with patch('operations.datetime') as mock_datetime:
+            mock_datetime.now.return_value = start
+            mock_datetime.side_effect = lambda *args, **kwargs: datetime(*args, **kwargs)
+            expected = operations.get_upcoming_birthdays(days_ahead)
+        
+        assert self.engine.upcoming(days_ahead, start=start) == expected
+    
+    def test_empty_database(self):
+        """Test an empty table gives no results"""
+        operations.delete_birthdays([record[0] for record in RECORDS])
+        
+        assert UpcomingEngine.load(use_numpy=self.use_numpy).upcoming(365) == []
+
+
+@pytest.mark.skipif(upcoming.np is None, reason="NumPy is not installed")
+class TestUpcomingEngineNumpy(TestUpcomingEngineArray):
+    """Test cases for UpcomingEngine using NumPy"""
+    
+    use_numpy = True